@@ -1,5 +1,6 @@
 from models.chat import ChatMessage
 from .state import (
+    ModerationResult,
     ModerationState,
     PIIResult,
     ContentResult,
@@ -13,6 +14,7 @@ from .nodes import StartModeration
 
 __all__ = [
     "ChatMessage",
+    "ModerationResult",
     "ModerationState",
     "PIIResult",
     "ContentResult",
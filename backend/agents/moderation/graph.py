@@ -1,6 +1,11 @@
+import logging
 from pydantic_graph import Graph
 from typing import Optional
 
+from utils.graph_state import RunInProgress, register_graph, run_persisted
+from utils.idempotency import request_fingerprint
+from utils.logs import get_debug_logger
+from utils.metrics import record_fallback, current_trace_id
 from .state import ChatMessage, ModerationState, ModAction, ActionType
 from .nodes import (
     StartModeration,
@@ -14,20 +19,45 @@ from .nodes import (
 moderation_graph = Graph(
     nodes=[StartModeration, DetectPII, CheckIntent, ModerateContent, DetermineAction],
     state_type=ModerationState,
+    run_end_type=str,
 )
+register_graph("moderation", moderation_graph)
+
+logger = logging.getLogger(__name__)
+debug_logger = get_debug_logger(__name__)
 
 
 # ---------- Main Function ----------
-async def moderate_message(message: ChatMessage) -> ModerationState:
-    """Main function to moderate a chat message"""
-    state = ModerationState(message=message)
+async def moderate_message(
+    message: ChatMessage, trace_id: Optional[str] = None, local_only: bool = False, replay: bool = False
+) -> ModerationState:
+    """
+    Main function to moderate a chat message; local_only skips every remote call
+
+    replay marks a backfill of stored history: the verdict depends on the text alone,
+    without the player's recent-message window, and the run isn't snapshotted, so the
+    live server's resume worker never picks it up.
+    """
+    state = ModerationState(
+        message=message, trace_id=trace_id or current_trace_id(), local_only=local_only, replay=replay
+    )
 
     try:
-        result = await moderation_graph.run(StartModeration(), state=state)
-        print(f"Graph execution completed: {result}")
+        # Snapshots after every node let a retry resume where a failed run stopped;
+        # local-only runs make no paid calls, so they aren't worth snapshotting. Backfill
+        # replays stay out of the store the resume worker finishes from.
+        state = await run_persisted(
+            moderation_graph, StartModeration(), state, "moderation",
+            None if local_only or replay else message.message_id,
+            request_fingerprint(message.message, message.player_id), state.trace_id
+        )
+        debug_logger.debug("Graph execution completed for %s: %s", message.message_id, state.recommended_action)
         return state  # Return the full state, not just recommended_action
+    except RunInProgress:
+        raise  # answered with a 409; a fallback would be stored over the live result
     except Exception as e:
-        print(f"Moderation error: {e}")
+        logger.error(f"Moderation error: {str(e)}")
+        record_fallback("moderation_graph")
         # Return a state with fallback action
         state.recommended_action = ModAction(
             action=ActionType.WARNING,
@@ -1,12 +1,15 @@
 from dataclasses import dataclass
-from pydantic_ai import Agent
+from functools import cache
 from pydantic_graph import BaseNode, GraphRunContext, End
-from typing import Union
-import requests
+from typing import TYPE_CHECKING, Dict, List, Union
 import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
+from utils.metrics import track_dependency, record_fallback
+from utils.pii_window import pii_window
+from utils.usage import budget_governor, record_gemini_usage, record_hf_usage
 from .state import (
     ModerationState,
     PIIResult,
@@ -17,6 +20,11 @@ from .state import (
     ActionType,
 )
 
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
 
@@ -37,6 +45,9 @@ API_TIMEOUT = 30
 DEFAULT_PII_RESPONSE = []
 DEFAULT_CONTENT_RESPONSE = [{"label": "OK", "score": 1.0}]
 
+# Order of the probability vector stored in messages.content_probs
+CONTENT_LABELS = tuple(content_type.value for content_type in ContentType)
+
 # Agent Prompts
 PII_INTENT_PROMPT = "Analyze if the message contains intent to share personal information. Return only true or false."
 MODERATION_ACTION_PROMPT = (
@@ -44,39 +55,56 @@ MODERATION_ACTION_PROMPT = (
 )
 
 
+# ---------- Probability Vectors ----------
+def content_probabilities(categories: Dict[str, float]) -> List[float]:
+    """Flatten ContentResult.categories into a CONTENT_LABELS ordered vector"""
+    return [float(categories.get(label, 0.0)) for label in CONTENT_LABELS]
+
+
 # ---------- API Functions ----------
 async def detect_pii(text: str):
+    import requests
+
     def sync_query():
         try:
-            response = requests.post(
-                PII_DETECTION_API_URL,
-                headers={"Authorization": f"Bearer {HF_TOKEN}"},
-                json={"inputs": text},
-                timeout=API_TIMEOUT,
-            )
-            response.raise_for_status()
-            return response.json()
+            with track_dependency("huggingface", "pii_detection"):
+                response = requests.post(
+                    PII_DETECTION_API_URL,
+                    headers={"Authorization": f"Bearer {HF_TOKEN}"},
+                    json={"inputs": text},
+                    timeout=API_TIMEOUT,
+                )
+                response.raise_for_status()
+                record_hf_usage("DetectPII", response)
+                return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"PII detection API error: {e}")
+            logger.warning(f"PII detection API error: {e}")
+            record_hf_usage("DetectPII")
+            record_fallback("pii_detection")
             return DEFAULT_PII_RESPONSE
         except ValueError as e:
-            print(f"PII detection JSON parsing error: {e}")
+            logger.warning(f"PII detection JSON parsing error: {e}")
+            record_fallback("pii_detection")
             return DEFAULT_PII_RESPONSE
 
-    return await asyncio.get_event_loop().run_in_executor(None, sync_query)
+    return await asyncio.to_thread(sync_query)
 
 
 async def moderate_content(text: str):
+    import requests
+
     def sync_query():
         try:
-            response = requests.post(
-                CONTENT_MODERATION_API_URL,
-                headers={"Authorization": f"Bearer {HF_TOKEN}"},
-                json={"inputs": text},
-                timeout=API_TIMEOUT,
-            )
-            response.raise_for_status()
-            result = response.json()
+            with track_dependency("huggingface", "content_moderation"):
+                response = requests.post(
+                    CONTENT_MODERATION_API_URL,
+                    headers={"Authorization": f"Bearer {HF_TOKEN}"},
+                    json={"inputs": text},
+                    timeout=API_TIMEOUT,
+                )
+                response.raise_for_status()
+                record_hf_usage("ModerateContent", response)
+                result = response.json()
 
             if isinstance(result, list) and len(result) > 0:
                 if isinstance(result[0], list):
@@ -88,21 +116,34 @@ async def moderate_content(text: str):
                 return DEFAULT_CONTENT_RESPONSE
 
         except requests.exceptions.RequestException as e:
-            print(f"Content moderation API error: {e}")
+            logger.warning(f"Content moderation API error: {e}")
+            record_hf_usage("ModerateContent")
+            record_fallback("content_moderation")
             return DEFAULT_CONTENT_RESPONSE
         except ValueError as e:
-            print(f"Content moderation JSON parsing error: {e}")
+            logger.warning(f"Content moderation JSON parsing error: {e}")
+            record_fallback("content_moderation")
             return DEFAULT_CONTENT_RESPONSE
 
-    return await asyncio.get_event_loop().run_in_executor(None, sync_query)
+    return await asyncio.to_thread(sync_query)
 
 
 # ---------- AI Agents ----------
-PIIAgent = Agent(GEMINI_MODEL, system_prompt=PII_INTENT_PROMPT, output_type=bool)
+# Built on first use so importing this module stays cheap on cold starts
+@cache
+def get_pii_agent() -> "Agent":
+    from pydantic_ai import Agent
 
-ModAgent = Agent(
-    GEMINI_MODEL, system_prompt=MODERATION_ACTION_PROMPT, output_type=ModAction
-)
+    return Agent(GEMINI_MODEL, system_prompt=PII_INTENT_PROMPT, output_type=bool)
+
+
+@cache
+def get_mod_agent() -> "Agent":
+    from pydantic_ai import Agent
+
+    return Agent(
+        GEMINI_MODEL, system_prompt=MODERATION_ACTION_PROMPT, output_type=ModAction
+    )
 
 
 # ---------- Forward Declarations ----------
@@ -132,7 +173,17 @@ class StartModeration(BaseNode[ModerationState]):
 @dataclass
 class DetectPII(BaseNode[ModerationState]):
     async def run(self, ctx: GraphRunContext) -> Union[CheckIntent, End]:
-        pii_data = await detect_pii(ctx.state.message.message)
+        message = ctx.state.message
+        # Local and cheap, so it runs for every live message to keep the player's window
+        # complete. Replayed history arrives out of order and hours apart, so it stays out.
+        split_pii = None
+        if not ctx.state.replay:
+            split_pii = pii_window.check(message.player_id, message.message_id, message.message)
+
+        if ctx.state.local_only:
+            pii_data = DEFAULT_PII_RESPONSE
+        else:
+            pii_data = await detect_pii(message.message)
 
         if not isinstance(pii_data, list):
             pii_data = []
@@ -153,13 +204,16 @@ class DetectPII(BaseNode[ModerationState]):
                     pii_type = PIIType(entity["entity_group"])
                     break
 
+        reason = f"Detected {pii_type.value if pii_type else 'PII'} in message"
+        if not pii_presence and split_pii:
+            # Completes a number, email or address begun in the player's earlier messages
+            pii_presence, pii_type = True, PIIType(split_pii)
+            reason = f"Detected {pii_type.value} split across messages"
+
         ctx.state.pii_result = PIIResult(pii_presence=pii_presence, pii_type=pii_type)
 
         if pii_presence:
-            ctx.state.recommended_action = ModAction(
-                action=ActionType.DELETE_MESSAGE,
-                reason=f"Detected {pii_type.value if pii_type else 'PII'} in message",
-            )
+            ctx.state.recommended_action = ModAction(action=ActionType.DELETE_MESSAGE, reason=reason)
             return End("PII detected - message blocked")
 
         return CheckIntent()
@@ -174,8 +228,19 @@ class CheckIntent(BaseNode[ModerationState]):
             keyword in message_lower for keyword in ["email", "e-mail", "contact", "reach"]
         )
         
+        if ctx.state.local_only:
+            # No content model either, so the local heuristic is the whole verdict
+            next_node = self._apply_fallback_intent(ctx, simple_email_detected)
+            return next_node if isinstance(next_node, End) else End("Local-only analysis - content not checked")
+
+        if not budget_governor.allows("pii_intent"):
+            record_fallback("pii_intent_budget")
+            return self._apply_fallback_intent(ctx, simple_email_detected)
+        
         try:
-            result = await PIIAgent.run(ctx.state.message.message)
+            with track_dependency("gemini", "pii_intent"):
+                result = await get_pii_agent().run(ctx.state.message.message)
+            record_gemini_usage("CheckIntent", result)
             intent = result.output if hasattr(result, "output") else result
 
             if ctx.state.pii_result:
@@ -191,22 +256,28 @@ class CheckIntent(BaseNode[ModerationState]):
                 return End("PII intent detected - message blocked")
 
         except Exception as e:
-            print(f"Intent analysis error: {e}")
+            logger.warning(f"Intent analysis error: {e}")
+            record_gemini_usage("CheckIntent")
+            record_fallback("pii_intent")
             # Use simple email detection as fallback
-            intent_fallback = simple_email_detected
-            
-            if ctx.state.pii_result:
-                ctx.state.pii_result.pii_intent = intent_fallback
-            else:
-                ctx.state.pii_result = PIIResult(pii_presence=False, pii_intent=intent_fallback)
-            
-            # If fallback detected email intent, still recommend deletion
-            if intent_fallback:
-                ctx.state.recommended_action = ModAction(
-                    action=ActionType.DELETE_MESSAGE,
-                    reason="Email sharing detected (fallback detection)",
-                )
-                return End("PII intent detected via fallback - message blocked")
+            return self._apply_fallback_intent(ctx, simple_email_detected)
+
+        return ModerateContent()
+
+    @staticmethod
+    def _apply_fallback_intent(ctx: GraphRunContext, intent_fallback: bool) -> Union[ModerateContent, End]:
+        if ctx.state.pii_result:
+            ctx.state.pii_result.pii_intent = intent_fallback
+        else:
+            ctx.state.pii_result = PIIResult(pii_presence=False, pii_intent=intent_fallback)
+        
+        # If fallback detected email intent, still recommend deletion
+        if intent_fallback:
+            ctx.state.recommended_action = ModAction(
+                action=ActionType.DELETE_MESSAGE,
+                reason="Email sharing detected (fallback detection)",
+            )
+            return End("PII intent detected via fallback - message blocked")
 
         return ModerateContent()
 
@@ -225,7 +296,7 @@ class ModerateContent(BaseNode[ModerationState]):
         try:
             main_category = ContentType(main_category_str)
         except ValueError:
-            print(f"Unknown category: {main_category_str}, defaulting to OK")
+            logger.warning(f"Unknown category: {main_category_str}, defaulting to OK")
             main_category = ContentType.OK
 
         categories = {
@@ -247,13 +318,17 @@ class DetermineAction(BaseNode[ModerationState]):
     async def run(self, ctx: GraphRunContext) -> End:
         try:
             prompt = f"Content type: {ctx.state.content_result.main_category.value}, Message: {ctx.state.message.message}"
-            result = await ModAgent.run(prompt)
+            with track_dependency("gemini", "moderation_action"):
+                result = await get_mod_agent().run(prompt)
+            record_gemini_usage("DetermineAction", result)
             action = result.output if hasattr(result, "output") else result
             ctx.state.recommended_action = action
             return End(f"Action determined: {action.action.value}")
 
         except Exception as e:
-            print(f"Action determination error: {e}")
+            logger.warning(f"Action determination error: {e}")
+            record_gemini_usage("DetermineAction")
+            record_fallback("moderation_action")
             ctx.state.recommended_action = ModAction(
                 action=ActionType.WARNING,
                 reason="Automated moderation - manual review required",
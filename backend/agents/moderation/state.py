@@ -64,8 +64,15 @@ class ModAction(BaseModel):
     reason: str
 
 
-class ModerationState(BaseModel):
+# Returned by the API; ModerationState adds per-run settings that stay server-side
+class ModerationResult(BaseModel):
     message: ChatMessage
     pii_result: Optional[PIIResult] = None
     content_result: Optional[ContentResult] = None
     recommended_action: Optional[ModAction] = None
+
+
+class ModerationState(ModerationResult):
+    trace_id: Optional[str] = None
+    local_only: bool = False  # rate limited: skip HuggingFace and Gemini
+    replay: bool = False  # historical backfill: skip checks against the player's live window
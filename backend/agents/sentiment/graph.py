@@ -1,6 +1,10 @@
+import logging
 from pydantic_graph import Graph
 from typing import Optional
 
+from utils.graph_state import RunInProgress, register_graph, run_persisted
+from utils.idempotency import request_fingerprint
+from utils.metrics import record_fallback, current_trace_id
 from .state import ChatMessage, SentimentAnalysisState
 from .nodes import (
     StartSentimentAnalysis,
@@ -20,23 +24,53 @@ sentiment_graph = Graph(
         CalculateRewards,
     ],
     state_type=SentimentAnalysisState,
+    run_end_type=str,
 )
+register_graph("sentiment", sentiment_graph)
+
+logger = logging.getLogger(__name__)
 
 
 # ---------- Main Function ----------
 async def analyze_message_sentiment(
-    message: ChatMessage, user_profile = None
+    message: ChatMessage,
+    user_profile = None,
+    trace_id: Optional[str] = None,
+    local_only: bool = False,
+    spam_reason: Optional[str] = None,
+    replay: bool = False,
 ) -> SentimentAnalysisState:
-    """Analyze message sentiment and community intent (only call after moderation passes)"""
-    from .state import ChatAnalysis
+    """
+    Analyze message sentiment and community intent (only call after moderation passes)
+
+    A spam_reason from the ingestion spam check tags the message SPAM up front and
+    analyses it locally, so it costs no HuggingFace or Gemini calls. replay marks a
+    backfill of stored history, whose runs aren't snapshotted: the resume worker awards
+    points for the runs it finishes, and old messages must not earn them again.
+    """
+    from .state import ChatAnalysis, CommunityAction, CommunityIntent
 
     chat_analysis = ChatAnalysis(chat=message)
-    state = SentimentAnalysisState(chat_analysis=chat_analysis)
+    if spam_reason:
+        chat_analysis.community_intent = CommunityIntent(intent=CommunityAction.SPAM, reason=spam_reason)
+        local_only = True
+    state = SentimentAnalysisState(
+        chat_analysis=chat_analysis, trace_id=trace_id or current_trace_id(), local_only=local_only
+    )
 
     try:
-        await sentiment_graph.run(StartSentimentAnalysis(), state=state)
-        return state
+        # Snapshots after every node let a retry resume where a failed run stopped;
+        # local-only runs make no paid calls, so they aren't worth snapshotting. Backfill
+        # replays stay out of the store the resume worker finishes from.
+        return await run_persisted(
+            sentiment_graph, StartSentimentAnalysis(), state, "sentiment",
+            None if local_only or replay else message.message_id,
+            request_fingerprint(message.message, message.player_id), state.trace_id
+        )
 
+    except RunInProgress:
+        raise  # answered with a 409; a fallback would be stored over the live result
     except Exception as e:
-        print(f"Sentiment analysis error: {e}")
+        logger.error(f"Sentiment analysis error: {str(e)}")
+        record_fallback("sentiment_graph")
         return state
@@ -1,12 +1,14 @@
 from dataclasses import dataclass
-from pydantic_ai import Agent
+from functools import cache
 from pydantic_graph import BaseNode, GraphRunContext, End
-from typing import Union
-import requests
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
 import asyncio
+import logging
 import os
 from dotenv import load_dotenv
 
+from utils.metrics import track_dependency, record_fallback
+from utils.usage import budget_governor, record_gemini_usage, record_hf_usage
 from .state import (
     SentimentAnalysisState,
     CommunityIntent,
@@ -14,6 +16,11 @@ from .state import (
     CommunityAction,
 )
 
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
 
@@ -38,6 +45,8 @@ DEFAULT_SENTIMENT_RESPONSE = [[{"label": "LABEL_1", "score": 1.0}]]
 NEGATIVE_LABEL = "LABEL_0"
 NEUTRAL_LABEL = "LABEL_1"
 POSITIVE_LABEL = "LABEL_2"
+# Order of the probability vector stored in messages.sentiment_probs
+SENTIMENT_LABELS = (NEGATIVE_LABEL, NEUTRAL_LABEL, POSITIVE_LABEL)
 
 # Agent Prompts
 COMMUNITY_INTENT_PROMPT = """
@@ -83,31 +92,64 @@ POSITIVE_SENTIMENT_POINTS = 2      # For sentiment >= 30
 POSITIVE_ACTION_POINTS = 10        # For positive community actions  
 NEGATIVE_ACTION_POINTS = -10       # For negative community actions
 
+POSITIVE_ACTIONS = frozenset({
+    CommunityAction.ENCOURAGEMENT,
+    CommunityAction.HELPING,
+    CommunityAction.TEAM_BUILDING,
+})
+
 
 # ---------- Core Functions ----------
 
 
 async def analyze_sentiment(text: str):
     """Get sentiment scores from HuggingFace API"""
+    import requests
 
     def sync_query():
         try:
-            response = requests.post(
-                SENTIMENT_API_URL,
-                headers={"Authorization": f"Bearer {HF_TOKEN}"},
-                json={"inputs": text},
-                timeout=API_TIMEOUT,
-            )
-            response.raise_for_status()
-            return response.json()
+            with track_dependency("huggingface", "sentiment"):
+                response = requests.post(
+                    SENTIMENT_API_URL,
+                    headers={"Authorization": f"Bearer {HF_TOKEN}"},
+                    json={"inputs": text},
+                    timeout=API_TIMEOUT,
+                )
+                response.raise_for_status()
+                record_hf_usage("AnalyzeSentiment", response)
+                return response.json()
         except Exception as e:
-            print(f"Sentiment API error: {e}")
+            logger.warning(f"Sentiment API error: {e}")
+            if isinstance(e, requests.exceptions.RequestException):
+                record_hf_usage("AnalyzeSentiment")
+            record_fallback("sentiment")
             return DEFAULT_SENTIMENT_RESPONSE
 
-    return await asyncio.get_event_loop().run_in_executor(None, sync_query)
+    return await asyncio.to_thread(sync_query)
+
+
+def sentiment_probabilities(api_response) -> List[float]:
+    """
+    Extract the label probabilities from a HuggingFace sentiment response
+
+    Args:
+        api_response: HuggingFace API response with sentiment probabilities
+
+    Returns:
+        [negative, neutral, positive] in SENTIMENT_LABELS order, missing labels as 0.0
+    """
+    sentiment_data = (
+        api_response[0] if isinstance(api_response, list) and api_response else []
+    )
+
+    scores = {}
+    for item in sentiment_data:
+        scores[item.get("label", "")] = item.get("score", 0)
+
+    return [float(scores.get(label, 0.0)) for label in SENTIMENT_LABELS]
 
 
-def calculate_sentiment_score(api_response):
+def score_from_probabilities(probabilities: Sequence[float]) -> int:
     """
     Calculate sentiment score using approved formula with confidence dampening.
     
@@ -118,32 +160,16 @@ def calculate_sentiment_score(api_response):
     - Reduces extreme scores when model is uncertain (high neutral)
     - Provides -100 to +100 range with good granularity
     - Example: "Hello!" → positive=0.8, negative=0.1, neutral=0.1 → (0.8-0.1)*0.9*100 = 63
+
+    services/rescoring.py applies the same formula to stored probabilities in bulk.
     
     Args:
-        api_response: HuggingFace API response with sentiment probabilities
+        probabilities: [negative, neutral, positive] from sentiment_probabilities
         
     Returns:
         int: Sentiment score from -100 to +100
     """
-    sentiment_data = (
-        api_response[0] if isinstance(api_response, list) and api_response else []
-    )
-
-    scores = {}
-    for item in sentiment_data:
-        label = item.get("label", "")
-        score = item.get("score", 0)
-
-        if label == NEGATIVE_LABEL:
-            scores["negative"] = score
-        elif label == NEUTRAL_LABEL:
-            scores["neutral"] = score
-        elif label == POSITIVE_LABEL:
-            scores["positive"] = score
-
-    positive = scores.get("positive", 0)
-    negative = scores.get("negative", 0)
-    neutral = scores.get("neutral", 0)
+    negative, neutral, positive = probabilities
 
     # High neutral dampens sentiment strength
     sentiment_difference = positive - negative
@@ -152,10 +178,49 @@ def calculate_sentiment_score(api_response):
     return int(round(sentiment_difference * confidence_factor * 100))
 
 
+def calculate_sentiment_score(api_response) -> int:
+    """Sentiment score from -100 to +100 for a HuggingFace sentiment response"""
+    return score_from_probabilities(sentiment_probabilities(api_response))
+
+
+def calculate_reward(sentiment_score: int, intent: Optional[CommunityAction]) -> Tuple[int, List[str]]:
+    """
+    Reward points for one analyzed message
+
+    services/rescoring.py vectorizes the same rules for re-scoring history.
+
+    Returns:
+        Points awarded and the reasons behind them
+    """
+    points = 0
+    reasons = []
+
+    # Sentiment points
+    if sentiment_score > POSITIVE_SENTIMENT_THRESHOLD:
+        points += POSITIVE_SENTIMENT_POINTS
+        reasons.append("Positive sentiment")
+
+    # Community intent points
+    if intent:
+        if intent in POSITIVE_ACTIONS:
+            points += POSITIVE_ACTION_POINTS
+            reasons.append(f"Positive action: {intent.value}")
+        else:  # Negative actions
+            points += NEGATIVE_ACTION_POINTS
+            reasons.append(f"Negative action: {intent.value}")
+
+    return points, reasons
+
+
 # ---------- AI Agent ----------
-CommunityIntentAgent = Agent(
-    GEMINI_MODEL, system_prompt=COMMUNITY_INTENT_PROMPT, output_type=CommunityIntent
-)
+# Built on first use so importing this module stays cheap on cold starts
+@cache
+def get_community_intent_agent() -> "Agent":
+    from pydantic_ai import Agent
+
+    return Agent(
+        GEMINI_MODEL, system_prompt=COMMUNITY_INTENT_PROMPT, output_type=CommunityIntent
+    )
 
 
 # ---------- Forward Declarations ----------
@@ -189,7 +254,7 @@ class CheckContentLength(BaseNode[SentimentAnalysisState]):
     ) -> Union[AnalyzeSentiment, AnalyzeCommunityIntent]:
         content_length = len(ctx.state.chat_analysis.chat.message)
 
-        if content_length >= MIN_CONTENT_LENGTH:
+        if content_length >= MIN_CONTENT_LENGTH and not ctx.state.local_only:
             return AnalyzeSentiment()
         else:
             ctx.state.chat_analysis.sentiment_score = 0
@@ -200,18 +265,32 @@ class CheckContentLength(BaseNode[SentimentAnalysisState]):
 class AnalyzeSentiment(BaseNode[SentimentAnalysisState]):
     async def run(self, ctx: GraphRunContext) -> AnalyzeCommunityIntent:
         api_response = await analyze_sentiment(ctx.state.chat_analysis.chat.message)
-        sentiment_score = calculate_sentiment_score(api_response)
-        ctx.state.chat_analysis.sentiment_score = sentiment_score
+        probabilities = sentiment_probabilities(api_response)
+        ctx.state.chat_analysis.sentiment_probs = probabilities
+        ctx.state.chat_analysis.sentiment_score = score_from_probabilities(probabilities)
         return AnalyzeCommunityIntent()
 
 
 @dataclass
 class AnalyzeCommunityIntent(BaseNode[SentimentAnalysisState]):
     async def run(self, ctx: GraphRunContext) -> CalculateRewards:
+        if ctx.state.local_only:
+            # Keeps an intent preset by the spam check
+            if ctx.state.chat_analysis.community_intent is None:
+                ctx.state.chat_analysis.community_intent = CommunityIntent(intent=None, reason=None)
+            return CalculateRewards()
+
+        if not budget_governor.allows("community_intent"):
+            record_fallback("community_intent_budget")
+            ctx.state.chat_analysis.community_intent = CommunityIntent(intent=None, reason=None)
+            return CalculateRewards()
+
         try:
-            result = await CommunityIntentAgent.run(
-                ctx.state.chat_analysis.chat.message
-            )
+            with track_dependency("gemini", "community_intent"):
+                result = await get_community_intent_agent().run(
+                    ctx.state.chat_analysis.chat.message
+                )
+            record_gemini_usage("AnalyzeCommunityIntent", result)
             intent_result = result.output if hasattr(result, "output") else result
 
             # Ensure reason is None when intent is None
@@ -221,7 +300,9 @@ class AnalyzeCommunityIntent(BaseNode[SentimentAnalysisState]):
             ctx.state.chat_analysis.community_intent = intent_result
 
         except Exception as e:
-            print(f"Community intent error: {e}")
+            logger.warning(f"Community intent error: {e}")
+            record_gemini_usage("AnalyzeCommunityIntent")
+            record_fallback("community_intent")
             ctx.state.chat_analysis.community_intent = CommunityIntent(
                 intent=None, reason=None
             )
@@ -232,30 +313,11 @@ class AnalyzeCommunityIntent(BaseNode[SentimentAnalysisState]):
 @dataclass
 class CalculateRewards(BaseNode[SentimentAnalysisState]):
     async def run(self, ctx: GraphRunContext) -> End:
-        points = 0
-        reasons = []
-
-        # Sentiment points
-        sentiment_score = ctx.state.chat_analysis.sentiment_score or 0
-        if sentiment_score > POSITIVE_SENTIMENT_THRESHOLD:
-            points += POSITIVE_SENTIMENT_POINTS
-            reasons.append("Positive sentiment")
-
-        # Community intent points
         intent = ctx.state.chat_analysis.community_intent
-        if intent and intent.intent:
-            positive_actions = {
-                CommunityAction.ENCOURAGEMENT,
-                CommunityAction.HELPING,
-                CommunityAction.TEAM_BUILDING,
-            }
-
-            if intent.intent in positive_actions:
-                points += POSITIVE_ACTION_POINTS
-                reasons.append(f"Positive action: {intent.intent.value}")
-            else:  # Negative actions
-                points += NEGATIVE_ACTION_POINTS
-                reasons.append(f"Negative action: {intent.intent.value}")
+        points, reasons = calculate_reward(
+            ctx.state.chat_analysis.sentiment_score or 0,
+            intent.intent if intent else None,
+        )
 
         ctx.state.reward_system = RewardSystem(
             points_awarded=points,
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 from models.chat import ChatMessage
 
@@ -32,6 +32,7 @@ class CommunityIntent(BaseModel):
 class ChatAnalysis(BaseModel):
     chat: ChatMessage
     sentiment_score: Optional[int] = None
+    sentiment_probs: Optional[List[float]] = None  # [negative, neutral, positive]
     community_intent: Optional[CommunityIntent] = None
     error: Optional[str] = None
 
@@ -46,3 +47,5 @@ class RewardSystem(BaseModel):
 class SentimentAnalysisState(BaseModel):
     chat_analysis: ChatAnalysis
     reward_system: Optional[RewardSystem] = None
+    trace_id: Optional[str] = None
+    local_only: bool = False  # rate limited: skip HuggingFace and Gemini
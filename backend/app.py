@@ -1,13 +1,31 @@
 import logging
-from fastapi import FastAPI
+from utils.logs import configure_logging, stop_logging
+from fastapi import FastAPI, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from routes.chat import router as chat_router
 from routes.data import router as data_router
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+from routes.export import router as export_router
+from routes.metrics import router as metrics_router
+from utils.metrics import TRACE_HEADER, inbound_trace_id, set_trace_id, reset_trace_id
+from utils.warmup import WARMUP_ENABLED, warm_up
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.rate_limit import ANALYSIS_MODE_HEADER
+from utils.serialization import FastJSONResponse
+from utils.health import HEALTH_PROBE_INTERVAL, health_monitor
+from utils.background import PeriodicTask, background_tasks, start_background_tasks, stop_background_tasks
+from services.score_store import (
+    SCORE_MERGE_INTERVAL,
+    SCORE_SNAPSHOT_INTERVAL,
+    get_score_store,
+    recover_orphaned_slots,
 )
+from services.presence import PRESENCE_FLUSH_INTERVAL, presence_tracker
+from services.analytics import ANALYTICS_FLUSH_INTERVAL, analytics_rollups
+from services.resume import RESUME_INTERVAL, resume_interrupted_runs
+
+# Configure logging: JSON lines written off the request path by a listener thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # FastAPI app
@@ -15,6 +33,8 @@ app = FastAPI(
     title="Bloom AI",
     description="Bloom AI's Real-time message moderation and sentiment analysis",
     version="1.0.0",
+    # orjson-backed; response_model routes are still dumped by pydantic before encoding
+    default_response_class=FastJSONResponse,
 )
 
 # Add CORS middleware
@@ -31,23 +51,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER, NEXT_CURSOR_HEADER, ANALYSIS_MODE_HEADER],
 )
 
 app.include_router(chat_router)
 app.include_router(data_router)
+app.include_router(export_router)
+app.include_router(metrics_router)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Bind a trace ID to each request so graph states and metrics exemplars can carry it"""
+    trace_id = inbound_trace_id(request.headers.get(TRACE_HEADER))
+    token = set_trace_id(trace_id)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_trace_id(token)
+    response.headers[TRACE_HEADER] = trace_id
+    return response
+
+
+# Keep reward scores consistent across workers and quick to reload after restarts
+background_tasks.extend([
+    PeriodicTask("score_merge", SCORE_MERGE_INTERVAL, lambda: get_score_store().merge(), run_on_stop=True),
+    PeriodicTask("score_snapshot", SCORE_SNAPSHOT_INTERVAL, lambda: get_score_store().snapshot(), run_on_stop=True),
+    # Bulk-write last_seen for players who chatted since the previous flush
+    PeriodicTask("presence_flush", PRESENCE_FLUSH_INTERVAL, presence_tracker.flush, run_on_stop=True),
+    # Add per-minute moderation and sentiment counts to the analytics rollups
+    PeriodicTask("analytics_flush", ANALYTICS_FLUSH_INTERVAL, analytics_rollups.flush, run_on_stop=True),
+    # Finish moderation and sentiment runs interrupted by crashes, deploys or failed calls
+    PeriodicTask("graph_resume", RESUME_INTERVAL, resume_interrupted_runs),
+    # Probe Supabase, HuggingFace and Gemini for /api/health/ready
+    PeriodicTask("health_probe", HEALTH_PROBE_INTERVAL, health_monitor.refresh),
+])
 
 
 @app.on_event("startup")
 async def startup():
+    # uvicorn installs its own synchronous handlers after importing the app
+    configure_logging()
+    if WARMUP_ENABLED:
+        warm_up()
+    await run_in_threadpool(recover_orphaned_slots)
+    # Load current totals so the leaderboard is complete before the first merge tick
+    await run_in_threadpool(lambda: get_score_store().merge_if_due(0))
+    await start_background_tasks()
     logger.info("Bloom AI started")
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_background_tasks()
+    get_score_store().close()
     logger.info("Bloom AI shutdown")
+    stop_logging()
 
 
 if __name__ == "__main__":
+    import os
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # Single process for development; serve production with gunicorn -c gunicorn.conf.py app:app
+    reload = os.getenv("BLOOM_RELOAD", "1").lower() in ("1", "true", "yes")
+    uvicorn.run("app:app" if reload else app, host="0.0.0.0", port=8000, reload=reload)
@@ -0,0 +1,4 @@
+"""
+Offline benchmark suite for the moderation and sentiment pipelines
+Runs against local stand-ins for HuggingFace, Gemini and Supabase so results are repeatable
+"""
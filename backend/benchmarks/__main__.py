@@ -0,0 +1,76 @@
+"""
+Usage:
+    python -m benchmarks                                # run every scenario, compare with the default baseline
+    python -m benchmarks -s api_analyze -s api_live     # run selected scenarios
+    python -m benchmarks --save-baseline                # record the current numbers as the baseline
+    python -m benchmarks --hf-latency 80 --hf-error-rate 0.05 --gemini-latency 400
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from .harness import OfflineProfile, offline_environment
+from .hf_server import EndpointProfile
+from .report import find_regressions, format_table, load_baseline, save_baseline
+from .runner import run_scenario
+from .scenarios import SCENARIOS
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline pipeline benchmarks")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="scenario to run (repeatable)")
+    parser.add_argument("-n", "--iterations", type=int, help="override iterations per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, help="override concurrency per scenario")
+    parser.add_argument("--baseline", default="default", help="baseline name under benchmarks/baselines")
+    parser.add_argument("--save-baseline", action="store_true", help="store results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative drift before flagging")
+    parser.add_argument("--hf-latency", type=float, default=40.0, help="mean HF latency in ms")
+    parser.add_argument("--hf-error-rate", type=float, default=0.0, help="fraction of HF calls that fail")
+    parser.add_argument("--gemini-latency", type=float, default=250.0, help="mean Gemini latency in ms")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="fraction of Gemini calls that fail")
+    parser.add_argument("--supabase-latency", type=float, default=15.0, help="Supabase round trip in ms")
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace) -> int:
+    profile = OfflineProfile(
+        hf=EndpointProfile(latency_ms=args.hf_latency, jitter_ms=args.hf_latency / 4, error_rate=args.hf_error_rate),
+        gemini_latency_ms=args.gemini_latency,
+        gemini_error_rate=args.gemini_error_rate,
+        supabase_latency_ms=args.supabase_latency,
+    )
+    names = args.scenario or list(SCENARIOS)
+
+    results = []
+    for name in names:
+        # Fresh stand-ins per scenario so seeded rows and request counts don't leak between runs
+        with offline_environment(profile) as env:
+            results.append(await run_scenario(SCENARIOS[name], env, args.iterations, args.concurrency))
+        print(f"done: {name}", file=sys.stderr)
+
+    print(format_table(results))
+
+    if args.save_baseline:
+        print(f"\nBaseline saved to {save_baseline(args.baseline, results)}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print(f"\nNo baseline named '{args.baseline}' yet; run with --save-baseline to create one")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions against '{args.baseline}' (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(parse_args())))
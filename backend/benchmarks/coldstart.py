@@ -0,0 +1,114 @@
+"""
+Cold-start and import-time profiling report
+
+Usage:
+    python -m benchmarks.coldstart            # median timings over fresh interpreters
+    python -m benchmarks.coldstart --top 30   # also list the 30 most expensive imports
+
+Every sample runs in a new interpreter so module caches can't hide import cost. Reported, with
+and without BLOOM_WARMUP: `import app` time, startup hook time, first /api/health latency, the
+one-off cost of building the Supabase client and agents on first use, and the first
+/api/moderate latency against the offline stand-ins.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+from typing import Dict, List, Tuple
+
+from .harness import OFFLINE_ENV
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from benchmarks.harness import offline_environment
+
+result = {"import_ms": (imported - started) * 1000}
+t = time.perf_counter()
+with TestClient(app.app) as client:
+    result["startup_ms"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    client.get("/api/health")
+    result["first_health_ms"] = (time.perf_counter() - t) * 1000
+
+    # What the first pipeline request pays for lazily built clients and agents
+    from agents.moderation.nodes import get_mod_agent, get_pii_agent
+    from agents.sentiment.nodes import get_community_intent_agent
+    from utils.db import get_supabase
+    t = time.perf_counter()
+    for factory in (get_supabase, get_pii_agent, get_mod_agent, get_community_intent_agent):
+        factory()
+    result["first_use_ms"] = (time.perf_counter() - t) * 1000
+
+    with offline_environment():
+        payload = {"message": "hello there", "message_id": "cold_1", "player_id": 1, "player_name": "Cold"}
+        t = time.perf_counter()
+        client.post("/api/moderate", json=payload)
+        result["first_moderate_ms"] = (time.perf_counter() - t) * 1000
+print("COLDSTART" + json.dumps(result))
+"""
+
+
+def _run_probe(warmup: bool) -> Dict[str, float]:
+    env = {**os.environ, **OFFLINE_ENV, "BLOOM_WARMUP": "1" if warmup else "0"}
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("COLDSTART"))
+    return json.loads(line[len("COLDSTART"):])
+
+
+def import_profile(top: int) -> Tuple[float, List[Tuple[float, float, str]]]:
+    """Run `python -X importtime -c 'import app'` and return total ms and the most expensive modules"""
+    env = {**os.environ, **OFFLINE_ENV}
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.rstrip()))
+    total = next((row[0] for row in rows if row[2].strip() == "app"), 0.0)
+    rows.sort(reverse=True)
+    return total, rows[:top]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.coldstart", description="Cold-start report")
+    parser.add_argument("-r", "--runs", type=int, default=3, help="fresh interpreters per configuration")
+    parser.add_argument("--top", type=int, default=15, help="number of imports to list")
+    args = parser.parse_args(argv)
+
+    for warmup in (False, True):
+        samples = [_run_probe(warmup) for _ in range(args.runs)]
+        label = "with BLOOM_WARMUP=1" if warmup else "lazy (default)"
+        print(f"{label}:")
+        for key in ("import_ms", "startup_ms", "first_health_ms", "first_use_ms", "first_moderate_ms"):
+            values = [sample[key] for sample in samples if key in sample]
+            if values:
+                print(f"  {key:<20}{median(values):>10.1f}")
+        print()
+
+    total, rows = import_profile(args.top)
+    print(f"import app: {total:.1f} ms (from -X importtime)")
+    print(f"  {'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, own, name in rows:
+        print(f"  {cumulative:>14.1f}{own:>10.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
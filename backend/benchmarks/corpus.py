@@ -0,0 +1,98 @@
+"""
+Synthetic Roblox chat corpus shared by the benchmarks and the load generator
+"""
+
+import random
+from typing import List
+
+
+# ---------- Vocabulary ----------
+FRIENDLY_MESSAGES = [
+    "gg everyone that was a great round",
+    "nice build, want help finishing the roof?",
+    "welcome to the server! follow me and I'll show you the obby",
+    "you can do it, just jump a bit earlier on the last stage",
+    "thanks for the help with the boss",
+    "anyone want to team up for the next raid?",
+    "I can give you some wood if you need it",
+]
+
+NEUTRAL_MESSAGES = [
+    "lol",
+    "where is the shop",
+    "brb",
+    "what level are you",
+    "ok",
+    "which map is next",
+    "is this server laggy for anyone else",
+]
+
+TOXIC_MESSAGES = [
+    "you are so bad at this game, just quit",
+    "nobody wants you on this team noob",
+    "I will destroy your base while you sleep",
+    "get out of our server, losers only",
+]
+
+SPAM_MESSAGES = [
+    "FREE ROBUX CLICK HERE",
+    "join my group join my group join my group",
+    "buy cheap items dm me",
+]
+
+PII_MESSAGES = [
+    "my email is coolplayer@example.com contact me",
+    "call me at 555-867-5309",
+    "I live at 42 Maple Street Springfield",
+    "my password is hunter2 dont tell anyone",
+]
+
+# Conversations replayed line by line through the PII window (utils/pii_window.py), with
+# the PIIType value the last line should report: PII split across lines, then chat that
+# only looks like the start or end of some
+SPLIT_PII_CONVERSATIONS = [
+    (["call me at 555 867", "5309"], "TELEPHONENUM"),
+    (["my email is coolplayer", "at example dot com"], "EMAIL"),
+    (["I live at 42 Maple", "Street"], "STREET"),
+    (["come to 1600 pennsylvania", "avenue"], "STREET"),
+    (["its 12 old mill", "road by the school"], "STREET"),
+]
+SPLIT_PII_LOOKALIKES = [
+    (["I got 5 kills", "no way"], None),
+    (["lol 3 times", "this way"], None),
+    (["I got 5 kills", "on the road to the castle"], None),
+    (["2 more rounds", "then we take our place"], None),
+    (["wave 10 20 30", "40 50 done"], None),
+]
+
+# Substrings the local stand-ins use to decide what a message contains
+PII_MARKERS = ("@", "555-", "street", "password")
+TOXIC_MARKERS = ("bad", "noob", "destroy", "losers", "quit")
+POSITIVE_MARKERS = ("great", "nice", "welcome", "thanks", "help", "can do")
+
+
+# ---------- Generators ----------
+def message_mix(
+    count: int,
+    seed: int = 7,
+    pii_ratio: float = 0.05,
+    toxic_ratio: float = 0.1,
+    spam_ratio: float = 0.05,
+) -> List[str]:
+    """Build a reproducible list of chat lines with the given category ratios"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < pii_ratio:
+            pool = PII_MESSAGES
+        elif roll < pii_ratio + toxic_ratio:
+            pool = TOXIC_MESSAGES
+        elif roll < pii_ratio + toxic_ratio + spam_ratio:
+            pool = SPAM_MESSAGES
+        elif roll < 0.6:
+            pool = NEUTRAL_MESSAGES
+        else:
+            pool = FRIENDLY_MESSAGES
+        messages.append(rng.choice(pool))
+    return messages
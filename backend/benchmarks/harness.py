@@ -0,0 +1,87 @@
+"""
+Wires the local stand-ins into the backend modules for offline runs
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from unittest import mock
+
+from .hf_server import (
+    EndpointProfile,
+    FakeHFServer,
+    MODERATION_PATH,
+    PII_PATH,
+    SENTIMENT_PATH,
+)
+from .models import fake_agents
+from .supabase_stub import InMemorySupabase
+
+
+# Placeholder credentials so the backend modules import without a real environment
+OFFLINE_ENV = {
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_KEY": "offline-benchmark-key",
+    "GEMINI_API_KEY": "offline-benchmark-key",
+    "HF_TOKEN": "offline-benchmark-token",
+}
+
+# Offline runs award points to fake players and snapshot fake graph runs. Left in the
+# default directories, the next real server would merge those scores into player_scores,
+# so they go to a scratch directory instead. Set on import, before services.score_store and
+# utils.graph_state read them, and overriding any inherited value.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="bloom-offline-")
+os.environ["BLOOM_SCORE_DIR"] = os.path.join(SCRATCH_DIR, "scores")
+os.environ["BLOOM_GRAPH_STATE_DIR"] = os.path.join(SCRATCH_DIR, "graph-runs")
+
+
+def _remove_scratch(owner: int = os.getpid()) -> None:
+    # Forked server workers inherit this hook; only the process that made the directory removes it
+    if os.getpid() == owner:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+# At interpreter exit, after any server shutdown has written its last score snapshot
+atexit.register(_remove_scratch)
+
+
+@dataclass
+class OfflineProfile:
+    hf: EndpointProfile = field(default_factory=EndpointProfile)
+    gemini_latency_ms: float = 250.0
+    gemini_error_rate: float = 0.0
+    supabase_latency_ms: float = 15.0
+
+
+@dataclass
+class OfflineEnvironment:
+    hf: FakeHFServer
+    db: InMemorySupabase
+
+
+@contextmanager
+def offline_environment(profile: OfflineProfile = None):
+    """Start the fake HF server and patch HF URLs, Gemini agents and the Supabase client"""
+    profile = profile or OfflineProfile()
+    for key, value in OFFLINE_ENV.items():
+        os.environ.setdefault(key, value)
+
+    from agents.moderation import nodes as moderation_nodes
+    from agents.sentiment import nodes as sentiment_nodes
+    from utils.db import set_supabase
+
+    db = InMemorySupabase(latency_ms=profile.supabase_latency_ms)
+    with ExitStack() as stack:
+        hf = stack.enter_context(FakeHFServer(profile.hf))
+        stack.enter_context(mock.patch.object(moderation_nodes, "PII_DETECTION_API_URL", hf.url(PII_PATH)))
+        stack.enter_context(
+            mock.patch.object(moderation_nodes, "CONTENT_MODERATION_API_URL", hf.url(MODERATION_PATH))
+        )
+        stack.enter_context(mock.patch.object(sentiment_nodes, "SENTIMENT_API_URL", hf.url(SENTIMENT_PATH)))
+        set_supabase(db)
+        stack.callback(set_supabase, None)
+        stack.enter_context(fake_agents(profile.gemini_latency_ms, profile.gemini_error_rate))
+        yield OfflineEnvironment(hf=hf, db=db)
@@ -0,0 +1,146 @@
+"""
+Local stand-in for the HuggingFace inference endpoints
+Serves PII detection, content moderation and sentiment responses with configurable latency and error rate
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from .corpus import PII_MARKERS, POSITIVE_MARKERS, TOXIC_MARKERS
+
+
+# ---------- Configuration ----------
+@dataclass
+class EndpointProfile:
+    latency_ms: float = 40.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+
+
+PII_PATH = "/pii"
+MODERATION_PATH = "/moderation"
+SENTIMENT_PATH = "/sentiment"
+
+
+# ---------- Canned Responses ----------
+def pii_response(text: str) -> Any:
+    lowered = text.lower()
+    if "@" in lowered:
+        return [{"entity_group": "EMAIL", "score": 0.98, "word": "email", "start": 0, "end": 5}]
+    if "555-" in lowered:
+        return [{"entity_group": "TELEPHONENUM", "score": 0.97, "word": "555", "start": 0, "end": 3}]
+    if "street" in lowered:
+        return [{"entity_group": "STREET", "score": 0.91, "word": "street", "start": 0, "end": 6}]
+    if any(marker in lowered for marker in PII_MARKERS):
+        return [{"entity_group": "PASSWORD", "score": 0.9, "word": "password", "start": 0, "end": 8}]
+    return []
+
+
+def moderation_response(text: str) -> Any:
+    lowered = text.lower()
+    if any(marker in lowered for marker in TOXIC_MARKERS):
+        return [[{"label": "H", "score": 0.81}, {"label": "OK", "score": 0.12}, {"label": "V", "score": 0.07}]]
+    return [[{"label": "OK", "score": 0.97}, {"label": "H", "score": 0.02}, {"label": "V", "score": 0.01}]]
+
+
+def sentiment_response(text: str) -> Any:
+    lowered = text.lower()
+    if any(marker in lowered for marker in POSITIVE_MARKERS):
+        probs = (0.03, 0.12, 0.85)
+    elif any(marker in lowered for marker in TOXIC_MARKERS):
+        probs = (0.78, 0.17, 0.05)
+    else:
+        probs = (0.15, 0.7, 0.15)
+    return [[
+        {"label": "LABEL_2", "score": probs[2]},
+        {"label": "LABEL_1", "score": probs[1]},
+        {"label": "LABEL_0", "score": probs[0]},
+    ]]
+
+
+RESPONDERS = {
+    PII_PATH: pii_response,
+    MODERATION_PATH: moderation_response,
+    SENTIMENT_PATH: sentiment_response,
+}
+
+
+# ---------- Server ----------
+class FakeHFServer:
+    """Threaded HTTP server that mimics the three HuggingFace endpoints"""
+
+    def __init__(self, profile: EndpointProfile = None, seed: int = 11):
+        self.profile = profile or EndpointProfile()
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def start(self) -> "FakeHFServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeHFServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._rng.gauss(self.profile.latency_ms, self.profile.jitter_ms))
+            failed = self._rng.random() < self.profile.error_rate
+        return delay / 1000, failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                delay, failed = server._draw()
+                time.sleep(delay)
+
+                responder = RESPONDERS.get(self.path)
+                if responder is None:
+                    self._reply(404, {"error": "unknown model"})
+                elif failed:
+                    self._reply(503, {"error": "Model is currently loading"})
+                else:
+                    self._reply(200, responder(payload.get("inputs", "")))
+
+            def _reply(self, status: int, body: Any):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,320 @@
+"""
+End-to-end load generator that simulates Roblox game servers and dashboard viewers
+
+Usage:
+    python -m benchmarks.loadgen --target http://localhost:8000 --stages 5,10,20,40 --stage-seconds 60
+    python -m benchmarks.loadgen --offline --stages 2,4,8 --stage-seconds 10
+
+Each stage runs a fixed number of game servers sending open-loop, bursty chat traffic to
+/api/analyze, /api/moderate and /api/sentiment, while dashboards poll /api/live, /api/flagged
+and /api/top-players. Per endpoint and stage the report shows latency percentiles, error rate
+and achieved vs offered throughput, and the last stage that still met the SLO.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .corpus import message_mix
+from .report import percentile
+
+
+CHAT_ENDPOINTS = ("/api/analyze", "/api/moderate", "/api/sentiment")
+DASHBOARD_ENDPOINTS = ("/api/live", "/api/flagged", "/api/top-players")
+
+
+# ---------- Configuration ----------
+@dataclass
+class SLO:
+    p95_ms: float
+    max_error_rate: float = 0.01
+
+
+@dataclass
+class LoadProfile:
+    stages: List[int] = field(default_factory=lambda: [5, 10, 20, 40])
+    stage_seconds: float = 60.0
+    players_per_server: int = 30
+    calm_rate: float = 0.5            # messages per second per server between bursts
+    burst_rate: float = 6.0           # messages per second per server during a burst
+    burst_chance: float = 0.05        # chance per second that a calm server starts a burst
+    burst_seconds: float = 8.0
+    pii_ratio: float = 0.03
+    toxic_ratio: float = 0.08
+    spam_ratio: float = 0.05
+    duplicate_ratio: float = 0.02     # messages re-sent immediately with the same message_id
+    request_timeout: float = 10.0
+    max_retries: int = 2
+    endpoint_mix: Dict[str, float] = field(
+        default_factory=lambda: {"/api/analyze": 0.85, "/api/moderate": 0.1, "/api/sentiment": 0.05}
+    )
+    dashboards: int = 5
+    poll_intervals: Dict[str, float] = field(
+        default_factory=lambda: {"/api/live": 5.0, "/api/flagged": 10.0, "/api/top-players": 60.0}
+    )
+    slos: Dict[str, SLO] = field(
+        default_factory=lambda: {
+            "/api/analyze": SLO(p95_ms=3000),
+            "/api/moderate": SLO(p95_ms=2000),
+            "/api/sentiment": SLO(p95_ms=2000),
+            "/api/live": SLO(p95_ms=500),
+            "/api/flagged": SLO(p95_ms=300),
+            "/api/top-players": SLO(p95_ms=500),
+        }
+    )
+
+
+# ---------- Recording ----------
+@dataclass
+class EndpointStats:
+    sent: int = 0
+    ok: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    retries: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+
+@dataclass
+class StageReport:
+    servers: int
+    seconds: float
+    endpoints: Dict[str, EndpointStats]
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints: Dict[str, EndpointStats] = defaultdict(EndpointStats)
+
+    def record(self, endpoint: str, latency_ms: float, ok: bool, timed_out: bool = False) -> None:
+        stats = self.endpoints[endpoint]
+        stats.sent += 1
+        stats.latencies.append(latency_ms)
+        if ok:
+            stats.ok += 1
+        else:
+            stats.errors += 1
+            stats.timeouts += int(timed_out)
+
+
+# ---------- Traffic ----------
+class Traffic:
+    """Shared request plumbing for game servers and dashboards"""
+
+    def __init__(self, client: httpx.AsyncClient, profile: LoadProfile, api_key: Optional[str]):
+        self.client = client
+        self.profile = profile
+        self.headers = {"X-API-Key": api_key} if api_key else {}
+        self.recorder = Recorder()
+        self.pending: set = set()
+        self.message_ids = itertools.count()
+
+    async def request(self, method: str, endpoint: str, headers: Optional[dict] = None, **kwargs) -> Tuple[bool, bool]:
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            response = await asyncio.wait_for(
+                self.client.request(method, endpoint, headers={**self.headers, **(headers or {})}, **kwargs),
+                timeout=self.profile.request_timeout,
+            )
+            ok = response.status_code < 400
+            retryable = response.status_code >= 500 or response.status_code == 429
+        except asyncio.TimeoutError:
+            ok, retryable, timed_out = False, True, True
+        except httpx.HTTPError:
+            ok, retryable = False, True
+        self.recorder.record(endpoint, (time.perf_counter() - started) * 1000, ok, timed_out)
+        return ok, retryable
+
+    async def send_chat(self, endpoint: str, payload: dict, server_id: int) -> None:
+        """Send one chat line, retrying with the same message_id like a Roblox server would"""
+        # Servers share the API key, so each names itself to get its own rate limit bucket
+        headers = {"X-Game-Server-Id": f"loadgen-{server_id}"}
+        for attempt in range(self.profile.max_retries + 1):
+            if attempt:
+                self.recorder.endpoints[endpoint].retries += 1
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+            ok, retryable = await self.request("POST", endpoint, headers=headers, json=payload)
+            if ok or not retryable:
+                return
+
+    def spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+
+async def game_server(traffic: Traffic, server_id: int, deadline: float, rng: random.Random) -> None:
+    """Open-loop chat traffic from one experience, alternating calm and burst phases"""
+    profile = traffic.profile
+    vocabulary = message_mix(
+        500, seed=server_id, pii_ratio=profile.pii_ratio,
+        toxic_ratio=profile.toxic_ratio, spam_ratio=profile.spam_ratio,
+    )
+    players = [(server_id * 10_000 + n, f"Srv{server_id}Player{n}") for n in range(profile.players_per_server)]
+    endpoints, weights = zip(*profile.endpoint_mix.items())
+    burst_until = 0.0
+
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            return
+        if now >= burst_until and rng.random() < profile.burst_chance / max(profile.calm_rate, 0.01):
+            burst_until = now + profile.burst_seconds
+        rate = profile.burst_rate if now < burst_until else profile.calm_rate
+        await asyncio.sleep(rng.expovariate(rate))
+
+        player_id, player_name = rng.choice(players)
+        payload = {
+            "message": rng.choice(vocabulary),
+            "message_id": f"load_{server_id}_{next(traffic.message_ids)}",
+            "player_id": player_id,
+            "player_name": player_name,
+        }
+        endpoint = rng.choices(endpoints, weights)[0]
+        traffic.spawn(traffic.send_chat(endpoint, payload, server_id))
+        if rng.random() < profile.duplicate_ratio:
+            traffic.spawn(traffic.send_chat(endpoint, dict(payload), server_id))
+
+
+async def dashboard(traffic: Traffic, endpoint: str, interval: float, deadline: float, rng: random.Random) -> None:
+    """Poll a dashboard endpoint like an open browser tab"""
+    next_poll = time.monotonic() + rng.uniform(0, interval)
+    while next_poll < deadline:
+        await asyncio.sleep(max(0.0, next_poll - time.monotonic()))
+        await traffic.request("GET", endpoint)
+        next_poll += interval
+
+
+async def run_stage(client: httpx.AsyncClient, profile: LoadProfile, servers: int, api_key: Optional[str]) -> StageReport:
+    traffic = Traffic(client, profile, api_key)
+    rng = random.Random(servers)
+    deadline = time.monotonic() + profile.stage_seconds
+    workers = [game_server(traffic, n, deadline, random.Random(rng.random())) for n in range(servers)]
+    for endpoint, interval in profile.poll_intervals.items():
+        workers += [
+            dashboard(traffic, endpoint, interval, deadline, random.Random(rng.random()))
+            for _ in range(profile.dashboards)
+        ]
+    started = time.monotonic()
+    await asyncio.gather(*workers)
+    if traffic.pending:
+        await asyncio.wait(set(traffic.pending))
+    return StageReport(servers, time.monotonic() - started, dict(traffic.recorder.endpoints))
+
+
+# ---------- Reporting ----------
+def slo_met(stats: EndpointStats, slo: SLO) -> bool:
+    if not stats.sent:
+        return True
+    return percentile(stats.latencies, 95) <= slo.p95_ms and stats.errors / stats.sent <= slo.max_error_rate
+
+
+def format_report(reports: List[StageReport], profile: LoadProfile) -> str:
+    header = f"{'servers':>8} {'endpoint':<18}{'sent':>7}{'req/s':>8}{'ok/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'err%':>7}{'t/o':>6}{'retry':>6}  SLO"
+    lines = [header, "-" * len(header)]
+    capacity: Dict[str, Optional[int]] = {endpoint: None for endpoint in CHAT_ENDPOINTS + DASHBOARD_ENDPOINTS}
+    saturated: Dict[str, int] = {}
+
+    for report in reports:
+        for endpoint in CHAT_ENDPOINTS + DASHBOARD_ENDPOINTS:
+            stats = report.endpoints.get(endpoint)
+            if not stats or not stats.sent:
+                continue
+            slo = profile.slos.get(endpoint, SLO(p95_ms=float("inf")))
+            met = slo_met(stats, slo)
+            if met and endpoint not in saturated:
+                capacity[endpoint] = report.servers
+            elif not met:
+                saturated.setdefault(endpoint, report.servers)
+            lines.append(
+                f"{report.servers:>8} {endpoint:<18}{stats.sent:>7}{stats.sent / report.seconds:>8.1f}{stats.ok / report.seconds:>8.1f}"
+                f"{percentile(stats.latencies, 50):>8.0f}{percentile(stats.latencies, 95):>8.0f}"
+                f"{percentile(stats.latencies, 99):>8.0f}{100 * stats.errors / stats.sent:>7.1f}"
+                f"{stats.timeouts:>6}{stats.retries:>6}  {'ok' if met else 'MISS'}"
+            )
+        lines.append("")
+
+    lines.append("Capacity (most concurrent servers meeting SLO, first saturated stage):")
+    for endpoint, servers in capacity.items():
+        slo = profile.slos.get(endpoint)
+        target = f"p95<={slo.p95_ms:.0f}ms err<={slo.max_error_rate:.0%}" if slo else "no SLO"
+        limit = saturated.get(endpoint)
+        lines.append(
+            f"  {endpoint:<18}{servers if servers is not None else '-':>6}"
+            f"  saturates at {limit if limit else 'n/a':>5}  ({target})"
+        )
+    return "\n".join(lines)
+
+
+# ---------- Entry Point ----------
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadgen", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", default="http://localhost:8000", help="base URL of the backend")
+    parser.add_argument("--offline", action="store_true", help="drive the in-process app with local stand-ins")
+    parser.add_argument("--api-key", default=os.getenv("ROBLOX_API_KEY"), help="X-API-Key for /api/analyze")
+    parser.add_argument("--stages", default="5,10,20,40", help="comma separated server counts")
+    parser.add_argument("--stage-seconds", type=float, default=60.0)
+    parser.add_argument("--players", type=int, default=30, help="players per server")
+    parser.add_argument("--calm-rate", type=float, default=0.5)
+    parser.add_argument("--burst-rate", type=float, default=6.0)
+    parser.add_argument("--dashboards", type=int, default=5)
+    parser.add_argument("--pii-ratio", type=float, default=0.03)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    return parser.parse_args(argv)
+
+
+def build_profile(args: argparse.Namespace) -> LoadProfile:
+    return LoadProfile(
+        stages=[int(n) for n in args.stages.split(",") if n.strip()],
+        stage_seconds=args.stage_seconds,
+        players_per_server=args.players,
+        calm_rate=args.calm_rate,
+        burst_rate=args.burst_rate,
+        dashboards=args.dashboards,
+        pii_ratio=args.pii_ratio,
+        duplicate_ratio=args.duplicate_ratio,
+        request_timeout=args.timeout,
+    )
+
+
+async def main(args: argparse.Namespace) -> int:
+    profile = build_profile(args)
+    async with AsyncExitStack() as stack:
+        if args.offline:
+            from .harness import offline_environment
+
+            stack.enter_context(offline_environment())
+            from app import app
+
+            transport = httpx.ASGITransport(app=app)
+            client = httpx.AsyncClient(transport=transport, base_url="http://loadgen")
+        else:
+            limits = httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+            client = httpx.AsyncClient(base_url=args.target, limits=limits)
+        await stack.enter_async_context(client)
+
+        reports = []
+        for servers in profile.stages:
+            print(f"stage: {servers} servers for {profile.stage_seconds:.0f}s", file=sys.stderr)
+            reports.append(await run_stage(client, profile, servers, args.api_key))
+
+    print(format_report(reports, profile))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(parse_args())))
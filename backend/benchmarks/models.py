@@ -0,0 +1,80 @@
+"""
+pydantic-ai FunctionModel stand-ins for PIIAgent, ModAgent and CommunityIntentAgent
+"""
+
+import asyncio
+import random
+from contextlib import ExitStack, contextmanager
+
+from pydantic_ai.messages import ModelMessage, ModelResponse, ToolCallPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from .corpus import PII_MARKERS, POSITIVE_MARKERS, TOXIC_MARKERS
+
+
+def _prompt(messages: list[ModelMessage]) -> str:
+    for message in reversed(messages):
+        for part in getattr(message, "parts", []):
+            if isinstance(part, UserPromptPart) and isinstance(part.content, str):
+                return part.content
+    return ""
+
+
+def _output(info: AgentInfo, args: dict) -> ModelResponse:
+    tool = info.output_tools[0]
+    properties = tool.parameters_json_schema.get("properties", {})
+    if set(properties) == {"response"} and "response" not in args:
+        args = {"response": args["value"]}
+    return ModelResponse(parts=[ToolCallPart(tool.name, args)])
+
+
+def _model(decide, latency_ms: float, error_rate: float, seed: int) -> FunctionModel:
+    rng = random.Random(seed)
+
+    async def respond(messages: list[ModelMessage], info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(max(0.0, rng.gauss(latency_ms, latency_ms / 4)) / 1000)
+        if rng.random() < error_rate:
+            raise RuntimeError("simulated Gemini failure")
+        return _output(info, decide(_prompt(messages).lower()))
+
+    return FunctionModel(respond)
+
+
+# ---------- Decision Rules ----------
+def pii_intent(text: str) -> dict:
+    return {"value": any(marker in text for marker in PII_MARKERS)}
+
+
+def moderation_action(text: str) -> dict:
+    if "destroy" in text:
+        return {"action": "KICK", "reason": "Threatening another player"}
+    return {"action": "WARNING", "reason": "Harassment toward other players"}
+
+
+def community_intent(text: str) -> dict:
+    if any(marker in text for marker in TOXIC_MARKERS):
+        return {"intent": "TOXICITY", "reason": "Insulting other players"}
+    if any(marker in text for marker in POSITIVE_MARKERS):
+        return {"intent": "HELPING", "reason": "Offering help to another player"}
+    return {"intent": None, "reason": None}
+
+
+@contextmanager
+def fake_agents(latency_ms: float = 250.0, error_rate: float = 0.0, seed: int = 13):
+    """Override the three Gemini agents with local FunctionModels"""
+    from agents.moderation import nodes as moderation_nodes
+    from agents.sentiment import nodes as sentiment_nodes
+
+    with ExitStack() as stack:
+        stack.enter_context(
+            moderation_nodes.get_pii_agent().override(model=_model(pii_intent, latency_ms, error_rate, seed))
+        )
+        stack.enter_context(
+            moderation_nodes.get_mod_agent().override(model=_model(moderation_action, latency_ms, error_rate, seed + 1))
+        )
+        stack.enter_context(
+            sentiment_nodes.get_community_intent_agent().override(
+                model=_model(community_intent, latency_ms, error_rate, seed + 2)
+            )
+        )
+        yield
@@ -0,0 +1,35 @@
+"""
+The app wired to the offline stand-ins, for serving from real server processes
+
+    BLOOM_WORKERS=4 gunicorn -c gunicorn.conf.py benchmarks.offline_server:app
+
+With gunicorn's preload the stand-ins start in the master and the workers inherit them:
+the fake HuggingFace server keeps running in the master like a remote service, while the
+patched URLs, Gemini overrides and in-memory Supabase are copied into every worker.
+Latencies in ms come from BLOOM_OFFLINE_HF_LATENCY, BLOOM_OFFLINE_GEMINI_LATENCY and
+BLOOM_OFFLINE_SUPABASE_LATENCY.
+"""
+
+import atexit
+import os
+from contextlib import ExitStack
+
+from .harness import OFFLINE_ENV, OfflineProfile, offline_environment
+from .hf_server import EndpointProfile
+
+for key, value in OFFLINE_ENV.items():
+    os.environ.setdefault(key, value)
+
+from app import app  # noqa: E402  (needs the placeholder credentials)
+
+_hf_latency = float(os.getenv("BLOOM_OFFLINE_HF_LATENCY", "40"))
+_profile = OfflineProfile(
+    hf=EndpointProfile(latency_ms=_hf_latency, jitter_ms=_hf_latency / 4),
+    gemini_latency_ms=float(os.getenv("BLOOM_OFFLINE_GEMINI_LATENCY", "250")),
+    supabase_latency_ms=float(os.getenv("BLOOM_OFFLINE_SUPABASE_LATENCY", "15")),
+)
+_stack = ExitStack()
+_stack.enter_context(offline_environment(_profile))
+atexit.register(_stack.close)
+
+__all__ = ["app"]
@@ -0,0 +1,101 @@
+"""
+Result statistics, baseline storage and regression checks
+"""
+
+import json
+import math
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Metrics where a higher value is a regression, and the one where lower is
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_METRIC = "throughput_rps"
+ALLOCATION_METRIC = "alloc_kib_per_op"
+# Process CPU time, so it includes the in-process HuggingFace and Supabase stand-ins
+CPU_METRIC = "cpu_ms_per_op"
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    iterations: int
+    concurrency: int
+    errors: int
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    alloc_kib_per_op: float
+    peak_kib: float
+    cpu_ms_per_op: float = 0.0
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def format_table(results: List[ScenarioResult]) -> str:
+    header = (
+        f"{'scenario':<28}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'KiB/op':>10}"
+        f"{'CPU ms/op':>11}{'errors':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.scenario:<28}{r.throughput_rps:>10.1f}{r.p50_ms:>10.1f}{r.p95_ms:>10.1f}"
+            f"{r.p99_ms:>10.1f}{r.alloc_kib_per_op:>10.1f}{r.cpu_ms_per_op:>11.2f}{r.errors:>8}"
+        )
+    return "\n".join(lines)
+
+
+# ---------- Baselines ----------
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, results: List[ScenarioResult]) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w") as f:
+        json.dump({r.scenario: asdict(r) for r in results}, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_baseline(name: str) -> Dict[str, dict]:
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(
+    results: List[ScenarioResult], baseline: Dict[str, dict], tolerance: float
+) -> List[str]:
+    """Describe every metric that moved past the tolerance in the wrong direction"""
+    regressions = []
+    for r in results:
+        base = baseline.get(r.scenario)
+        if not base:
+            continue
+        current = asdict(r)
+        for metric in LATENCY_METRICS + (ALLOCATION_METRIC, CPU_METRIC):
+            # Baselines recorded before a metric existed don't have it
+            if base.get(metric) and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{r.scenario}: {metric} {base[metric]:.1f} -> {current[metric]:.1f}"
+                )
+        if base[THROUGHPUT_METRIC] and current[THROUGHPUT_METRIC] < base[THROUGHPUT_METRIC] * (1 - tolerance):
+            regressions.append(
+                f"{r.scenario}: {THROUGHPUT_METRIC} {base[THROUGHPUT_METRIC]:.1f} -> {current[THROUGHPUT_METRIC]:.1f}"
+            )
+    return regressions
@@ -0,0 +1,89 @@
+"""
+Executes scenarios with bounded concurrency and collects latency and allocation figures
+"""
+
+import asyncio
+import time
+import tracemalloc
+from typing import List
+
+import httpx
+
+from .harness import OfflineEnvironment
+from .report import ScenarioResult, percentile
+from .scenarios import Operation, Scenario
+
+
+# Allocation tracking slows everything down, so it runs as a separate short pass
+ALLOCATION_SAMPLE = 25
+
+
+async def _timed_pass(op: Operation, iterations: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await op(i)
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(one(i) for i in range(iterations)))
+    return latencies, errors, time.perf_counter() - started, time.process_time() - cpu_started
+
+
+async def _allocation_pass(op: Operation, offset: int, count: int):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        for i in range(count):
+            try:
+                await op(offset + i)
+            except Exception:
+                pass
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    return grown / 1024 / count, peak / 1024
+
+
+async def run_scenario(
+    scenario: Scenario,
+    env: OfflineEnvironment,
+    iterations: int = None,
+    concurrency: int = None,
+) -> ScenarioResult:
+    """Warm up, then measure one scenario"""
+    from app import app
+
+    iterations = iterations or scenario.iterations
+    concurrency = concurrency or scenario.concurrency
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        op = scenario.build(env, client)
+        await _timed_pass(op, min(concurrency, iterations), concurrency)
+        latencies, errors, elapsed, cpu = await _timed_pass(op, iterations, concurrency)
+        alloc_per_op, peak = await _allocation_pass(op, iterations, min(ALLOCATION_SAMPLE, iterations))
+
+    return ScenarioResult(
+        scenario=scenario.name,
+        iterations=iterations,
+        concurrency=concurrency,
+        errors=errors,
+        throughput_rps=iterations / elapsed if elapsed else 0.0,
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        alloc_kib_per_op=alloc_per_op,
+        peak_kib=peak,
+        cpu_ms_per_op=cpu * 1000 / iterations,
+    )
@@ -0,0 +1,298 @@
+"""
+Multi-process scaling report
+
+Usage:
+    python -m benchmarks.scaling                         # gunicorn at 1, 2, 4, ... workers up to the core count
+    python -m benchmarks.scaling --workers 1,2,4,8 --seconds 20 --concurrency 64
+    python -m benchmarks.scaling --no-preload            # the same without preload_app, to compare memory
+    python -m benchmarks.scaling --pool-rows 2000000     # also time the shared-memory CPU pool
+
+Each step serves benchmarks.offline_server:app with gunicorn.conf.py and drives it with
+closed-loop /api/analyze traffic. Stand-in latencies default low, so the workers are
+CPU-bound and throughput shows how the pipeline scales with processes. Memory is read
+from /proc: PSS charges shared pages to each process sharing them, so the gap between a
+worker's RSS and its USS (private pages) is what copy-on-write sharing saves.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+from .corpus import message_mix
+from .report import percentile
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class StepResult:
+    workers: int
+    requests: int
+    errors: int
+    seconds: float
+    latencies_ms: List[float]
+    memory: Dict[str, float]  # MiB: worker RSS / PSS / USS averages, total PSS incl. master
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+
+# ---------- Server ----------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _smaps(pid: int) -> Dict[str, float]:
+    """Rss, Pss and private (USS) in MiB from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as handle:
+        for line in handle:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": values.get("Rss", 0.0),
+        "pss": values.get("Pss", 0.0),
+        "uss": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def _children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as handle:
+        return [int(child) for child in handle.read().split()]
+
+
+def memory_report(master: int) -> Dict[str, float]:
+    if not os.path.exists(f"/proc/{master}/smaps_rollup"):
+        return {}  # not Linux
+    workers = [_smaps(pid) for pid in _children(master)]
+    if not workers:
+        return {}
+    report = {
+        f"worker_{key}": sum(worker[key] for worker in workers) / len(workers) for key in ("rss", "pss", "uss")
+    }
+    report["total_pss"] = _smaps(master)["pss"] + sum(worker["pss"] for worker in workers)
+    return report
+
+
+def start_server(workers: int, port: int, args: argparse.Namespace, scratch: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BLOOM_WORKERS=str(workers),
+        BLOOM_BIND=f"127.0.0.1:{port}",
+        BLOOM_PRELOAD="0" if args.no_preload else "1",
+        BLOOM_OFFLINE_HF_LATENCY=str(args.hf_latency),
+        BLOOM_OFFLINE_GEMINI_LATENCY=str(args.gemini_latency),
+        BLOOM_OFFLINE_SUPABASE_LATENCY=str(args.supabase_latency),
+        # One client address sends everything, so per-server limits would cap the run
+        BLOOM_RATE_LIMIT_SERVER_RATE="0",
+        BLOOM_RATE_LIMIT_PLAYER_RATE="0",
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(scratch, f"prometheus-{workers}"),
+        LOG_LEVEL="WARNING",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "benchmarks.offline_server:app"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, workers: int, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    """Wait until every worker has booted, so the first seconds don't run on fewer"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {server.returncode}")
+        try:
+            if (await client.get("/api/health/live")).status_code == 200 and len(_children(server.pid)) >= workers:
+                await asyncio.sleep(1.0)  # startup hooks
+                return
+        except (httpx.HTTPError, OSError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("gunicorn didn't become ready")
+
+
+# ---------- Load ----------
+async def drive(client: httpx.AsyncClient, seconds: float, concurrency: int, seed: int = 17) -> StepResult:
+    """Closed-loop /api/analyze traffic: each of `concurrency` clients sends its next message on a reply"""
+    rng = random.Random(seed)
+    vocabulary = message_mix(500, seed=seed)
+    message_ids = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def session() -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            n = next(message_ids)
+            payload = {
+                "message": rng.choice(vocabulary),
+                "message_id": f"scale_{n}",
+                "player_id": rng.randrange(1, 2000),
+                "player_name": f"Player{n % 2000}",
+            }
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/analyze", json=payload)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(concurrency)))
+    return StepResult(0, len(latencies), errors, time.perf_counter() - started, latencies, {})
+
+
+async def run_step(workers: int, args: argparse.Namespace, scratch: str) -> StepResult:
+    port = _free_port()
+    server = start_server(workers, port, args, scratch)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30.0) as client:
+            await wait_ready(client, workers, server)
+            await drive(client, args.warmup, args.concurrency)
+            result = await drive(client, args.seconds, args.concurrency)
+            result.workers = workers
+            result.memory = memory_report(server.pid)
+            return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+# ---------- CPU Pool ----------
+def pool_report(rows: int, processes: List[int]) -> List[str]:
+    """Time the re-scoring steps inline and across the shared-memory pool"""
+    import numpy as np
+
+    from services.rescoring import INTENTS, MessageArrays, RescoreConfig, main_categories, rescore
+    from agents.moderation.nodes import CONTENT_LABELS
+    from utils.cpu_pool import CPUPool
+
+    rng = np.random.default_rng(5)
+    messages = MessageArrays(
+        message_ids=np.arange(rows).astype(object),
+        player_ids=rng.integers(1, 5000, rows),
+        stored_scores=rng.integers(-100, 100, rows).astype(np.int32),
+        sentiment_probs=rng.dirichlet([1, 1, 1], rows).astype(np.float32),
+        content_probs=rng.dirichlet([1] * len(CONTENT_LABELS), rows).astype(np.float32),
+        intents=rng.integers(-1, len(INTENTS), rows).astype(np.int8),
+    )
+    config = RescoreConfig()
+
+    lines = [f"{'processes':>9}  {'ms':>8}  {'speedup':>7}"]
+    baseline = None
+    for count in processes:
+        with CPUPool(count, min_rows=1) as pool:
+            pool.map_rows(main_categories, [messages.content_probs[:count]], np.int64)  # start the processes
+            started = time.perf_counter()
+            rescore(messages, config, pool)
+            pool.map_rows(main_categories, [messages.content_probs], np.int64)
+            elapsed = (time.perf_counter() - started) * 1000
+        baseline = baseline or elapsed
+        lines.append(f"{count:>9}  {elapsed:>8.1f}  {baseline / elapsed:>6.2f}x")
+    return lines
+
+
+# ---------- Report ----------
+def format_report(results: List[StepResult], args: argparse.Namespace) -> str:
+    cores = os.cpu_count() or 1
+    lines = [
+        f"gunicorn + uvicorn workers, preload {'off' if args.no_preload else 'on'}, {cores} cores, "
+        f"concurrency {args.concurrency}, {args.seconds:.0f}s per step",
+        f"{'workers':>7}  {'req/s':>8}  {'speedup':>7}  {'eff':>5}  {'p50 ms':>7}  {'p95 ms':>7}  {'errors':>6}  "
+        f"{'RSS':>6}  {'PSS':>6}  {'USS':>6}  {'total PSS':>9}",
+    ]
+    baseline: Optional[float] = None
+    for result in results:
+        baseline = baseline or result.throughput
+        speedup = result.throughput / baseline if baseline else 0.0
+        memory = result.memory
+        lines.append(
+            f"{result.workers:>7}  {result.throughput:>8.1f}  {speedup:>6.2f}x  {speedup / result.workers:>5.0%}  "
+            f"{percentile(result.latencies_ms, 50):>7.1f}  {percentile(result.latencies_ms, 95):>7.1f}  "
+            f"{result.errors:>6}  "
+            + (
+                f"{memory['worker_rss']:>6.0f}  {memory['worker_pss']:>6.0f}  {memory['worker_uss']:>6.0f}  "
+                f"{memory['total_pss']:>9.0f}" if memory else f"{'-':>6}  {'-':>6}  {'-':>6}  {'-':>9}"
+            )
+        )
+    lines.append("memory in MiB per worker (RSS, PSS, USS) and for the master plus all workers (total PSS)")
+    if args.workers is None and cores == 1:
+        lines.append("only one core available: steps beyond 1 worker share it and can't speed up")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.scaling", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", help="comma separated worker counts (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--seconds", type=float, default=15.0, help="measured seconds per step")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds per step")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+    parser.add_argument("--no-preload", action="store_true", help="let each worker import the app itself")
+    parser.add_argument("--hf-latency", type=float, default=5.0, help="mean HF latency in ms")
+    parser.add_argument("--gemini-latency", type=float, default=10.0, help="mean Gemini latency in ms")
+    parser.add_argument("--supabase-latency", type=float, default=1.0, help="Supabase round trip in ms")
+    parser.add_argument("--pool-rows", type=int, default=0, help="also time the CPU pool over this many messages")
+    return parser.parse_args(argv)
+
+
+def worker_counts(args: argparse.Namespace) -> List[int]:
+    if args.workers:
+        return [int(n) for n in args.workers.split(",") if n.strip()]
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    if cores == 1:
+        counts.append(2)  # still shows what sharing costs per extra worker
+    return counts
+
+
+async def main(args: argparse.Namespace) -> int:
+    counts = worker_counts(args)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bloom-scaling-") as scratch:
+        for workers in counts:
+            print(f"step: {workers} workers", file=sys.stderr)
+            results.append(await run_step(workers, args, scratch))
+    print(format_report(results, args))
+
+    if args.pool_rows:
+        print(f"\nre-scoring {args.pool_rows} messages across the shared-memory CPU pool")
+        print("\n".join(pool_report(args.pool_rows, counts)))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    sys.exit(asyncio.run(main(parse_args())))
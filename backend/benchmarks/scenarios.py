@@ -0,0 +1,169 @@
+"""
+Benchmark scenarios driving the pipelines directly and through the FastAPI routes
+"""
+
+import itertools
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict
+
+import httpx
+
+from .corpus import SPLIT_PII_CONVERSATIONS, SPLIT_PII_LOOKALIKES, message_mix
+from .harness import OfflineEnvironment
+
+
+Operation = Callable[[int], Awaitable[None]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    build: Callable[[OfflineEnvironment, httpx.AsyncClient], Operation]
+    iterations: int = 200
+    concurrency: int = 16
+
+
+MESSAGES = message_mix(1000)
+
+
+def _chat_payload(i: int) -> dict:
+    return {
+        "message": MESSAGES[i % len(MESSAGES)],
+        "message_id": f"bench_{i}",
+        "player_id": i % 97 + 1,
+        "player_name": f"BenchPlayer{i % 97 + 1}",
+    }
+
+
+def seed_messages(env: OfflineEnvironment, count: int = 5000) -> None:
+    """Fill the in-memory Supabase with players and messages for read scenarios"""
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    players = env.db.tables.setdefault("players", {})
+    messages = env.db.tables.setdefault("messages", {})
+    for i in range(count):
+        payload = _chat_payload(i)
+        players[payload["player_id"]] = {
+            "player_id": payload["player_id"],
+            "player_name": payload["player_name"],
+            "last_seen": start.isoformat(),
+        }
+        messages[f"seed_{i}"] = {
+            "message_id": f"seed_{i}",
+            "player_id": payload["player_id"],
+            "message": payload["message"],
+            "sentiment_score": (i * 37) % 200 - 100,
+            "created_at": (start + timedelta(milliseconds=i * 500)).isoformat(),
+        }
+
+
+# ---------- Pipeline Scenarios ----------
+def _moderate_message(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+    from agents.moderation import ChatMessage, moderate_message
+
+    async def op(i: int) -> None:
+        await moderate_message(ChatMessage(**_chat_payload(i)))
+
+    return op
+
+
+def _analyze_message_sentiment(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+    from agents.sentiment import ChatMessage, analyze_message_sentiment
+
+    async def op(i: int) -> None:
+        await analyze_message_sentiment(ChatMessage(**_chat_payload(i)))
+
+    return op
+
+
+# ---------- Route Scenarios ----------
+def _post(path: str, fresh_ids: bool = True):
+    counter = itertools.count()
+
+    def build(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+        async def op(i: int) -> None:
+            payload = _chat_payload(next(counter) if fresh_ids else i)
+            response = await client.post(path, json=payload)
+            response.raise_for_status()
+
+        return op
+
+    return build
+
+
+def _get(path: str, params: dict = None, cached: bool = True):
+    def build(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+        from utils.cache import response_cache
+
+        seed_messages(env)
+
+        async def op(i: int) -> None:
+            if not cached:
+                # Every request loads and encodes, as when chat writes keep invalidating
+                response_cache.clear()
+            response = await client.get(path, params=params)
+            response.raise_for_status()
+
+        return op
+
+    return build
+
+
+def _get_flagged(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+    from routes.chat import _store_flag, flagged_messages
+
+    seed_messages(env, 500)
+    flagged_messages.clear()
+    for row in env.db.tables["messages"].values():
+        _store_flag(row, "Benchmark flag")
+
+    async def op(i: int) -> None:
+        response = await client.get("/api/flagged", params={"limit": 200})
+        response.raise_for_status()
+
+    return op
+
+
+def _pii_window(env: OfflineEnvironment, client: httpx.AsyncClient) -> Operation:
+    from utils.pii_window import PIIWindow
+
+    window = PIIWindow()
+    conversations = SPLIT_PII_CONVERSATIONS + SPLIT_PII_LOOKALIKES
+    players = itertools.count(1)
+
+    async def op(i: int) -> None:
+        # Misses and false positives both raise, so they show up in the errors column
+        lines, expected = conversations[i % len(conversations)]
+        player_id = next(players)
+        verdict = None
+        for line in lines:
+            verdict = window.check(player_id, None, line)
+        if verdict != expected:
+            raise AssertionError(f"{lines!r}: expected {expected}, got {verdict}")
+
+    return op
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("moderate_message", "Moderation graph called directly", _moderate_message),
+        Scenario("analyze_message_sentiment", "Sentiment graph called directly", _analyze_message_sentiment),
+        Scenario("api_moderate", "POST /api/moderate", _post("/api/moderate")),
+        Scenario("api_analyze", "POST /api/analyze with fresh message_ids", _post("/api/analyze")),
+        Scenario("api_analyze_retries", "POST /api/analyze re-sending message_ids", _post("/api/analyze", fresh_ids=False)),
+        Scenario("api_live", "GET /api/live", _get("/api/live"), iterations=500, concurrency=8),
+        Scenario(
+            "api_live_uncached", "GET /api/live?limit=200 loading and encoding every time",
+            _get("/api/live", {"limit": 200}, cached=False), iterations=300, concurrency=8,
+        ),
+        Scenario("api_flagged", "GET /api/flagged?limit=200", _get_flagged, iterations=300, concurrency=8),
+        Scenario("api_messages", "GET /api/messages", _get("/api/messages"), iterations=300, concurrency=8),
+        Scenario("api_top_players", "GET /api/top-players", _get("/api/top-players"), iterations=300, concurrency=8),
+        Scenario(
+            "pii_window", "Split-PII window over split PII and lookalike chat; errors are misclassifications",
+            _pii_window, iterations=2000, concurrency=1,
+        ),
+    ]
+}
@@ -0,0 +1,342 @@
+"""
+In-memory stand-in for the Supabase client
+Implements the subset of the postgrest query builder and RPCs the backend uses
+"""
+
+import copy
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+
+PRIMARY_KEYS = {"players": "player_id", "messages": "message_id", "player_scores": "player_id"}
+
+
+@dataclass
+class StubResponse:
+    data: Any
+    count: Optional[int] = None
+
+
+class StubAPIError(Exception):
+    """Raised where PostgREST would return an error, e.g. duplicate primary keys"""
+
+
+def _compare(op: str, value: Any, target: Any) -> bool:
+    if op == "is":
+        return value is None if target in (None, "null") else value == target
+    if value is None:
+        return False
+    if op == "eq":
+        return str(value) == str(target)
+    if op == "neq":
+        return str(value) != str(target)
+    if op == "in":
+        return str(value) in {str(t) for t in target}
+    if isinstance(value, (int, float)) and not isinstance(target, (int, float)):
+        target = type(value)(target)
+    return {
+        "gt": value > target,
+        "gte": value >= target,
+        "lt": value < target,
+        "lte": value <= target,
+    }[op]
+
+
+# ---------- Logic Filters ----------
+def _split_top_level(expression: str) -> List[str]:
+    """Split a PostgREST logic expression on commas outside quotes and parentheses"""
+    parts, current, depth, quoted, escaped = [], [], 0, False, False
+    for char in expression:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\" and quoted:
+            current.append(char)
+            escaped = True
+        elif char == '"':
+            current.append(char)
+            quoted = not quoted
+        elif char == "(" and not quoted:
+            depth += 1
+            current.append(char)
+        elif char == ")" and not quoted:
+            depth -= 1
+            current.append(char)
+        elif char == "," and not quoted and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return value
+
+
+def _logic_filter(expression: str) -> Callable[[dict], bool]:
+    """Compile `a.op.v,and(b.op.v,...)` style expressions into a row predicate"""
+    checks = []
+    for term in _split_top_level(expression):
+        term = term.strip()
+        for combinator, combine in (("and(", all), ("or(", any)):
+            if term.startswith(combinator) and term.endswith(")"):
+                inner = [_logic_filter(part) for part in _split_top_level(term[len(combinator):-1])]
+                checks.append(lambda row, inner=inner, combine=combine: combine(c(row) for c in inner))
+                break
+        else:
+            column, op, value = term.split(".", 2)
+            checks.append(lambda row, column=column, op=op, value=_unquote(value): _compare(op, row.get(column), value))
+    return lambda row: any(check(row) for check in checks)
+
+
+class StubQuery:
+    def __init__(self, db: "InMemorySupabase", table: str):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload: Any = None
+        self._filters: List[Callable[[dict], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+        self._count: Optional[str] = None
+
+    # ----- operations -----
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "StubQuery":
+        self._op, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, data: Any) -> "StubQuery":
+        self._op, self._payload = "insert", data
+        return self
+
+    def upsert(self, data: Any, **_: Any) -> "StubQuery":
+        self._op, self._payload = "upsert", data
+        return self
+
+    def update(self, data: dict) -> "StubQuery":
+        self._op, self._payload = "update", data
+        return self
+
+    def delete(self) -> "StubQuery":
+        self._op = "delete"
+        return self
+
+    # ----- filters -----
+    def _filter(self, column: str, op: str, target: Any) -> "StubQuery":
+        self._filters.append(lambda row: _compare(op, row.get(column), target))
+        return self
+
+    def eq(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "lte", value)
+
+    def in_(self, column: str, values: List[Any]) -> "StubQuery":
+        return self._filter(column, "in", list(values))
+
+    def is_(self, column: str, value: Any) -> "StubQuery":
+        return self._filter(column, "is", value)
+
+    def or_(self, filters: str) -> "StubQuery":
+        self._filters.append(_logic_filter(filters))
+        return self
+
+    def order(self, column: str, desc: bool = False, **_: Any) -> "StubQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> "StubQuery":
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int) -> "StubQuery":
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    # ----- execution -----
+    def _matches(self, row: dict) -> bool:
+        return all(check(row) for check in self._filters)
+
+    def _project(self, row: dict) -> dict:
+        if self._columns.strip() == "*":
+            return dict(row)
+        columns = [column.strip() for column in self._columns.split(",")]
+        return {column: row.get(column) for column in columns}
+
+    def execute(self) -> StubResponse:
+        self._db.simulate_latency()
+        with self._db.lock:
+            rows = self._db.tables.setdefault(self._table, {})
+            if self._op == "select":
+                return self._select(rows)
+            if self._op in ("insert", "upsert"):
+                return self._write(rows)
+            if self._op == "update":
+                updated = []
+                for row in rows.values():
+                    if self._matches(row):
+                        row.update(self._payload)
+                        updated.append(dict(row))
+                return StubResponse(data=updated)
+            deleted = [key for key, row in rows.items() if self._matches(row)]
+            return StubResponse(data=[rows.pop(key) for key in deleted])
+
+    def _select(self, rows: Dict[Any, dict]) -> StubResponse:
+        result = [row for row in rows.values() if self._matches(row)]
+        for column, desc in reversed(self._order):
+            result.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        total = len(result)
+        end = None if self._limit is None else self._offset + self._limit
+        result = result[self._offset:end]
+        return StubResponse(
+            data=[self._project(row) for row in result],
+            count=total if self._count else None,
+        )
+
+    def _write(self, rows: Dict[Any, dict]) -> StubResponse:
+        key_column = PRIMARY_KEYS.get(self._table, "id")
+        payload = self._payload if isinstance(self._payload, list) else [self._payload]
+        written = []
+        for record in payload:
+            key = record.get(key_column)
+            if key is None:
+                key = len(rows) + 1
+                record = {key_column: key, **record}
+            if key in rows:
+                if self._op == "insert":
+                    raise StubAPIError(f"duplicate key value violates unique constraint on {self._table}")
+                rows[key].update(copy.deepcopy(record))
+            else:
+                rows[key] = copy.deepcopy(record)
+            written.append(dict(rows[key]))
+        return StubResponse(data=written)
+
+
+class StubRPC:
+    def __init__(self, db: "InMemorySupabase", name: str, params: dict):
+        self._db, self._name, self._params = db, name, params
+
+    def execute(self) -> StubResponse:
+        self._db.simulate_latency()
+        with self._db.lock:
+            return StubResponse(data=self._db.rpcs[self._name](self._db, self._params or {}))
+
+
+# ---------- RPC Implementations ----------
+def _get_live_messages(db: "InMemorySupabase", params: dict) -> List[dict]:
+    players = db.tables.get("players", {})
+    messages = sorted(
+        db.tables.get("messages", {}).values(),
+        key=lambda row: row.get("created_at") or "",
+        reverse=True,
+    )[: params.get("p_limit", 20)]
+    return [
+        {**row, "player_name": players.get(row.get("player_id"), {}).get("player_name")}
+        for row in messages
+    ]
+
+
+def _get_top_players_by_sentiment(db: "InMemorySupabase", params: dict) -> List[dict]:
+    totals: Dict[Any, dict] = {}
+    players = db.tables.get("players", {})
+    for row in db.tables.get("messages", {}).values():
+        player_id = row.get("player_id")
+        entry = totals.setdefault(player_id, {
+            "player_id": player_id,
+            "player_name": players.get(player_id, {}).get("player_name"),
+            "total_sentiment_score": 0,
+            "message_count": 0,
+        })
+        entry["total_sentiment_score"] += row.get("sentiment_score") or 0
+        entry["message_count"] += 1
+    ranked = sorted(totals.values(), key=lambda entry: entry["total_sentiment_score"], reverse=True)
+    return ranked[: params.get("p_limit", 10)]
+
+
+def _merge_player_scores(db: "InMemorySupabase", params: dict) -> bool:
+    batches = db.tables.setdefault("player_score_batches", {})
+    if params["p_batch_id"] in batches:
+        return False
+    batches[params["p_batch_id"]] = {"batch_id": params["p_batch_id"]}
+    scores = db.tables.setdefault("player_scores", {})
+    now = datetime.now(timezone.utc).isoformat()
+    for player_id, delta, name in zip(params["p_player_ids"], params["p_deltas"], params["p_names"]):
+        row = scores.setdefault(player_id, {"player_id": player_id, "player_name": None, "score": 0})
+        row["score"] += delta
+        row["player_name"] = name or row["player_name"]
+        row["updated_at"] = now
+    return True
+
+
+ROLLUP_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def _merge_moderation_rollups(db: "InMemorySupabase", params: dict) -> bool:
+    batches = db.tables.setdefault("moderation_rollup_batches", {})
+    if params["p_batch_id"] in batches:
+        return False
+    batches[params["p_batch_id"]] = {"batch_id": params["p_batch_id"]}
+    rollups = db.tables.setdefault("moderation_rollups", {})
+    rows = zip(params["p_buckets"], params["p_dimensions"], params["p_keys"], params["p_counts"], params["p_totals"])
+    for bucket, dimension, key, count, total in rows:
+        epoch = int(datetime.fromisoformat(bucket).timestamp())
+        for granularity, seconds in ROLLUP_SECONDS.items():
+            start = datetime.fromtimestamp(epoch // seconds * seconds, timezone.utc).isoformat()
+            row = rollups.setdefault((granularity, start, dimension, key), {
+                "granularity": granularity, "bucket": start, "dimension": dimension, "key": key, "count": 0, "total": 0,
+            })
+            row["count"] += count
+            row["total"] += total
+    return True
+
+
+DEFAULT_RPCS = {
+    "get_live_messages": _get_live_messages,
+    "get_top_players_by_sentiment": _get_top_players_by_sentiment,
+    "merge_player_scores": _merge_player_scores,
+    "merge_moderation_rollups": _merge_moderation_rollups,
+}
+
+
+class InMemorySupabase:
+    """Drop-in for supabase.Client backed by dicts, with optional simulated round-trip latency"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.tables: Dict[str, Dict[Any, dict]] = {}
+        self.rpcs: Dict[str, Callable] = dict(DEFAULT_RPCS)
+        self.lock = threading.RLock()
+        self.queries = 0
+
+    def simulate_latency(self) -> None:
+        self.queries += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def table(self, name: str) -> StubQuery:
+        return StubQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> StubRPC:
+        return StubRPC(self, name, params)
@@ -0,0 +1,56 @@
+"""
+Multi-process serving with gunicorn and uvicorn workers
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports the app and the packages behind its lazy clients once, then forks
+the workers, so code, module-level tables and the interpreter heap are shared between
+workers copy-on-write instead of loaded per worker. Anything that holds sockets,
+threads or locks (the Supabase client, the Gemini agents, the score store slot, the log
+listener, background tasks) is still built in each worker after the fork.
+"""
+
+import gc
+import glob
+import os
+import tempfile
+
+
+# ---------- Configuration ----------
+bind = os.getenv("BLOOM_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("BLOOM_WORKERS", "0")) or os.cpu_count() or 1
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("BLOOM_PRELOAD", "1").lower() in ("1", "true", "yes")
+timeout = int(os.getenv("BLOOM_WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Workers write their metrics to files here and /metrics sums them. prometheus_client
+# picks the mode at import, so this is set before the app is preloaded.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "bloom-prometheus"))
+_metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+os.makedirs(_metrics_dir, exist_ok=True)
+# Files left by a previous run would be added to this one's totals
+for _path in glob.glob(os.path.join(_metrics_dir, "*.db")):
+    os.remove(_path)
+
+
+def on_starting(server):
+    if not server.cfg.preload_app:
+        return
+    from utils.warmup import preload_modules
+
+    server.log.info(f"Preloaded client packages in {preload_modules() * 1000:.0f} ms")
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach: a collection in a worker
+    # would otherwise write to every object header and unshare the pages holding them
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (in-flight runs and calls) from the totals
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,7 @@
+-- Keyset pagination for /api/messages orders by (created_at, message_id) descending,
+-- optionally filtered by player_id; these indexes keep every page an index range scan.
+create index if not exists messages_created_at_message_id_idx
+    on messages (created_at desc, message_id desc);
+
+create index if not exists messages_player_created_at_message_id_idx
+    on messages (player_id, created_at desc, message_id desc);
@@ -0,0 +1,23 @@
+-- Raw model outputs stored with each message so scores can be recomputed offline
+-- (services/rescoring.py) when thresholds, reward points or category policy change.
+-- sentiment_probs: [negative, neutral, positive]            (SENTIMENT_LABELS)
+-- content_probs:   [OK, S, H, V, HR, SH, S3, H2, V2]         (CONTENT_LABELS)
+alter table messages
+    add column if not exists sentiment_probs real[],
+    add column if not exists content_probs real[],
+    add column if not exists community_intent text;
+
+-- Bulk write-back for re-scored sentiment, one round trip per batch
+create or replace function apply_sentiment_scores(p_message_ids text[], p_scores integer[])
+returns integer
+language sql
+as $$
+    with updated as (
+        update messages m
+        set sentiment_score = s.score
+        from unnest(p_message_ids, p_scores) as s(message_id, score)
+        where m.message_id = s.message_id
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
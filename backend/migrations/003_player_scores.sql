@@ -0,0 +1,46 @@
+-- Durable reward scores shared by all workers (services/score_store.py).
+-- Workers keep unmerged deltas in a local log and push them here every few seconds.
+create table if not exists player_scores (
+    player_id bigint primary key,
+    player_name text,
+    score bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists player_scores_updated_at_idx on player_scores (updated_at);
+
+-- Batch IDs already applied, so a merge retried after a lost response isn't counted twice.
+-- Workers pick a random ID per batch and log it, so IDs never repeat across restarts.
+create table if not exists player_score_batches (
+    batch_id text primary key,
+    applied_at timestamptz not null default now()
+);
+
+create or replace function merge_player_scores(
+    p_batch_id text,
+    p_player_ids bigint[],
+    p_deltas bigint[],
+    p_names text[]
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    insert into player_score_batches (batch_id) values (p_batch_id) on conflict do nothing;
+    if not found then
+        return false;
+    end if;
+
+    insert into player_scores as s (player_id, player_name, score)
+    select u.player_id, u.player_name, u.delta
+    from unnest(p_player_ids, p_names, p_deltas) as u(player_id, player_name, delta)
+    on conflict (player_id) do update
+        set score = s.score + excluded.score,
+            player_name = coalesce(excluded.player_name, s.player_name),
+            updated_at = now();
+
+    -- A resend comes from the next merge or the next startup, so a day of batch IDs is kept
+    delete from player_score_batches where applied_at < now() - interval '1 day';
+    return true;
+end;
+$$;
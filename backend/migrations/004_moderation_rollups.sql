@@ -0,0 +1,54 @@
+-- Time-bucketed moderation and sentiment counts (services/analytics.py).
+-- Workers count verdicts per minute in memory and add them here every few seconds; each
+-- minute is also folded into its hour and day, so /api/analytics/moderation reads one
+-- row per bucket and key at any interval instead of scanning messages.
+create table if not exists moderation_rollups (
+    granularity text not null check (granularity in ('minute', 'hour', 'day')),
+    bucket timestamptz not null,
+    dimension text not null,   -- messages, action, category, pii_type, intent, sentiment, points
+    key text not null,         -- e.g. BAN, H, EMAIL, HELPING, or the sentiment bin's lower bound
+    count bigint not null default 0,
+    total bigint not null default 0,  -- sum of sentiment scores or reward points
+    primary key (granularity, bucket, dimension, key)
+);
+
+-- Batch IDs already applied, so a flush retried after a lost response isn't counted twice
+create table if not exists moderation_rollup_batches (
+    batch_id text primary key,
+    applied_at timestamptz not null default now()
+);
+
+-- Minute buckets are kept for a week and hour buckets for 90 days; days are kept
+create or replace function merge_moderation_rollups(
+    p_batch_id text,
+    p_buckets timestamptz[],
+    p_dimensions text[],
+    p_keys text[],
+    p_counts bigint[],
+    p_totals bigint[]
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    insert into moderation_rollup_batches (batch_id) values (p_batch_id) on conflict do nothing;
+    if not found then
+        return false;
+    end if;
+
+    insert into moderation_rollups as r (granularity, bucket, dimension, key, count, total)
+    select g.granularity, date_trunc(g.granularity, u.bucket), u.dimension, u.key, sum(u.count), sum(u.total)
+    from unnest(p_buckets, p_dimensions, p_keys, p_counts, p_totals) as u(bucket, dimension, key, count, total)
+    cross join (values ('minute'), ('hour'), ('day')) as g(granularity)
+    group by 1, 2, 3, 4
+    on conflict (granularity, bucket, dimension, key) do update
+        set count = r.count + excluded.count,
+            total = r.total + excluded.total;
+
+    delete from moderation_rollups
+    where (granularity = 'minute' and bucket < now() - interval '7 days')
+       or (granularity = 'hour' and bucket < now() - interval '90 days');
+    delete from moderation_rollup_batches where applied_at < now() - interval '1 day';
+    return true;
+end;
+$$;
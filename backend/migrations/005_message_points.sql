@@ -0,0 +1,5 @@
+-- Reward points each message earned, written with the message by the chat routes.
+-- The resume worker (services/resume.py) awards points only by setting this column
+-- where it is still null, so a message never earns its points twice.
+alter table messages
+    add column if not exists points_awarded integer;
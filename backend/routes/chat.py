@@ -1,33 +1,45 @@
+import asyncio
+import contextvars
+import queue
 import random
+import threading
+import time
 import logging
-import os
-from fastapi import APIRouter, HTTPException, Request, Depends
+from concurrent.futures import ThreadPoolExecutor
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Request, Response, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple
 from datetime import datetime, timezone
 
-from agents.moderation import ChatMessage, ModerationState
+from agents.moderation import ChatMessage, ModerationResult, ModerationState
+from agents.moderation.state import ActionType
 from agents.sentiment.state import ChatAnalysis
 from services.chat import ChatService
+from services.presence import PRESENCE_FLUSH_INTERVAL, presence_tracker
 from services.sentiment import SentimentService
-from routes.data import supabase
+from utils.cache import response_cache
+from utils.db import get_supabase
+from utils.health import READY_MAX_QUEUE, READY_MAX_THREADPOOL, READY_MAX_WAITING, health_monitor, usage
+from utils.logs import get_debug_logger, queue_usage
+from utils.idempotency import IDEMPOTENT_REPLAY_HEADER, IdempotencyStore, request_fingerprint
+from utils.message_cache import MESSAGE_LOAD_BATCH_SIZE, message_cache
+from utils.dependencies import (
+    ROBLOX_API_KEYS, content_columns, moderation_columns, reward_columns, sentiment_columns, verify_api_key
+)
+from utils.graph_state import RunInProgress
+from utils.metrics import execute_query
+from utils.rate_limit import ANALYSIS_MODE_HEADER, admit, client_key, player_limiter, server_limiter
+from utils.serialization import FastJSONResponse, dumps
+from utils.spam import spam_detector
+from utils.usage import bind_usage, record_message
 
 router = APIRouter(prefix="/api", tags=["chat"])
 chat_service = ChatService()
 sentiment_service = SentimentService()
 logger = logging.getLogger(__name__)
-
-# API Key configuration
-ROBLOX_API_KEY = os.getenv("ROBLOX_API_KEY")
-
-
-# API Key verification function
-async def verify_api_key(request: Request):
-    if ROBLOX_API_KEY:
-        api_key = request.headers.get('X-API-Key')
-        if not api_key or api_key != ROBLOX_API_KEY:
-            raise HTTPException(status_code=401, detail="Unauthorized")
-
+debug_logger = get_debug_logger(__name__)
 
 # Pydantic models for request/response
 class AnalyzeRequest(BaseModel):
@@ -42,19 +54,79 @@ class FlagRequest(BaseModel):
     reason: Optional[str] = "User flagged"
 
 
+class FlagBatchRequest(BaseModel):
+    message_ids: List[str]
+    reason: Optional[str] = "User flagged"
+
+
+class BulkActionRequest(BaseModel):
+    """Moderator action on many messages, chosen by ID or by player and time range"""
+    action: Literal["flag", "resolve", "delete", "moderation_action"]
+    message_ids: Optional[List[str]] = None
+    player_id: Optional[int] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    reason: Optional[str] = "Moderator action"
+    moderation_action: Optional[ActionType] = None  # required for action=moderation_action
+
+
 # Response models
 class ModerationResponse(BaseModel):
-    moderation_state: ModerationState
+    moderation_state: ModerationResult
 
 
 # In-memory storage for flagged messages and moderation results
 flagged_messages = {}
 moderation_results = {}  # Store moderation results by message_id
 
+# Game servers retry /analyze with the same message_id on timeouts
+analyze_idempotency = IdempotencyStore("analyze")
+# What analyze_idempotency holds per message_id: the analysis and the moderation verdict
+StoredAnalysis = Tuple[ChatAnalysis, Optional[ModerationState]]
+
+# Accept values that switch /analyze to streaming its results as they are ready
+STREAM_MEDIA_TYPES = ("application/x-ndjson", "text/event-stream")
+# Streamed analyses run here, detached from the response, so a client that hangs up
+# after the moderation verdict still gets its message stored
+STREAM_MAX_WORKERS = 40
+_stream_executor = ThreadPoolExecutor(max_workers=STREAM_MAX_WORKERS, thread_name_prefix="analyze-stream")
+# Streamed analyses submitted and not yet finished, running or waiting for a worker
+_stream_jobs = 0
+_stream_jobs_lock = threading.Lock()
+
+
+def _count_stream_job(delta: int) -> None:
+    global _stream_jobs
+    with _stream_jobs_lock:
+        _stream_jobs += delta
+
+
+def _rate_limit(http_request: Request, response: Response, player_id: Optional[int]) -> bool:
+    """Apply ingestion rate limits; True means analyse locally without paid calls"""
+    # Remote calls made for this request are billed to the endpoint and game server
+    api_key = client_key(http_request)
+    bind_usage(http_request.url.path, api_key if api_key in ROBLOX_API_KEYS else None)
+    local_only = admit(http_request, player_id)
+    if local_only:
+        response.headers[ANALYSIS_MODE_HEADER] = "local-only"
+    return local_only
+
+
+def _check_spam(response: Response, request) -> Optional[str]:
+    """Tag flood and near-duplicate spam before any remote call; returns the reason"""
+    spam_reason = spam_detector.check(request.player_id, request.message_id, request.message)
+    if spam_reason:
+        response.headers[ANALYSIS_MODE_HEADER] = "spam"
+    return spam_reason
+
 
 @router.post("/moderate", response_model=ModerationResponse)
-def moderate_message(request: ChatMessage):
+def moderate_message(request: ChatMessage, http_request: Request, response: Response):
     """Moderation endpoint with database updates"""
+    local_only = _rate_limit(http_request, response, request.player_id)
+    # Spam is moderated locally; its SPAM tag comes from the sentiment pipeline
+    local_only = bool(_check_spam(response, request)) or local_only
+    
     # Generate random values if not provided
     player_id = request.player_id if request.player_id is not None else random.randint(1, 100)
     player_name = request.player_name if request.player_name is not None else f"Player{random.randint(1, 999)}"
@@ -69,34 +141,24 @@ def moderate_message(request: ChatMessage):
     
     # Run moderation (this will be run in threadpool)
     import asyncio
-    moderation_state = asyncio.run(chat_service.moderate_message(chat_message))
+    record_message()
+    moderation_state = asyncio.run(chat_service.moderate_message(chat_message, local_only))
     
     # Store moderation results in both database and memory
-    if moderation_state.recommended_action:
-        # Build reason
-        reason_parts = []
-        if moderation_state.pii_result and moderation_state.pii_result.pii_presence:
-            pii_type = moderation_state.pii_result.pii_type.value if moderation_state.pii_result.pii_type else "Unknown"
-            reason_parts.append(f"Detected {pii_type}")
-        if moderation_state.content_result and moderation_state.content_result.main_category.value != "OK":
-            reason_parts.append(f"Harmful content: {moderation_state.content_result.main_category.value}")
-        if not reason_parts:
-            reason_parts.append(moderation_state.recommended_action.reason)
-        
-        comprehensive_reason = "; ".join(reason_parts)
-        
-        # Update database
-        update_data = {
-            "moderation_action": moderation_state.recommended_action.action.value,
-            "moderation_reason": comprehensive_reason
-        }
-        supabase.table('messages').update(update_data).eq('message_id', request.message_id).execute()
-        
+    action_data = moderation_columns(moderation_state)
+    update_data = {**content_columns(moderation_state), **action_data}
+    if action_data:
         # ALSO store in memory for live feed
-        moderation_results[request.message_id] = {
-            "moderation_action": moderation_state.recommended_action.action.value,
-            "moderation_reason": comprehensive_reason
-        }
+        moderation_results[request.message_id] = action_data
+    
+    if update_data:
+        updated = execute_query(
+            get_supabase().table('messages').update(update_data).eq('message_id', request.message_id),
+            'messages', 'update'
+        )
+        message_cache.written(request.message_id, updated.data)
+    if action_data:
+        response_cache.invalidate("messages")
         logger.info(f"Stored moderation result in database and memory for {request.message_id}: {moderation_state.recommended_action.action.value}")
     
     return ModerationResponse(moderation_state=moderation_state)
@@ -105,9 +167,154 @@ def moderate_message(request: ChatMessage):
 @router.post("/analyze", response_model=ChatAnalysis)
 def analyze_sentiment_and_create_message(
     request: AnalyzeRequest,
+    http_request: Request,
+    response: Response,
     _: None = Depends(verify_api_key)
 ):
-    """Analyze endpoint that creates new messages and optionally runs moderation"""
+    """
+    Analyze endpoint that creates new messages and optionally runs moderation
+
+    Requests carrying a message_id are idempotent: concurrent duplicates wait for the
+    first run and later retries replay its result with an Idempotent-Replayed header.
+    Replays are answered before the rate limits and the spam check, so retries cost no
+    tokens and keep their original verdict.
+    Over the player rate limit the message is still stored, but analysed locally;
+    flood and near-duplicate spam is stored tagged SPAM without any remote call.
+
+    With Accept: application/x-ndjson or text/event-stream the response streams a
+    "moderation" event as soon as the verdict is in, then "analysis" and "stored".
+    """
+    accept = http_request.headers.get("accept", "")
+    media_type = next((media for media in STREAM_MEDIA_TYPES if media in accept), None)
+
+    stored = _stored_analysis(request)
+    if stored is not None:
+        response.headers[IDEMPOTENT_REPLAY_HEADER] = "true"
+        if media_type:
+            return _stream_analysis(lambda emit: (stored, True), media_type, response)
+        return stored[0]
+
+    local_only = _rate_limit(http_request, response, request.player_id)
+    spam_reason = _check_spam(response, request)
+    if media_type:
+        return _stream_analysis(
+            lambda emit: _analyze_once(request, local_only, spam_reason, emit), media_type, response
+        )
+
+    (analysis, _), replayed = _analyze_once(request, local_only, spam_reason)
+    if replayed:
+        response.headers[IDEMPOTENT_REPLAY_HEADER] = "true"
+    return analysis
+
+
+def _stored_analysis(request: AnalyzeRequest) -> Optional[StoredAnalysis]:
+    """Result of an earlier or in-flight run of the same message_id, if there is one"""
+    if request.message_id is None:
+        return None
+    fingerprint = request_fingerprint(request.message, request.player_id, request.player_name)
+    return analyze_idempotency.lookup(request.message_id, fingerprint)
+
+
+def _analyze_once(
+    request: AnalyzeRequest,
+    local_only: bool,
+    spam_reason: Optional[str],
+    emit: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[Tuple[ChatAnalysis, Optional[ModerationState]], bool]:
+    """Analyze and store, deduplicated by message_id when one is given"""
+    def run():
+        return _analyze_and_store(request, local_only, spam_reason, emit)
+
+    if request.message_id is None:
+        return run(), False
+    fingerprint = request_fingerprint(request.message, request.player_id, request.player_name)
+    return analyze_idempotency.run(request.message_id, fingerprint, run)
+
+
+def _encode_event(media_type: str, event: str, data: Any) -> bytes:
+    if media_type == "text/event-stream":
+        return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+    return dumps({"event": event, "data": data}) + b"\n"
+
+
+def _stream_analysis(
+    analyze: Callable[[Callable[[str, Any], None]], Tuple[StoredAnalysis, bool]],
+    media_type: str,
+    response: Response,
+) -> StreamingResponse:
+    """Stream moderation, analysis and stored events as analyze(emit) produces them"""
+    events: "queue.SimpleQueue[Optional[Tuple[str, Any]]]" = queue.SimpleQueue()
+
+    def emit(event: str, result: Optional[BaseModel]) -> None:
+        # Only the ModerationResult fields of a moderation state are part of the response
+        fields = set(ModerationResult.model_fields) if isinstance(result, ModerationState) else None
+        events.put((event, result.model_dump(mode="json", include=fields) if result else None))
+
+    def work() -> None:
+        try:
+            (analysis, moderation_state), replayed = analyze(emit)
+            if replayed:
+                # Nothing ran for a replay, so the stored results are sent instead
+                emit("moderation", moderation_state)
+                emit("analysis", analysis)
+            events.put(("stored", {"message_id": analysis.chat.message_id, "replayed": replayed}))
+        except HTTPException as e:
+            events.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.error(f"Streamed analysis failed: {str(e)}")
+            events.put(("error", {"status_code": 500, "detail": "Analysis failed"}))
+        finally:
+            _count_stream_job(-1)
+            events.put(None)
+
+    # Carries the request's trace id into the worker
+    _count_stream_job(1)
+    try:
+        _stream_executor.submit(contextvars.copy_context().run, work)
+    except BaseException:
+        _count_stream_job(-1)
+        raise
+
+    def stream() -> Iterator[bytes]:
+        while (event := events.get()) is not None:
+            yield _encode_event(media_type, *event)
+
+    headers = {**response.headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
+
+async def _run_pipelines(
+    chat_message: ChatMessage,
+    local_only: bool,
+    spam_reason: Optional[str],
+    emit: Optional[Callable[[str, Any], None]],
+) -> Tuple[Any, Optional[ModerationState]]:
+    """Run sentiment and moderation concurrently, reporting the verdict as soon as it is in"""
+    sentiment = asyncio.ensure_future(
+        sentiment_service.analyze_message_sentiment(chat_message, local_only, spam_reason)
+    )
+    moderation_result = None
+    try:
+        moderation_result = await chat_service.moderate_message(chat_message, local_only or bool(spam_reason))
+        debug_logger.debug("Moderation result for %s: %s", chat_message.message_id, moderation_result.recommended_action)
+    except RunInProgress:
+        sentiment.cancel()
+        raise
+    except Exception as e:
+        logger.error(f"Moderation failed for {chat_message.message_id}: {e}")
+        # Continue with sentiment analysis even if moderation fails
+    if emit:
+        emit("moderation", moderation_result)
+    return await sentiment, moderation_result
+
+
+def _analyze_and_store(
+    request: AnalyzeRequest,
+    local_only: bool = False,
+    spam_reason: Optional[str] = None,
+    emit: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[ChatAnalysis, Optional[ModerationState]]:
+    """Run both pipelines for a new message and persist the player, message and verdict"""
     # Generate random values if not provided
     player_id = request.player_id if request.player_id is not None else random.randint(1, 100)
     player_name = request.player_name if request.player_name is not None else f"Player{random.randint(1, 999)}"
@@ -121,79 +328,66 @@ def analyze_sentiment_and_create_message(
         player_name=player_name
     )
     
-    # Run sentiment analysis
-    import asyncio
-    sentiment_result = asyncio.run(sentiment_service.analyze_message_sentiment(chat_message))
+    # Run sentiment analysis and moderation in parallel (for auto-mod testing)
+    record_message()
+    sentiment_result, moderation_result = asyncio.run(
+        _run_pipelines(chat_message, local_only, spam_reason, emit)
+    )
+    if emit:
+        emit("analysis", sentiment_result.chat_analysis)
     
-    # Also run moderation in parallel (for auto-mod testing)
-    try:
-        moderation_result = asyncio.run(chat_service.moderate_message(chat_message))
-        logger.info(f"Moderation result for {message_id}: {moderation_result.recommended_action}")
-        
-        # Store moderation results in both database and memory if action recommended
-        if moderation_result.recommended_action:
-            reason_parts = []
-            if moderation_result.pii_result and moderation_result.pii_result.pii_presence:
-                pii_type = moderation_result.pii_result.pii_type.value if moderation_result.pii_result.pii_type else "Unknown"
-                reason_parts.append(f"Detected {pii_type}")
-            if moderation_result.content_result and moderation_result.content_result.main_category.value != "OK":
-                reason_parts.append(f"Harmful content: {moderation_result.content_result.main_category.value}")
-            if not reason_parts:
-                reason_parts.append(moderation_result.recommended_action.reason)
-            
-            comprehensive_reason = "; ".join(reason_parts)
-            
-            # Update database
-            update_data = {
-                "moderation_action": moderation_result.recommended_action.action.value,
-                "moderation_reason": comprehensive_reason
-            }
-            supabase.table('messages').update(update_data).eq('message_id', message_id).execute()
-            
+    moderation_data = {}
+    if moderation_result:
+        # Written with the message row below so the stored row is final in one write
+        action_data = moderation_columns(moderation_result)
+        moderation_data = {**content_columns(moderation_result), **action_data}
+        if action_data:
             # ALSO store in memory for live feed
-            moderation_results[message_id] = {
-                "moderation_action": moderation_result.recommended_action.action.value,
-                "moderation_reason": comprehensive_reason
-            }
-            logger.info(f"Stored moderation result in database and memory for {message_id}: {moderation_result.recommended_action.action.value}")
-    
-    except Exception as e:
-        logger.error(f"Moderation failed for {message_id}: {e}")
-        # Continue with sentiment analysis even if moderation fails
+            moderation_results[message_id] = action_data
+            logger.info(f"Stored moderation result in memory for {message_id}: {moderation_result.recommended_action.action.value}")
     
-    # Store player and message data
-    player_data = {
-        "player_id": player_id,
-        "player_name": player_name,
-        "last_seen": datetime.now(timezone.utc).isoformat()
-    }
-    supabase.table('players').upsert(player_data).execute()
+    # Store player and message data; last_seen is flushed in bulk by the presence tracker
+    presence_tracker.seen(player_id, player_name)
+    presence_tracker.flush_if_due(2 * PRESENCE_FLUSH_INTERVAL)
     
     message_data = {
         "message_id": message_id,
         "player_id": player_id,
         "message": request.message,
-        "sentiment_score": sentiment_result.chat_analysis.sentiment_score or 0,
+        **sentiment_columns(sentiment_result.chat_analysis),
+        **reward_columns(sentiment_result),
+        **moderation_data,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
     # Insert or update message
     try:
-        supabase.table('messages').insert(message_data).execute()
+        written = execute_query(get_supabase().table('messages').insert(message_data), 'messages', 'insert')
     except:
         # Update if exists - include updated timestamp so it appears as "new" in live feed
         update_data = {
-            "sentiment_score": sentiment_result.chat_analysis.sentiment_score or 0,
+            **sentiment_columns(sentiment_result.chat_analysis),
+            **reward_columns(sentiment_result),
+            **moderation_data,
             "created_at": datetime.now(timezone.utc).isoformat()  # Update timestamp
         }
-        supabase.table('messages').update(update_data).eq('message_id', message_id).execute()
+        written = execute_query(
+            get_supabase().table('messages').update(update_data).eq('message_id', message_id),
+            'messages', 'update'
+        )
     
-    return sentiment_result.chat_analysis
+    # Flagging a message right after ingestion is then a memory lookup
+    message_cache.written(message_id, written.data)
+    response_cache.invalidate("messages")
+    return sentiment_result.chat_analysis, moderation_result
 
 
 @router.post("/sentiment", response_model=ChatAnalysis)
-def analyze_sentiment(request: AnalyzeRequest):
+def analyze_sentiment(request: AnalyzeRequest, http_request: Request, response: Response):
     """Sentiment analysis endpoint"""
+    local_only = _rate_limit(http_request, response, request.player_id)
+    spam_reason = _check_spam(response, request)
+    
     # Generate random values if not provided
     player_id = request.player_id if request.player_id is not None else random.randint(1, 100)
     player_name = request.player_name if request.player_name is not None else f"Player{random.randint(1, 999)}"
@@ -209,15 +403,24 @@ def analyze_sentiment(request: AnalyzeRequest):
     
     # Analyze sentiment
     import asyncio
-    sentiment_result = asyncio.run(sentiment_service.analyze_message_sentiment(sentiment_message))
+    record_message()
+    sentiment_result = asyncio.run(
+        sentiment_service.analyze_message_sentiment(sentiment_message, local_only, spam_reason)
+    )
     
     # Update existing message with sentiment data and refresh timestamp
     update_data = {
-        "sentiment_score": sentiment_result.chat_analysis.sentiment_score or 0,
+        **sentiment_columns(sentiment_result.chat_analysis),
+        **reward_columns(sentiment_result),
         "created_at": datetime.now(timezone.utc).isoformat()  # Update timestamp for live feed
     }
-    supabase.table('messages').update(update_data).eq('message_id', message_id).execute()
+    updated = execute_query(
+        get_supabase().table('messages').update(update_data).eq('message_id', message_id),
+        'messages', 'update'
+    )
+    message_cache.written(message_id, updated.data)
     
+    response_cache.invalidate("messages")
     return sentiment_result.chat_analysis
 
 
@@ -230,41 +433,175 @@ def get_user_score(user_id: int):
 # In-memory storage for flagged messages
 flagged_messages = {}
 
+# Upper bound on message_ids per /flag/batch request
+FLAG_BATCH_MAX = 500
+# Upper bound on messages per /moderation/bulk request, by ID or matched by a filter
+BULK_ACTION_MAX = 1000
+BULK_DELETE_MAX = 200  # deletes can't be undone, so a mistaken filter removes less
+
+
+def _store_flag(message_data: dict, reason: Optional[str]) -> None:
+    """Add a message row to the in-memory moderation queue"""
+    flagged_messages[message_data["message_id"]] = {
+        **message_data,
+        "flagged": True,
+        "flagged_at": datetime.now(timezone.utc).isoformat(),
+        "flag_reason": reason
+    }
+
+
 @router.post("/flag")
 def flag_message(request: FlagRequest):
     """Flag a message for moderation review (in-memory storage)"""
-    # Get the original message from database
-    response = supabase.table('messages').select('*').eq('message_id', request.message_id).execute()
+    # Recently ingested messages come from the message cache without a query
+    message_data = message_cache.get(request.message_id)
     
-    if not response.data:
+    if not message_data:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    message_data = response.data[0]
-    
-    # Store flagged message in memory
-    flagged_messages[request.message_id] = {
-        **message_data,
-        "flagged": True,
-        "flagged_at": datetime.now(timezone.utc).isoformat(),
-        "flag_reason": request.reason
-    }
+    _store_flag(message_data, request.reason)
     
     return {"success": True, "message": "Message flagged successfully"}
 
 
+@router.post("/flag/batch")
+def flag_messages(request: FlagBatchRequest):
+    """Flag many messages at once; cache misses are loaded in a single query"""
+    if len(request.message_ids) > FLAG_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"At most {FLAG_BATCH_MAX} message_ids per request")
+    
+    rows = message_cache.get_many(request.message_ids)
+    for message_data in rows.values():
+        _store_flag(message_data, request.reason)
+    
+    return FastJSONResponse({
+        "success": True,
+        "flagged": list(rows),
+        "not_found": [message_id for message_id in dict.fromkeys(request.message_ids) if message_id not in rows]
+    })
+
+
+def _select_bulk_targets(
+    request: BulkActionRequest, limit: int
+) -> Tuple[Dict[str, Dict[str, Any]], List[str], bool]:
+    """
+    Rows a bulk action applies to: the given IDs through the message cache, or the
+    player's messages in the time range with one query
+
+    Returns:
+        Rows by message_id, requested IDs that don't exist, and whether the filter matched
+        more than limit messages
+    """
+    if request.message_ids is not None:
+        if len(request.message_ids) > limit:
+            raise HTTPException(status_code=422, detail=f"At most {limit} message_ids per {request.action} request")
+        rows = message_cache.get_many(request.message_ids)
+        return rows, [message_id for message_id in dict.fromkeys(request.message_ids) if message_id not in rows], False
+
+    query = get_supabase().table('messages').select('*').eq('player_id', request.player_id)
+    if request.since:
+        query = query.gte('created_at', request.since.isoformat())
+    if request.until:
+        query = query.lte('created_at', request.until.isoformat())
+    # Newest first, matching the (player_id, created_at desc) index
+    loaded = execute_query(
+        query.order('created_at', desc=True).limit(limit + 1), 'messages', 'select'
+    ).data
+    truncated = len(loaded) > limit
+    loaded = loaded[:limit]
+    message_cache.put(*loaded)
+    return {row["message_id"]: row for row in loaded}, [], truncated
+
+
+def _write_in_batches(message_ids: List[str], build_query: Callable[[List[str]], Any], operation: str) -> List[Dict[str, Any]]:
+    """Run one write per MESSAGE_LOAD_BATCH_SIZE message_ids, collecting the returned rows"""
+    written = []
+    for start in range(0, len(message_ids), MESSAGE_LOAD_BATCH_SIZE):
+        batch = message_ids[start:start + MESSAGE_LOAD_BATCH_SIZE]
+        written.extend(execute_query(build_query(batch), 'messages', operation).data or [])
+    return written
+
+
+@router.post("/moderation/bulk")
+def bulk_moderation_action(request: BulkActionRequest, _: None = Depends(verify_api_key)):
+    """
+    Apply one moderator action to many messages, e.g. to clear a raid
+
+    Messages are chosen by message_ids, or by player_id with an optional since/until
+    range, up to BULK_ACTION_MAX per request (BULK_DELETE_MAX for delete). Rows are
+    fetched with one in_() query per 200 IDs (none for recently ingested messages) and
+    written with one bulk update or delete.
+
+    Actions:
+        flag: add to the moderation queue
+        resolve: remove from the moderation queue
+        delete: delete the messages
+        moderation_action: record moderation_action (and reason) on the messages
+    """
+    if (request.message_ids is None) == (request.player_id is None):
+        raise HTTPException(status_code=422, detail="Give either message_ids or player_id")
+    if request.action == "moderation_action" and request.moderation_action is None:
+        raise HTTPException(status_code=422, detail="moderation_action is required for this action")
+
+    limit = BULK_DELETE_MAX if request.action == "delete" else BULK_ACTION_MAX
+    rows, not_found, truncated = _select_bulk_targets(request, limit)
+    message_ids = list(rows)
+
+    if request.action == "flag":
+        for message_data in rows.values():
+            _store_flag(message_data, request.reason)
+    elif request.action == "resolve":
+        for message_id in message_ids:
+            flagged_messages.pop(message_id, None)
+    elif message_ids and request.action == "delete":
+        _write_in_batches(
+            message_ids,
+            lambda batch: get_supabase().table('messages').delete().in_('message_id', batch),
+            'delete'
+        )
+        message_cache.invalidate(*message_ids)
+        for message_id in message_ids:
+            flagged_messages.pop(message_id, None)
+            moderation_results.pop(message_id, None)
+        response_cache.invalidate("messages")
+    elif message_ids:
+        action_data = {"moderation_action": request.moderation_action.value, "moderation_reason": request.reason}
+        updated = _write_in_batches(
+            message_ids,
+            lambda batch: get_supabase().table('messages').update(action_data).in_('message_id', batch),
+            'update'
+        )
+        # Returned rows replace the cached copies; IDs not returned are dropped from the cache
+        message_cache.invalidate(*message_ids)
+        message_cache.put(*updated)
+        for message_id in message_ids:
+            moderation_results[message_id] = action_data
+        response_cache.invalidate("messages")
+
+    logger.info(f"Bulk {request.action} applied to {len(message_ids)} messages")
+    return FastJSONResponse({
+        "success": True,
+        "action": request.action,
+        "applied": message_ids,
+        "not_found": not_found,
+        "truncated": truncated,
+    })
+
+
 @router.get("/flagged")
 def get_flagged_messages(limit: int = 50):
     """Get all flagged messages for moderation queue (from in-memory storage)"""
     # Return flagged messages from memory, sorted by flagged_at (newest first)
     flagged_list = list(flagged_messages.values())
     flagged_list.sort(key=lambda x: x.get('flagged_at', ''), reverse=True)
-    return flagged_list[:limit]
+    # Rows are plain JSON already, so they skip FastAPI's jsonable_encoder pass
+    return FastJSONResponse(flagged_list[:limit])
 
 
 @router.get("/leaderboard")
 def get_leaderboard(limit: int = 10):
     """Get leaderboard"""
-    return {"leaderboard": sentiment_service.get_leaderboard(limit)}
+    return FastJSONResponse({"leaderboard": sentiment_service.get_leaderboard(limit)})
 
 
 @router.get("/stats")
@@ -277,3 +614,42 @@ def get_stats():
 def health_check():
     """Health check"""
     return {"status": "healthy", "timestamp": datetime.now()}
+
+
+# Health checks are async so they answer from the event loop even when every
+# threadpool thread is busy
+@router.get("/health/live")
+async def liveness():
+    """Liveness: the process and its event loop respond"""
+    return {"status": "alive", "uptime_seconds": round(time.time() - health_monitor.started_at, 1)}
+
+
+@router.get("/health/ready")
+async def readiness():
+    """
+    Readiness: 503 while a required dependency is down or the instance is saturated
+
+    Dependency results come from the background probes, so this only reads memory.
+    """
+    limiter = to_thread.current_default_thread_limiter()
+    waiting = limiter.statistics().tasks_waiting
+    threadpool = usage(int(limiter.borrowed_tokens), int(limiter.total_tokens), READY_MAX_THREADPOOL)
+    threadpool["waiting"] = waiting
+    threadpool["limit_exceeded"] = threadpool["limit_exceeded"] or waiting >= READY_MAX_WAITING
+    saturation = {
+        "threadpool": threadpool,
+        # Unfinished streams against the worker count: above 1.0 some wait for a worker,
+        # and the executor's queue is unbounded, so 2.0 (as many waiting as running) drains
+        "analyze_stream": usage(_stream_jobs, STREAM_MAX_WORKERS, 2.0),
+        "log_queue": usage(*queue_usage(), READY_MAX_QUEUE),
+    }
+    ready, report = health_monitor.readiness(saturation)
+    report["caches"] = {
+        "responses": len(response_cache),
+        "messages": len(message_cache),
+        "idempotency": len(analyze_idempotency),
+        "spam_players": len(spam_detector),
+        "presence_players": len(presence_tracker),
+        "rate_limit_keys": len(server_limiter) + len(player_limiter),
+    }
+    return FastJSONResponse(report, status_code=200 if ready else 503, headers={"Cache-Control": "no-store"})
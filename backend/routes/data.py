@@ -1,80 +1,210 @@
-import os
 import logging
-import requests
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Query
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Query, Request
 
-load_dotenv()
+from services.analytics import DEFAULT_BUCKETS, DIMENSIONS, INTERVALS, MAX_QUERY_BUCKETS, analytics_rollups
+from services.presence import ONLINE_WINDOW, presence_tracker
+from utils.cache import Payload, response_cache
+from utils.db import get_supabase
+from utils.logs import get_debug_logger
+from utils.metrics import execute_query, track_dependency
+from utils.serialization import FastJSONResponse
+from utils.usage import budget_governor, usage_ledger
+from utils.pagination import (
+    NEXT_CURSOR_HEADER,
+    MESSAGE_COLUMNS,
+    MESSAGE_FIELD_SETS,
+    MESSAGE_KEY_COLUMNS,
+    MESSAGES_MAX_PAGE_SIZE,
+    PLAYER_COLUMNS,
+    PLAYER_FIELD_SETS,
+    PLAYER_KEY_COLUMNS,
+    PLAYERS_MAX_PAGE_SIZE,
+    apply_message_keyset,
+    apply_player_keyset,
+    clamp_limit,
+    decode_cursor,
+    select_columns,
+    split_page,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
-
-# Supabase configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    logger.error("Missing Supabase configuration. Please set SUPABASE_URL and SUPABASE_KEY environment variables.")
-    raise ValueError("Missing Supabase configuration")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+debug_logger = get_debug_logger(__name__)
 
 # Roblox API configuration
 ROBLOX_THUMBNAILS_API_URL = "https://thumbnails.roblox.com/v1/users/avatar-headshot"
 
+# Response cache TTLs in seconds; chat writes invalidate entries before they expire
+PLAYERS_CACHE_TTL = 30
+MESSAGES_CACHE_TTL = 5
+LIVE_CACHE_TTL = 2
+TOP_PLAYERS_CACHE_TTL = 30
+ANALYTICS_CACHE_TTL = 10
+
 # Router setup
 router = APIRouter(prefix="/api", tags=["data"])
 
 
+def _page(rows: list, limit: int, key_columns: tuple) -> Payload:
+    page, next_cursor = split_page(rows, limit, key_columns)
+    return Payload(page, {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})
+
+
 @router.get("/players")
-async def get_players():
-    """Fetch all players from the database"""
+async def get_players(
+    request: Request,
+    limit: int = Query(PLAYERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+):
+    """
+    Fetch players ordered by player_id, one page at a time
+
+    Args:
+        limit: Page size, capped at PLAYERS_MAX_PAGE_SIZE
+        cursor: Value of the previous page's X-Next-Cursor header
+        fields: Field set ("list", "full") or comma separated columns
+    """
+    limit = clamp_limit(limit, PLAYERS_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor, len(PLAYER_KEY_COLUMNS))
+    columns = select_columns(fields, PLAYER_FIELD_SETS, PLAYER_COLUMNS, PLAYER_KEY_COLUMNS)
+
+    def load():
+        query = apply_player_keyset(get_supabase().table('players').select(columns), after)
+        rows = execute_query(query.limit(limit + 1), 'players', 'select').data
+        return _page(rows, limit, PLAYER_KEY_COLUMNS)
+
     try:
-        response = supabase.table('players').select('*').execute()
-        return response.data
+        return await response_cache.respond(request, ("players",), PLAYERS_CACHE_TTL, load)
     except Exception as e:
         logger.error(f"Error fetching players: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch players")
 
 
+@router.get("/players/online")
+def get_online_players(
+    window: int = Query(ONLINE_WINDOW, ge=1, le=24 * 60 * 60),
+    limit: int = Query(100, ge=1, le=PLAYERS_MAX_PAGE_SIZE),
+):
+    """
+    Players who sent a message within the last window seconds, most recent first
+
+    Served from this worker's presence tracker without querying the players table.
+
+    Args:
+        window: Seconds since a player's last message (default: 300)
+        limit: Maximum number of players to return (default: 100)
+    """
+    players, count = presence_tracker.online(window, limit)
+    return FastJSONResponse({"players": players, "count": count, "window": window})
+
+
+@router.get("/usage")
+def get_usage(group_by: str = Query("node", pattern="^(node|endpoint|api_key)$")):
+    """
+    Remote calls, Gemini tokens, HuggingFace bytes and estimated cost since this worker started
+
+    Args:
+        group_by: node, endpoint or api_key (default: node)
+    """
+    return FastJSONResponse({**usage_ledger.report(group_by), "budget": budget_governor.status()})
+
+
+@router.get("/analytics/moderation")
+async def get_moderation_analytics(
+    request: Request,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    interval: str = Query("hour", pattern="^(minute|hour|day)$"),
+    dimensions: Optional[str] = Query(None),
+):
+    """
+    Moderation and sentiment trends per time bucket, read from the analytics rollups
+
+    Args:
+        since: Start of the range (default: the last hour by minute, day by hour or 30 days by day)
+        until: End of the range (default: now)
+        interval: Bucket size: minute, hour or day (default: hour)
+        dimensions: Comma separated subset of messages, action, category, pii_type,
+            intent, sentiment and points (default: all)
+    """
+    until = until or datetime.now(timezone.utc)
+    since = since or until - timedelta(seconds=DEFAULT_BUCKETS[interval] * INTERVALS[interval])
+    # Naive timestamps are taken as UTC
+    until, since = (value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (until, since))
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if (until - since).total_seconds() / INTERVALS[interval] > MAX_QUERY_BUCKETS:
+        raise HTTPException(
+            status_code=400, detail=f"Range spans more than {MAX_QUERY_BUCKETS} {interval} buckets; use a larger interval"
+        )
+    selected = tuple(name.strip() for name in dimensions.split(",") if name.strip()) if dimensions else DIMENSIONS
+    unknown = [name for name in selected if name not in DIMENSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dimensions: {', '.join(unknown)}")
+
+    try:
+        return await response_cache.respond(
+            request, ("analytics",), ANALYTICS_CACHE_TTL,
+            lambda: analytics_rollups.query(since, until, interval, selected)
+        )
+    except Exception as e:
+        logger.error(f"Error fetching moderation analytics: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch moderation analytics")
+
+
 @router.get("/messages")
 async def get_messages(
+    request: Request,
     player_id: Optional[str] = Query(None),
-    limit: int = Query(100)
+    limit: int = Query(100),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
 ):
     """
-    Fetch messages from the database with optional filtering
+    Fetch messages newest first with optional filtering and keyset pagination
     
     Args:
         player_id: Optional player ID to filter messages
-        limit: Maximum number of messages to return (default: 100)
+        limit: Page size (default: 100, capped at MESSAGES_MAX_PAGE_SIZE)
+        cursor: Value of the previous page's X-Next-Cursor header
+        fields: Field set ("feed", "moderation", "full") or comma separated columns
     """
-    try:
-        query = supabase.table('messages').select('*').order('created_at', desc=True).limit(limit)
+    limit = clamp_limit(limit, MESSAGES_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor, len(MESSAGE_KEY_COLUMNS))
+    columns = select_columns(fields, MESSAGE_FIELD_SETS, MESSAGE_COLUMNS, MESSAGE_KEY_COLUMNS)
+
+    def load():
+        query = apply_message_keyset(get_supabase().table('messages').select(columns), after)
         
         if player_id:
             query = query.eq('player_id', player_id)
         
-        response = query.execute()
-        return response.data
+        rows = execute_query(query.limit(limit + 1), 'messages', 'select').data
+        return _page(rows, limit, MESSAGE_KEY_COLUMNS)
+
+    try:
+        return await response_cache.respond(request, ("messages",), MESSAGES_CACHE_TTL, load)
     except Exception as e:
         logger.error(f"Error fetching messages: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch messages")
 
 
 @router.get("/live")
-async def get_live_messages(limit: int = Query(20)):
+async def get_live_messages(request: Request, limit: int = Query(20)):
     """
     Fetch live messages using database function and merge with in-memory moderation results
     
     Args:
         limit: Maximum number of live messages to return (default: 20)
     """
-    try:
+    def load():
         # Use RPC function exactly as it worked before
-        messages_response = supabase.rpc('get_live_messages', {'p_limit': limit}).execute()
+        messages_response = execute_query(
+            get_supabase().rpc('get_live_messages', {'p_limit': limit}), 'rpc', 'get_live_messages'
+        )
         
         # Import moderation_results from chat module
         from routes.chat import moderation_results
@@ -87,11 +217,14 @@ async def get_live_messages(limit: int = Query(20)):
             # Add moderation results if they exist in memory
             if message_id in moderation_results:
                 message.update(moderation_results[message_id])
-                logger.info(f"Added moderation data to message {message_id}: {moderation_results[message_id]}")
+                debug_logger.debug("Added moderation data to message %s: %s", message_id, moderation_results[message_id])
             
             enriched_messages.append(message)
         
         return enriched_messages
+
+    try:
+        return await response_cache.respond(request, ("messages",), LIVE_CACHE_TTL, load)
     except Exception as e:
         logger.error(f"Error fetching live messages: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch live messages: {str(e)}")
@@ -103,20 +236,22 @@ async def get_roblox_avatar(userId: Optional[str] = Query(None)):
     Proxies requests to the Roblox Thumbnails API to fetch user avatar headshots.
     Takes 'userId' as a query parameter.
     """
+    import requests
+
     if not userId:
-        logger.info("Roblox avatar proxy: Missing userId parameter")
+        debug_logger.debug("Roblox avatar proxy: Missing userId parameter")
         raise HTTPException(status_code=400, detail="Missing userId parameter")
 
     try:
         user_id_int = int(userId)
         if user_id_int <= 0:
-            logger.info(f"Roblox avatar proxy: Invalid userId format (non-positive): {userId}")
+            debug_logger.debug("Roblox avatar proxy: Invalid userId format (non-positive): %s", userId)
             raise HTTPException(status_code=400, detail="Invalid userId format")
     except ValueError:
-        logger.info(f"Roblox avatar proxy: Invalid userId format (not an integer): {userId}")
+        debug_logger.debug("Roblox avatar proxy: Invalid userId format (not an integer): %s", userId)
         raise HTTPException(status_code=400, detail="Invalid userId format")
 
-    logger.info(f"Roblox avatar proxy: Fetching avatar for user ID: {userId}")
+    debug_logger.debug("Roblox avatar proxy: Fetching avatar for user ID: %s", userId)
 
     # Parameters for the Roblox API request
     roblox_params = {
@@ -127,11 +262,12 @@ async def get_roblox_avatar(userId: Optional[str] = Query(None)):
 
     try:
         # Make the request to the actual Roblox Thumbnails API
-        roblox_response = requests.get(ROBLOX_THUMBNAILS_API_URL, params=roblox_params)
-        roblox_response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
+        with track_dependency("roblox", "avatar_headshot"):
+            roblox_response = requests.get(ROBLOX_THUMBNAILS_API_URL, params=roblox_params)
+            roblox_response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
 
         roblox_data = roblox_response.json()
-        logger.info(f"Roblox avatar proxy: Received data from Roblox API: {roblox_data}")
+        debug_logger.debug("Roblox avatar proxy: Received data from Roblox API: %s", roblox_data)
 
         # Parse the response to find the image URL
         # The response structure is { "data": [ { "targetId": ..., "state": ..., "imageUrl": ... } ] }
@@ -141,16 +277,16 @@ async def get_roblox_avatar(userId: Optional[str] = Query(None)):
             user_data = next((item for item in roblox_data['data'] if str(item.get('targetId')) == userId), None)
             if user_data and 'imageUrl' in user_data:
                 image_url = user_data['imageUrl']
-                logger.info(f"Roblox avatar proxy: Found imageUrl: {image_url}")
+                debug_logger.debug("Roblox avatar proxy: Found imageUrl: %s", image_url)
             else:
-                logger.info(f"Roblox avatar proxy: imageUrl not found in Roblox response for user ID: {userId}")
+                debug_logger.debug("Roblox avatar proxy: imageUrl not found in Roblox response for user ID: %s", userId)
 
         if image_url:
             # Return the image URL to the frontend
             return {"imageUrl": image_url}
         else:
             # Return a 404 if the image URL was not found for the user
-            logger.info(f"Roblox avatar proxy: Avatar not found for user ID: {userId}")
+            debug_logger.debug("Roblox avatar proxy: Avatar not found for user ID: %s", userId)
             raise HTTPException(status_code=404, detail="Avatar not found")
 
     except requests.exceptions.RequestException as e:
@@ -167,15 +303,18 @@ async def get_roblox_avatar(userId: Optional[str] = Query(None)):
 
 
 @router.get("/top-players")
-async def get_top_players(limit: int = Query(10)):
+async def get_top_players(request: Request, limit: int = Query(10)):
     """
     Get top players by sentiment score using database RPC function
     
     Args:
         limit: Maximum number of top players to return (default: 10)
     """
-    try:
-        response = supabase.rpc('get_top_players_by_sentiment', {'p_limit': limit}).execute()
+    def load():
+        response = execute_query(
+            get_supabase().rpc('get_top_players_by_sentiment', {'p_limit': limit}),
+            'rpc', 'get_top_players_by_sentiment'
+        )
         
         # Format the response to ensure we have the required fields
         formatted_data = []
@@ -188,6 +327,11 @@ async def get_top_players(limit: int = Query(10)):
             })
         
         return formatted_data
+
+    try:
+        return await response_cache.respond(
+            request, ("messages", "players"), TOP_PLAYERS_CACHE_TTL, load
+        )
     except Exception as e:
         logger.error(f"Error fetching top players: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch top players: {str(e)}")
\ No newline at end of file
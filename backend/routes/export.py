@@ -0,0 +1,82 @@
+import logging
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+
+from utils.db import get_supabase
+from utils.dependencies import verify_api_key
+from utils.export import ENCODERS, EXPORT_FORMATS, iter_message_pages, require_pyarrow
+from utils.pagination import MESSAGE_COLUMNS, MESSAGE_FIELD_SETS, MESSAGE_KEY_COLUMNS, select_columns
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Router setup
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+
+@router.get("/messages")
+async def export_messages(
+    format: Literal["ndjson", "csv", "parquet"] = Query("ndjson"),
+    player_id: Optional[int] = Query(None),
+    since: Optional[datetime] = Query(None, description="Inclusive lower bound on created_at"),
+    until: Optional[datetime] = Query(None, description="Exclusive upper bound on created_at"),
+    moderation_action: Optional[str] = Query(None, description='Action name, or "none" for unmoderated messages'),
+    min_sentiment: Optional[int] = Query(None),
+    max_sentiment: Optional[int] = Query(None),
+    fields: Optional[str] = Query(None),
+    _: None = Depends(verify_api_key),
+):
+    """
+    Stream messages and their moderation history newest first
+
+    The export pages through Supabase with the same keyset cursor as /api/messages and
+    encodes each page as it arrives, so memory stays flat for any export size.
+
+    Args:
+        format: ndjson, csv or parquet (parquet needs pyarrow)
+        player_id: Only this player's messages
+        since / until: created_at range
+        moderation_action: WARNING, KICK, BAN, ... or "none"
+        min_sentiment / max_sentiment: Inclusive sentiment_score range
+        fields: Field set ("feed", "moderation", "full") or comma separated columns
+    """
+    if format == "parquet":
+        require_pyarrow()
+    columns = select_columns(fields, MESSAGE_FIELD_SETS, MESSAGE_COLUMNS, MESSAGE_KEY_COLUMNS).split(",")
+
+    def build_query():
+        query = get_supabase().table('messages').select(",".join(columns))
+        if player_id is not None:
+            query = query.eq('player_id', player_id)
+        if since:
+            query = query.gte('created_at', since.isoformat())
+        if until:
+            query = query.lt('created_at', until.isoformat())
+        if moderation_action:
+            if moderation_action.lower() == "none":
+                query = query.is_('moderation_action', 'null')
+            else:
+                query = query.eq('moderation_action', moderation_action.upper())
+        if min_sentiment is not None:
+            query = query.gte('sentiment_score', min_sentiment)
+        if max_sentiment is not None:
+            query = query.lte('sentiment_score', max_sentiment)
+        return query
+
+    def stream():
+        try:
+            yield from ENCODERS[format](iter_message_pages(build_query), columns)
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated body
+            logger.error(f"Message export failed mid-stream: {str(e)}")
+            raise
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"messages-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{extension}"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
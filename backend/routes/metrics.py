@@ -0,0 +1,29 @@
+import os
+
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.openmetrics.exposition import (
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE,
+    generate_latest as generate_openmetrics,
+)
+
+# Router setup
+router = APIRouter(tags=["metrics"])
+
+
+def _registry():
+    """This process's metrics, or under gunicorn the sum over every worker's metric files"""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus scrape endpoint (OpenMetrics when requested, to carry trace exemplars)"""
+    registry = _registry()
+    if "application/openmetrics-text" in request.headers.get("accept", ""):
+        return Response(generate_openmetrics(registry), media_type=OPENMETRICS_CONTENT_TYPE)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,267 @@
+"""
+Time-bucketed moderation and sentiment analytics
+Verdicts are counted per minute in memory as the pipelines produce them: actions,
+content categories, PII types, community intents, a sentiment histogram and reward
+points. Every few seconds the counts are added to the moderation_rollups table, which
+also folds them into hours and days, so a range query reads one row per bucket and key
+at the requested interval and never scans messages.
+
+Each worker counts the verdicts it produced. Queries add this worker's unflushed counts
+to what the table holds; other workers' counts appear after their next flush.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.cache import response_cache
+from utils.db import get_supabase
+from utils.metrics import execute_query
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("BLOOM_ANALYTICS_FLUSH_INTERVAL", "10"))
+BUCKET_SECONDS = 60          # finest bucket; the merge RPC folds minutes into hours and days
+INTERVALS = {"minute": 60, "hour": 3600, "day": 86400}
+MAX_QUERY_BUCKETS = 1000     # buckets per range query
+DEFAULT_BUCKETS = {"minute": 60, "hour": 24, "day": 30}  # range covered when since is omitted
+SENTIMENT_BIN_WIDTH = 20     # histogram bins over sentiment scores [-100, 100]
+FLUSH_BATCH_SIZE = 1000      # rows per merge RPC
+READ_PAGE_SIZE = 1000        # rollup rows per select
+DIMENSIONS = ("messages", "action", "category", "pii_type", "intent", "sentiment", "points")
+NONE = "NONE"                # no action recommended, or no community intent
+
+# (bucket start in epoch seconds, dimension, key) -> [count, total]
+Counts = Dict[Tuple[int, str, str], List[int]]
+
+
+def sentiment_bin(score: int) -> str:
+    """Lower bound of the histogram bin holding a sentiment score"""
+    clamped = max(-100, min(99, score))
+    return str(clamped - clamped % SENTIMENT_BIN_WIDTH)
+
+
+def _timestamp(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def _epoch(timestamp: str) -> int:
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+
+
+def _summary(cells: Dict[str, Dict[str, List[int]]], dimensions: Sequence[str]) -> Dict[str, Any]:
+    """Response fields for one bucket's (or the whole range's) counts"""
+    def counts(dimension: str) -> Dict[str, int]:
+        return {key: count for key, (count, _) in sorted(cells.get(dimension, {}).items())}
+
+    summary: Dict[str, Any] = {}
+    if "messages" in dimensions:
+        messages = counts("messages")
+        summary["moderated"] = messages.get("moderated", 0)
+        summary["analyzed"] = messages.get("sentiment", 0)
+    for dimension, field in (("action", "actions"), ("category", "categories"), ("pii_type", "pii_types"), ("intent", "intents")):
+        if dimension in dimensions:
+            summary[field] = counts(dimension)
+    if "sentiment" in dimensions:
+        bins = cells.get("sentiment", {})
+        scored = sum(count for count, _ in bins.values())
+        summary["sentiment_histogram"] = {key: bins[key][0] for key in sorted(bins, key=int)}
+        summary["sentiment_mean"] = round(sum(total for _, total in bins.values()) / scored, 2) if scored else None
+    if "points" in dimensions:
+        summary["points_awarded"] = cells.get("points", {}).get("awarded", [0, 0])[1]
+    return summary
+
+
+class AnalyticsRollups:
+    """Per-minute verdict counts awaiting a flush, and range queries over the rollup table"""
+
+    def __init__(self):
+        self._counts: Counts = {}
+        # Batch sent but not confirmed; resent unchanged so its batch ID deduplicates it
+        self._inflight: Optional[Tuple[str, Counts]] = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    # ----- Recording -----
+    def _add(self, entries: Iterable[Tuple[str, str, int]], at: Optional[float]) -> None:
+        now = time.time() if at is None else at
+        bucket = int(now // BUCKET_SECONDS * BUCKET_SECONDS)
+        with self._lock:
+            for dimension, key, total in entries:
+                cell = self._counts.get((bucket, dimension, key))
+                if cell is None:
+                    self._counts[(bucket, dimension, key)] = [1, total]
+                else:
+                    cell[0] += 1
+                    cell[1] += total
+
+    def record_moderation(self, state: Any, at: Optional[float] = None) -> None:
+        """Count a moderation verdict: its action, main content category and PII type"""
+        action = state.recommended_action
+        entries = [("messages", "moderated", 0), ("action", action.action.value if action else NONE, 0)]
+        if state.content_result:
+            entries.append(("category", state.content_result.main_category.value, 0))
+        pii = state.pii_result
+        if pii and pii.pii_presence:
+            entries.append(("pii_type", pii.pii_type.value if pii.pii_type else "UNKNOWN", 0))
+        self._add(entries, at)
+
+    def record_sentiment(self, state: Any, at: Optional[float] = None) -> None:
+        """Count a sentiment verdict: its score bin, community intent and reward points"""
+        analysis = state.chat_analysis
+        intent = analysis.community_intent
+        entries = [
+            ("messages", "sentiment", 0),
+            ("intent", intent.intent.value if intent and intent.intent else NONE, 0),
+        ]
+        if analysis.sentiment_score is not None:
+            entries.append(("sentiment", sentiment_bin(analysis.sentiment_score), analysis.sentiment_score))
+        if state.reward_system:
+            entries.append(("points", "awarded", state.reward_system.points_awarded))
+        self._add(entries, at)
+
+    # ----- Supabase flush -----
+    def flush_if_due(self, max_age: float = ANALYTICS_FLUSH_INTERVAL) -> None:
+        """Flush when the last one is older than max_age seconds; cheap to call per message"""
+        if time.monotonic() - self._last_flush < max_age:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            # Counts stay pending and go out with the next flush
+            logger.warning(f"Analytics flush failed: {str(e)}")
+
+    def flush(self) -> int:
+        """
+        Add the counts recorded since the last flush to moderation_rollups
+
+        Returns:
+            Number of (bucket, dimension, key) rows sent
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # another thread is already flushing
+        try:
+            self._last_flush = time.monotonic()
+            with self._lock:
+                if self._inflight is None and self._counts:
+                    self._inflight = (uuid.uuid4().hex, self._counts)
+                    self._counts = {}
+                inflight = self._inflight
+            if inflight is None:
+                return 0
+
+            batch_id, counts = inflight
+            rows = list(counts.items())
+            for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                batch = rows[start:start + FLUSH_BATCH_SIZE]
+                execute_query(
+                    get_supabase().rpc('merge_moderation_rollups', {
+                        'p_batch_id': f"{batch_id}:{start // FLUSH_BATCH_SIZE}",
+                        'p_buckets': [_timestamp(bucket) for (bucket, _, _), _ in batch],
+                        'p_dimensions': [dimension for (_, dimension, _), _ in batch],
+                        'p_keys': [key for (_, _, key), _ in batch],
+                        'p_counts': [count for _, (count, _) in batch],
+                        'p_totals': [total for _, (_, total) in batch],
+                    }),
+                    'rpc', 'merge_moderation_rollups'
+                )
+            with self._lock:
+                self._inflight = None
+            response_cache.invalidate("analytics")
+            return len(rows)
+        finally:
+            self._flush_lock.release()
+
+    # ----- Range queries -----
+    def _load(self, interval: str, start: int, end: int, dimensions: Sequence[str]) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        while True:
+            query = (
+                get_supabase().table('moderation_rollups').select('bucket,dimension,key,count,total')
+                .eq('granularity', interval)
+                .gte('bucket', _timestamp(start))
+                .lt('bucket', _timestamp(end))
+            )
+            if len(dimensions) < len(DIMENSIONS):
+                query = query.in_('dimension', list(dimensions))
+            query = query.order('bucket').order('dimension').order('key')
+            page = execute_query(
+                query.range(len(rows), len(rows) + READ_PAGE_SIZE - 1), 'moderation_rollups', 'select'
+            ).data
+            rows.extend(page)
+            if len(page) < READ_PAGE_SIZE:
+                return rows
+
+    def query(
+        self,
+        since: datetime,
+        until: datetime,
+        interval: str = "hour",
+        dimensions: Sequence[str] = DIMENSIONS,
+    ) -> Dict[str, Any]:
+        """
+        Verdict counts per bucket between since and until
+
+        Args:
+            since: Start of the range, rounded down to the interval
+            until: End of the range (exclusive)
+            interval: minute, hour or day
+            dimensions: Dimensions to report, by default all of DIMENSIONS
+
+        Returns:
+            The buckets holding verdicts, oldest first, and totals over the range
+        """
+        step = INTERVALS[interval]
+        start = int(since.timestamp()) // step * step
+        end = int(until.timestamp())
+
+        buckets: Dict[int, Dict[str, Dict[str, List[int]]]] = {}
+
+        def add(bucket: int, dimension: str, key: str, count: int, total: int) -> None:
+            cell = buckets.setdefault(bucket, {}).setdefault(dimension, {}).setdefault(key, [0, 0])
+            cell[0] += count
+            cell[1] += total
+
+        for row in self._load(interval, start, end, dimensions):
+            add(_epoch(row["bucket"]), row["dimension"], row["key"], row["count"], row["total"])
+
+        # This worker's counts that aren't in the table yet
+        with self._lock:
+            pending = [self._counts] + ([self._inflight[1]] if self._inflight else [])
+            local = [(key, tuple(cell)) for counts in pending for key, cell in counts.items()]
+        for (bucket, dimension, key), (count, total) in local:
+            if start <= bucket < end and dimension in dimensions:
+                add(bucket // step * step, dimension, key, count, total)
+
+        totals: Dict[str, Dict[str, List[int]]] = {}
+        for cells in buckets.values():
+            for dimension, keys in cells.items():
+                for key, (count, total) in keys.items():
+                    cell = totals.setdefault(dimension, {}).setdefault(key, [0, 0])
+                    cell[0] += count
+                    cell[1] += total
+
+        return {
+            "interval": interval,
+            "since": _timestamp(start),
+            "until": _timestamp(end),
+            "buckets": [
+                {"bucket": _timestamp(bucket), **_summary(buckets[bucket], dimensions)}
+                for bucket in sorted(buckets)
+            ],
+            "totals": _summary(totals, dimensions),
+        }
+
+
+# Shared by the pipeline services, the resume worker, the analytics route and the background flush
+analytics_rollups = AnalyticsRollups()
@@ -0,0 +1,437 @@
+"""
+Replay moderation and sentiment analysis over historical messages
+Streams rows from Supabase or a JSONL file, runs the graphs with bounded concurrency,
+writes results back in bulk upserts and checkpoints progress so a crashed or
+interrupted run resumes where it stopped
+
+Usage:
+    python -m services.backfill --checkpoint backfill.json
+    python -m services.backfill --checkpoint backfill.json --since 2025-06-01T00:00:00Z --stages sentiment
+    python -m services.backfill --input messages.jsonl --concurrency 32 --dry-run
+
+Messages are read oldest first. The graphs run as replays: moderation skips the
+per-player split-PII window, so a verdict depends on the text alone and is shared between
+identical texts, and no run is snapshotted, so a crashed backfill leaves nothing for the
+API's resume worker to finish or award points for.
+
+Re-running with the same --checkpoint resumes. Rows processed after the last bulk write
+are replayed on resume, which is safe because writes are idempotent upserts. Results that
+hit a fallback (an API error answered with a default) are never written; their rows go to
+<checkpoint>.failed.jsonl, which can be replayed later with --input.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from agents.moderation import moderate_message
+from agents.sentiment import analyze_message_sentiment
+from models.chat import ChatMessage
+from utils.db import get_supabase
+from utils.dependencies import content_columns, moderation_columns, sentiment_columns
+from utils.export import iter_message_pages
+from utils.metrics import DEPENDENCY_LATENCY, capture_fallbacks, execute_query
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+STAGES = ("moderation", "sentiment")
+DEFAULT_CONCURRENCY = 16
+WRITE_BATCH_SIZE = 500
+TEXT_CACHE_SIZE = 50_000  # chat is repetitive; identical texts are analyzed once per run
+PROGRESS_INTERVAL = 10.0
+SOURCE_COLUMNS = "message_id,player_id,message,created_at"
+# Source fields carried into the upsert so rows missing from the table can be inserted
+RECORD_FIELDS = ("message_id", "player_id", "message", "created_at", "player_name")
+
+# Rough list prices for the cost estimate; override on the command line
+GEMINI_USD_PER_CALL = 0.00006  # gemini-2.0-flash, ~400 prompt + ~50 output tokens
+HF_USD_PER_CALL = 0.0          # serverless hf-inference; set for dedicated endpoints
+
+
+class BackfillError(Exception):
+    """A message whose results can't be trusted, e.g. because a stage fell back"""
+
+
+@dataclass
+class Checkpoint:
+    source: str
+    stages: List[str]
+    position: Any = None  # keyset cursor for Supabase, lines consumed for JSONL
+    processed: int = 0
+    written: int = 0
+    failed: int = 0
+    oldest_first: bool = True  # False in checkpoints of runs that read Supabase newest first
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as handle:
+            return cls(**{"oldest_first": False, **json.load(handle)})
+
+    def save(self, path: str) -> None:
+        """Write atomically so a crash mid-write leaves the previous checkpoint intact"""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            json.dump(asdict(self), handle)
+        os.replace(temporary, path)
+
+
+@dataclass
+class BackfillStats:
+    started: float = field(default_factory=time.perf_counter)
+    processed: int = 0
+    written: int = 0
+    failed: int = 0
+    cache_hits: int = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+# ---------- Sources ----------
+Page = List[Tuple[Any, Dict[str, Any]]]
+
+
+def supabase_source(
+    after: Optional[List[Any]],
+    since: Optional[str],
+    until: Optional[str],
+    player_id: Optional[int],
+) -> Iterator[Page]:
+    """Pages of (cursor, row) oldest first, continuing after the checkpointed cursor"""
+    def build_query():
+        query = get_supabase().table('messages').select(SOURCE_COLUMNS)
+        if since:
+            query = query.gte('created_at', since)
+        if until:
+            query = query.lt('created_at', until)
+        if player_id is not None:
+            query = query.eq('player_id', player_id)
+        return query
+
+    for rows in iter_message_pages(build_query, after=after, oldest_first=True):
+        yield [([row["created_at"], row["message_id"]], row) for row in rows]
+
+
+def jsonl_source(path: str, skip: int, page_size: int = WRITE_BATCH_SIZE) -> Iterator[Page]:
+    """Pages of (lines consumed, row) from a JSONL file with message_id and message fields"""
+    page: Page = []
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            if line_number <= skip or not line.strip():
+                continue
+            page.append((line_number, json.loads(line)))
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+# ---------- Processing ----------
+class Replayer:
+    """Runs the selected graphs for one message, sharing results between identical texts"""
+
+    def __init__(self, stages: Tuple[str, ...], clear_actions: bool, cache_size: int = TEXT_CACHE_SIZE):
+        self.stages = stages
+        self.clear_actions = clear_actions
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.cache_hits = 0
+
+    async def columns(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        text = row["message"]
+        if text in self._cache:
+            self._cache.move_to_end(text)
+            self.cache_hits += 1
+            return self._cache[text]
+        if text in self._inflight:
+            self.cache_hits += 1
+            return await asyncio.shield(self._inflight[text])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[text] = future
+        try:
+            result = await self._analyze(row)
+            future.set_result(result)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(text, None)
+
+        self._cache[text] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def _analyze(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        message = ChatMessage(
+            message=row["message"],
+            message_id=row["message_id"],
+            player_id=row.get("player_id"),
+            player_name=row.get("player_name"),
+        )
+        moderation, sentiment = None, None
+        with capture_fallbacks() as fallbacks:
+            if "moderation" in self.stages and "sentiment" in self.stages:
+                moderation, sentiment = await asyncio.gather(
+                    moderate_message(message, replay=True), analyze_message_sentiment(message, replay=True)
+                )
+            elif "moderation" in self.stages:
+                moderation = await moderate_message(message, replay=True)
+            else:
+                sentiment = await analyze_message_sentiment(message, replay=True)
+        if fallbacks:
+            raise BackfillError(f"fallback in {', '.join(sorted(set(fallbacks)))}")
+
+        columns: Dict[str, Any] = {}
+        if moderation is not None:
+            if self.clear_actions:
+                columns.update({"moderation_action": None, "moderation_reason": None})
+            columns.update(content_columns(moderation))
+            columns.update(moderation_columns(moderation))
+        if sentiment is not None:
+            columns.update(sentiment_columns(sentiment.chat_analysis))
+        return columns
+
+
+def write_results(rows: List[Dict[str, Any]]) -> int:
+    """Bulk upsert, one request per distinct column set since PostgREST needs uniform keys"""
+    players = {
+        row["player_id"]: {"player_id": row["player_id"], "player_name": row["player_name"]}
+        for row in rows if row.get("player_name") and row.get("player_id") is not None
+    }
+    if players:
+        execute_query(get_supabase().table('players').upsert(list(players.values())), 'players', 'backfill')
+
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        record = {key: value for key, value in row.items() if key != "player_name"}
+        groups.setdefault(tuple(sorted(record)), []).append(record)
+    for records in groups.values():
+        execute_query(
+            get_supabase().table('messages').upsert(records, on_conflict='message_id'),
+            'messages', 'backfill'
+        )
+    return len(rows)
+
+
+class Backfill:
+    """
+    Bounded-concurrency replay with checkpointing
+
+    Workers pull rows from a bounded queue, so memory stays flat for any source size.
+    The checkpoint only advances past rows whose results have been written (or recorded
+    as failed), so completion order across workers doesn't matter.
+    """
+
+    def __init__(self, args: argparse.Namespace, checkpoint: Checkpoint):
+        self.args = args
+        self.checkpoint = checkpoint
+        self._base = Checkpoint(**asdict(checkpoint))  # totals from earlier runs
+        self.stats = BackfillStats()
+        self.replayer = Replayer(tuple(checkpoint.stages), args.clear_actions)
+        self.failures_path = f"{args.checkpoint or 'backfill'}.failed.jsonl"
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+        self._pending: List[Tuple[int, Dict[str, Any]]] = []
+        self._positions: Dict[int, Any] = {}
+        self._done: set = set()
+        self._watermark = 0  # every sequence number below this is written or failed
+        self._flush_lock = asyncio.Lock()
+
+    def _source(self) -> Iterator[Page]:
+        if self.args.input:
+            return jsonl_source(self.args.input, self.checkpoint.position or 0)
+        return supabase_source(self.checkpoint.position, self.args.since, self.args.until, self.args.player_id)
+
+    async def _produce(self) -> None:
+        pages = self._source()
+        sequence = 0
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                break
+            for position, row in page:
+                if self.args.limit and sequence >= self.args.limit:
+                    return
+                self._positions[sequence] = position
+                await self._queue.put((sequence, row))
+                sequence += 1
+
+    async def _work(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            sequence, row = item
+            try:
+                columns = await self.replayer.columns(row)
+            except Exception as e:
+                self._record_failure(sequence, row, e)
+            else:
+                record = {key: row[key] for key in RECORD_FIELDS if row.get(key) is not None}
+                self._pending.append((sequence, {**record, **columns}))
+                if len(self._pending) >= self.args.batch_size:
+                    await self.flush()
+            finally:
+                self.stats.processed += 1
+
+    def _record_failure(self, sequence: int, row: Dict[str, Any], error: Exception) -> None:
+        self.stats.failed += 1
+        logger.warning(f"Backfill failed for {row.get('message_id')}: {error}")
+        with open(self.failures_path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(row, default=str) + "\n")
+        self._mark_done([sequence])
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            if not self.args.dry_run:
+                await asyncio.to_thread(write_results, [record for _, record in batch])
+            self.stats.written += len(batch)
+            self._mark_done([sequence for sequence, _ in batch])
+
+    def _mark_done(self, sequences: List[int]) -> None:
+        self._done.update(sequences)
+        advanced = False
+        while self._watermark in self._done:
+            self._done.remove(self._watermark)
+            self.checkpoint.position = self._positions.pop(self._watermark)
+            self._watermark += 1
+            advanced = True
+        if advanced and self.args.checkpoint and not self.args.dry_run:
+            self.checkpoint.processed = self._base.processed + self._watermark
+            self.checkpoint.written = self._base.written + self.stats.written
+            self.checkpoint.failed = self._base.failed + self.stats.failed
+            self.checkpoint.save(self.args.checkpoint)
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            print(
+                f"  {self.stats.processed} processed, {self.stats.failed} failed, "
+                f"{self.stats.rate:.1f} msg/s, {self.replayer.cache_hits} cache hits"
+            )
+
+    async def _feed(self) -> None:
+        await self._produce()
+        for _ in range(self.args.concurrency):
+            await self._queue.put(None)
+
+    async def run(self) -> BackfillStats:
+        loop = asyncio.get_running_loop()
+        # Each message can hold up to three HF calls in worker threads at once
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.args.concurrency * 3 + 4))
+
+        tasks = [asyncio.create_task(self._feed())]
+        tasks += [asyncio.create_task(self._work()) for _ in range(self.args.concurrency)]
+        progress = asyncio.create_task(self._report_progress())
+        try:
+            # A failed bulk write stops the run; the checkpoint still points before it
+            await asyncio.gather(*tasks)
+            await self.flush()
+        finally:
+            progress.cancel()
+            for task in tasks:
+                task.cancel()
+        self.stats.cache_hits = self.replayer.cache_hits
+        return self.stats
+
+
+# ---------- Reporting ----------
+def dependency_calls() -> Dict[str, int]:
+    """Calls per dependency so far, read from the Prometheus latency histograms"""
+    calls: Dict[str, int] = {}
+    for metric in DEPENDENCY_LATENCY.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                dependency = sample.labels["dependency"]
+                calls[dependency] = calls.get(dependency, 0) + int(sample.value)
+    return calls
+
+
+def report(stats: BackfillStats, calls: Dict[str, int], args: argparse.Namespace) -> None:
+    prices = {"gemini": args.gemini_usd_per_call, "huggingface": args.hf_usd_per_call}
+    cost = sum(calls.get(dependency, 0) * price for dependency, price in prices.items())
+    print(f"processed {stats.processed} messages in {stats.elapsed:.1f}s ({stats.rate:.1f} msg/s)")
+    print(f"  {'written:':<20}{stats.written}{' (dry run, nothing stored)' if args.dry_run else ''}")
+    print(f"  {'failed:':<20}{stats.failed}")
+    print(f"  {'text cache hits:':<20}{stats.cache_hits}")
+    for dependency in sorted(calls):
+        print(f"  {dependency + ' calls:':<20}{calls[dependency]}")
+    print(f"  {'estimated cost:':<20}${cost:.4f}" + (f" (${cost / stats.processed * 1000:.4f} per 1k messages)" if stats.processed else ""))
+
+
+# ---------- CLI ----------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m services.backfill", description="Replay the pipelines over stored messages")
+    parser.add_argument("--input", help="JSONL file of messages (default: stream the messages table)")
+    parser.add_argument("--checkpoint", help="checkpoint file; re-running with it resumes")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated: moderation,sentiment")
+    parser.add_argument("--since", help="only messages created at or after this ISO timestamp")
+    parser.add_argument("--until", help="only messages created before this ISO timestamp")
+    parser.add_argument("--player-id", type=int)
+    parser.add_argument("--limit", type=int, help="stop after this many messages")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=WRITE_BATCH_SIZE, help="rows per bulk upsert")
+    parser.add_argument("--clear-actions", action="store_true", help="null out moderation actions the new run doesn't recommend")
+    parser.add_argument("--dry-run", action="store_true", help="run the pipelines but don't write or checkpoint")
+    parser.add_argument("--gemini-usd-per-call", type=float, default=GEMINI_USD_PER_CALL)
+    parser.add_argument("--hf-usd-per-call", type=float, default=HF_USD_PER_CALL)
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if not stages or unknown:
+        parser.error(f"--stages must be a subset of {','.join(STAGES)}")
+    if args.input and (args.since or args.until or args.player_id is not None):
+        parser.error("--since, --until and --player-id filter the messages table, not --input")
+
+    source = args.input or "supabase"
+    checkpoint = Checkpoint.load(args.checkpoint)
+    if checkpoint and (checkpoint.source != source or checkpoint.stages != stages):
+        parser.error(f"{args.checkpoint} belongs to a {checkpoint.source} run of {','.join(checkpoint.stages)}")
+    if checkpoint and not checkpoint.oldest_first and not args.input:
+        parser.error(f"{args.checkpoint} walked the messages table newest first; start a new checkpoint")
+    if checkpoint:
+        print(f"resuming after {checkpoint.processed} messages")
+    checkpoint = checkpoint or Checkpoint(source=source, stages=stages)
+
+    calls_before = dependency_calls()
+    stats = asyncio.run(Backfill(args, checkpoint).run())
+    calls_after = dependency_calls()
+    calls = {
+        dependency: count - calls_before.get(dependency, 0)
+        for dependency, count in calls_after.items()
+        if dependency in ("gemini", "huggingface")
+    }
+    report(stats, calls, args)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,6 @@ class ChatService:
     def __init__(self):
         self.moderation_service = ModerationService()
 
-    async def moderate_message(self, request: ChatMessage) -> ModerationState:
+    async def moderate_message(self, request: ChatMessage, local_only: bool = False) -> ModerationState:
         """Process message through moderation only"""
-        return await self.moderation_service.moderate_chat_message(request)
+        return await self.moderation_service.moderate_chat_message(request, local_only)
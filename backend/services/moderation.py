@@ -1,15 +1,20 @@
 import logging
 from agents.moderation import moderate_message, ChatMessage, ModerationState
+from .analytics import ANALYTICS_FLUSH_INTERVAL, analytics_rollups
 
 logger = logging.getLogger(__name__)
 
 
 class ModerationService:
     @staticmethod
-    async def moderate_chat_message(message: ChatMessage) -> ModerationState:
+    async def moderate_chat_message(message: ChatMessage, local_only: bool = False) -> ModerationState:
         """Core moderation business logic"""
         try:
-            return await moderate_message(message)
+            state = await moderate_message(message, local_only=local_only)
+            analytics_rollups.record_moderation(state)
+            # Backstop for hosts where the background flush task never runs (serverless)
+            analytics_rollups.flush_if_due(2 * ANALYTICS_FLUSH_INTERVAL)
+            return state
         except Exception as e:
             logger.error(f"Moderation service error: {e}")
             raise
@@ -0,0 +1,166 @@
+"""
+In-memory player presence
+Chat lines bump a player's last-seen time in memory instead of upserting their players
+row; changed players are flushed to Supabase in one bulk upsert every few seconds, and
+the online list is served straight from memory
+
+Players are kept in recency order, so listing who is online walks only the players
+seen within the window. Each worker tracks the players whose messages it handled.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.cache import response_cache
+from utils.db import get_supabase
+from utils.metrics import execute_query
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("BLOOM_PRESENCE_FLUSH_INTERVAL", "5"))
+PRESENCE_TTL = 60 * 60      # seconds; idle players are forgotten once flushed
+ONLINE_WINDOW = 5 * 60      # seconds since their last message for a player to count as online
+FLUSH_BATCH_SIZE = 500      # rows per bulk upsert
+
+
+def _timestamp(seen_at: float) -> str:
+    return datetime.fromtimestamp(seen_at, timezone.utc).isoformat()
+
+
+class PresenceTracker:
+    """
+    Last-seen time and name per player
+
+    A player's first message in this process still writes their row immediately, so
+    the message insert and the live feed can rely on it; later messages only mark them
+    for the next flush.
+    """
+
+    def __init__(self):
+        self._players: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def seen(self, player_id: int, player_name: str, seen_at: Optional[float] = None) -> None:
+        """Record a chat line from a player"""
+        seen_at = time.time() if seen_at is None else seen_at
+        with self._lock:
+            known = player_id in self._players
+            self._players[player_id] = (player_name, seen_at)
+            self._players.move_to_end(player_id)
+            if known:
+                self._dirty.add(player_id)
+                return
+
+        try:
+            execute_query(
+                get_supabase().table('players').upsert({
+                    "player_id": player_id,
+                    "player_name": player_name,
+                    "last_seen": _timestamp(seen_at),
+                }),
+                'players', 'upsert'
+            )
+        except Exception:
+            # Treated as new again next time, so the row is retried before their next message
+            with self._lock:
+                self._players.pop(player_id, None)
+            raise
+        response_cache.invalidate("players")
+
+    def online(self, window: float = ONLINE_WINDOW, limit: int = 100) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Players seen within the last window seconds, most recent first
+
+        Returns:
+            Up to limit players, and how many are online in total
+        """
+        cutoff = time.time() - window
+        players, count = [], 0
+        with self._lock:
+            for player_id, (player_name, seen_at) in reversed(self._players.items()):
+                if seen_at < cutoff:
+                    break
+                count += 1
+                if len(players) < limit:
+                    players.append({
+                        "player_id": player_id,
+                        "player_name": player_name,
+                        "last_seen": _timestamp(seen_at),
+                    })
+        return players, count
+
+    # ----- Supabase flush -----
+    def flush_if_due(self, max_age: float = PRESENCE_FLUSH_INTERVAL) -> None:
+        """Flush when the last one is older than max_age seconds; cheap to call per message"""
+        if time.monotonic() - self._last_flush < max_age:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            # Players stay marked and go out with the next flush
+            logger.warning(f"Presence flush failed: {str(e)}")
+
+    def flush(self) -> int:
+        """
+        Upsert every player seen since the last flush, then forget idle players
+
+        Returns:
+            Number of players written
+        """
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # another thread is already flushing
+        try:
+            self._last_flush = time.monotonic()
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                rows = []
+                for player_id in dirty:
+                    if player_id not in self._players:
+                        continue  # its first write failed; it is written again when next seen
+                    player_name, seen_at = self._players[player_id]
+                    rows.append({"player_id": player_id, "player_name": player_name, "last_seen": _timestamp(seen_at)})
+
+            written = 0
+            try:
+                for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                    batch = rows[start:start + FLUSH_BATCH_SIZE]
+                    execute_query(get_supabase().table('players').upsert(batch), 'players', 'upsert')
+                    written += len(batch)
+            except Exception:
+                with self._lock:
+                    self._dirty.update(row["player_id"] for row in rows[written:])
+                raise
+            finally:
+                if written:
+                    response_cache.invalidate("players")
+
+            self._forget_idle()
+            return written
+        finally:
+            self._flush_lock.release()
+
+    def _forget_idle(self) -> None:
+        cutoff = time.time() - PRESENCE_TTL
+        with self._lock:
+            while self._players:
+                player_id, (_, seen_at) = next(iter(self._players.items()))
+                if seen_at >= cutoff or player_id in self._dirty:
+                    break
+                del self._players[player_id]
+
+
+# Shared by the chat routes, the online endpoint and the background flush
+presence_tracker = PresenceTracker()
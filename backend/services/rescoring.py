@@ -0,0 +1,272 @@
+"""
+Vectorized re-scoring of stored messages
+Recomputes sentiment scores, reward points and leaderboards from the probability
+vectors persisted with each message, without calling HuggingFace or Gemini again
+
+Usage:
+    python -m services.rescoring --threshold 25          # what-if over Supabase history
+    python -m services.rescoring --input export.ndjson   # over an /api/export/messages dump
+    python -m services.rescoring --apply                 # write changed sentiment scores back
+    python -m services.rescoring --processes 8           # split large histories across 8 processes
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agents.moderation.nodes import CONTENT_LABELS
+from agents.sentiment.nodes import (
+    NEGATIVE_ACTION_POINTS,
+    POSITIVE_ACTION_POINTS,
+    POSITIVE_ACTIONS,
+    POSITIVE_SENTIMENT_POINTS,
+    POSITIVE_SENTIMENT_THRESHOLD,
+    SENTIMENT_LABELS,
+)
+from agents.sentiment.state import CommunityAction
+from utils.cpu_pool import CPUPool
+from utils.db import get_supabase
+from utils.export import iter_message_pages
+from utils.metrics import execute_query
+
+
+# ---------- Configuration ----------
+RESCORE_COLUMNS = "message_id,player_id,created_at,sentiment_score,sentiment_probs,content_probs,community_intent"
+APPLY_BATCH_SIZE = 1000
+
+INTENTS = tuple(CommunityAction)
+INTENT_CODES = {intent.value: code for code, intent in enumerate(INTENTS)}
+NO_INTENT = -1
+
+
+@dataclass
+class RescoreConfig:
+    """Scoring policy; defaults mirror the live pipeline in agents/sentiment/nodes.py"""
+    positive_sentiment_threshold: int = POSITIVE_SENTIMENT_THRESHOLD
+    positive_sentiment_points: int = POSITIVE_SENTIMENT_POINTS
+    positive_action_points: int = POSITIVE_ACTION_POINTS
+    negative_action_points: int = NEGATIVE_ACTION_POINTS
+    positive_actions: frozenset = field(default_factory=lambda: POSITIVE_ACTIONS)
+
+
+@dataclass
+class MessageArrays:
+    """Column-oriented view of stored messages; rows without probabilities hold NaN"""
+    message_ids: np.ndarray      # object
+    player_ids: np.ndarray       # int64
+    stored_scores: np.ndarray    # int32
+    sentiment_probs: np.ndarray  # float32 (n, len(SENTIMENT_LABELS))
+    content_probs: np.ndarray    # float32 (n, len(CONTENT_LABELS))
+    intents: np.ndarray          # int8 index into INTENTS, NO_INTENT when absent
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    @property
+    def has_sentiment(self) -> np.ndarray:
+        return ~np.isnan(self.sentiment_probs).any(axis=1)
+
+
+def _vector(value: Optional[Sequence[float]], width: int) -> List[float]:
+    if not value or len(value) != width:
+        return [np.nan] * width
+    return value
+
+
+def collect(pages: Iterable[List[Dict[str, Any]]]) -> MessageArrays:
+    """Convert pages of message rows into MessageArrays, one page at a time"""
+    chunks: Dict[str, List[np.ndarray]] = {name: [] for name in MessageArrays.__dataclass_fields__}
+    for rows in pages:
+        chunks["message_ids"].append(np.array([row["message_id"] for row in rows], dtype=object))
+        chunks["player_ids"].append(np.array([row.get("player_id") or 0 for row in rows], dtype=np.int64))
+        chunks["stored_scores"].append(np.array([row.get("sentiment_score") or 0 for row in rows], dtype=np.int32))
+        chunks["sentiment_probs"].append(np.array(
+            [_vector(row.get("sentiment_probs"), len(SENTIMENT_LABELS)) for row in rows], dtype=np.float32
+        ).reshape(-1, len(SENTIMENT_LABELS)))
+        chunks["content_probs"].append(np.array(
+            [_vector(row.get("content_probs"), len(CONTENT_LABELS)) for row in rows], dtype=np.float32
+        ).reshape(-1, len(CONTENT_LABELS)))
+        chunks["intents"].append(np.array(
+            [INTENT_CODES.get(row.get("community_intent"), NO_INTENT) for row in rows], dtype=np.int8
+        ))
+    if not chunks["message_ids"]:
+        return MessageArrays(
+            message_ids=np.empty(0, dtype=object),
+            player_ids=np.empty(0, dtype=np.int64),
+            stored_scores=np.empty(0, dtype=np.int32),
+            sentiment_probs=np.empty((0, len(SENTIMENT_LABELS)), dtype=np.float32),
+            content_probs=np.empty((0, len(CONTENT_LABELS)), dtype=np.float32),
+            intents=np.empty(0, dtype=np.int8),
+        )
+    return MessageArrays(**{name: np.concatenate(parts) for name, parts in chunks.items()})
+
+
+# ---------- Vectorized Scoring ----------
+def score_sentiment(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Vectorized score_from_probabilities: (positive - negative) * (1 - neutral) * 100
+
+    Computed in float64 and rounded half-to-even like Python's round(), so results match
+    the live pipeline for the same stored probabilities. NaN rows score 0.
+    """
+    p = probabilities.astype(np.float64)
+    negative, neutral, positive = p[:, 0], p[:, 1], p[:, 2]
+    scores = np.rint((positive - negative) * (1 - neutral) * 100)
+    return np.nan_to_num(scores, nan=0.0).astype(np.int32)
+
+
+def reward_points(scores: np.ndarray, intents: np.ndarray, config: RescoreConfig) -> np.ndarray:
+    """Vectorized calculate_reward over sentiment scores and intent codes"""
+    positive_codes = np.array([intent in config.positive_actions for intent in INTENTS])
+    has_intent = intents != NO_INTENT
+    is_positive = has_intent & positive_codes[np.where(has_intent, intents, 0)]
+
+    points = np.where(scores > config.positive_sentiment_threshold, config.positive_sentiment_points, 0)
+    points += np.where(is_positive, config.positive_action_points, 0)
+    points += np.where(has_intent & ~is_positive, config.negative_action_points, 0)
+    return points.astype(np.int32)
+
+
+def main_categories(content_probs: np.ndarray) -> np.ndarray:
+    """Index into CONTENT_LABELS of the highest scoring category, -1 where never moderated"""
+    moderated = ~np.isnan(content_probs).any(axis=1)
+    return np.where(moderated, np.argmax(np.nan_to_num(content_probs, nan=-1.0), axis=1), -1)
+
+
+def leaderboard(player_ids: np.ndarray, values: np.ndarray, top: int) -> List[Tuple[int, int, int]]:
+    """Per-player (player_id, total, message_count), highest total first"""
+    if not len(player_ids):
+        return []
+    players, inverse = np.unique(player_ids, return_inverse=True)
+    totals = np.bincount(inverse, weights=values, minlength=len(players))
+    counts = np.bincount(inverse, minlength=len(players))
+    order = np.argsort(-totals, kind="stable")[:top]
+    return [(int(players[i]), int(totals[i]), int(counts[i])) for i in order]
+
+
+@dataclass
+class RescoreResult:
+    scores: np.ndarray
+    points: np.ndarray
+    changed: np.ndarray  # rows with stored probabilities whose sentiment score differs
+
+
+def rescore(messages: MessageArrays, config: RescoreConfig, pool: Optional[CPUPool] = None) -> RescoreResult:
+    """
+    Recompute scores and rewards; rows without stored probabilities keep their stored score
+
+    With a pool, large histories are scored in row slices across its processes.
+    """
+    has_sentiment = messages.has_sentiment
+    if pool is None:
+        sentiment = score_sentiment(messages.sentiment_probs)
+    else:
+        sentiment = pool.map_rows(score_sentiment, [messages.sentiment_probs], np.int32)
+    scores = np.where(has_sentiment, sentiment, messages.stored_scores).astype(np.int32)
+    if pool is None:
+        points = reward_points(scores, messages.intents, config)
+    else:
+        points = pool.map_rows(partial(reward_points, config=config), [scores, messages.intents], np.int32)
+    return RescoreResult(
+        scores=scores,
+        points=points,
+        changed=has_sentiment & (scores != messages.stored_scores),
+    )
+
+
+# ---------- Sources ----------
+def supabase_pages() -> Iterator[List[Dict[str, Any]]]:
+    return iter_message_pages(lambda: get_supabase().table('messages').select(RESCORE_COLUMNS))
+
+
+def ndjson_pages(path: str, batch_size: int = APPLY_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def apply_scores(messages: MessageArrays, result: RescoreResult, batch_size: int = APPLY_BATCH_SIZE) -> int:
+    """Write changed sentiment scores back through the apply_sentiment_scores RPC"""
+    indexes = np.flatnonzero(result.changed)
+    updated = 0
+    for start in range(0, len(indexes), batch_size):
+        batch = indexes[start:start + batch_size]
+        response = execute_query(
+            get_supabase().rpc('apply_sentiment_scores', {
+                'p_message_ids': messages.message_ids[batch].tolist(),
+                'p_scores': result.scores[batch].tolist(),
+            }),
+            'rpc', 'apply_sentiment_scores'
+        )
+        updated += response.data or 0
+    return updated
+
+
+# ---------- CLI ----------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m services.rescoring", description="Re-score stored messages")
+    parser.add_argument("--input", help="NDJSON from /api/export/messages?fields=scores (default: read Supabase)")
+    parser.add_argument("--threshold", type=int, default=POSITIVE_SENTIMENT_THRESHOLD)
+    parser.add_argument("--positive-sentiment-points", type=int, default=POSITIVE_SENTIMENT_POINTS)
+    parser.add_argument("--positive-action-points", type=int, default=POSITIVE_ACTION_POINTS)
+    parser.add_argument("--negative-action-points", type=int, default=NEGATIVE_ACTION_POINTS)
+    parser.add_argument("--top", type=int, default=10, help="leaderboard size")
+    parser.add_argument("--apply", action="store_true", help="write changed sentiment scores to Supabase")
+    parser.add_argument("--processes", type=int, default=1, help="score large histories across this many processes")
+    args = parser.parse_args(argv)
+    if args.apply and args.input:
+        parser.error("--apply writes to Supabase and can't be combined with --input")
+
+    config = RescoreConfig(
+        positive_sentiment_threshold=args.threshold,
+        positive_sentiment_points=args.positive_sentiment_points,
+        positive_action_points=args.positive_action_points,
+        negative_action_points=args.negative_action_points,
+    )
+
+    started = time.perf_counter()
+    messages = collect(ndjson_pages(args.input) if args.input else supabase_pages())
+    loaded = time.perf_counter()
+    # A single process runs every step inline
+    with CPUPool(args.processes) as pool:
+        result = rescore(messages, config, pool)
+        categories = pool.map_rows(main_categories, [messages.content_probs], np.int64)
+    sentiment_board = leaderboard(messages.player_ids, result.scores, args.top)
+    points_board = leaderboard(messages.player_ids, result.points, args.top)
+    scored = time.perf_counter()
+
+    print(f"loaded {len(messages)} messages in {loaded - started:.2f}s, re-scored in {(scored - loaded) * 1000:.1f} ms")
+    print(f"  with sentiment probabilities: {int(messages.has_sentiment.sum())}")
+    print(f"  sentiment scores changed:     {int(result.changed.sum())}")
+    print(f"  reward points awarded:        {int(result.points.sum())}")
+    flagged = {
+        label: int((categories == index).sum())
+        for index, label in enumerate(CONTENT_LABELS) if label != "OK"
+    }
+    print(f"  harmful main categories:      {flagged}")
+
+    for title, board in (("sentiment score", sentiment_board), ("reward points", points_board)):
+        print(f"\ntop {args.top} by {title}:")
+        for rank, (player_id, total, count) in enumerate(board, 1):
+            print(f"  {rank:>3}. player {player_id:<10} {total:>10} over {count} messages")
+
+    if args.apply:
+        print(f"\nupdated {apply_scores(messages, result)} messages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
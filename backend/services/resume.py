@@ -0,0 +1,104 @@
+"""
+Resume worker for interrupted graph runs
+Finishes moderation and sentiment runs left behind by a crash, deploy or failed call
+from their last snapshot, then stores the result like the chat routes would
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List
+
+import agents.moderation  # noqa: F401 - registers the graphs runs are resumed with
+import agents.sentiment  # noqa: F401
+from utils.cache import response_cache
+from utils.db import get_supabase
+from utils.dependencies import content_columns, moderation_columns, reward_columns, sentiment_columns
+from utils.graph_state import get_run_store, resume_run
+from utils.message_cache import message_cache
+from utils.metrics import execute_query
+from .score_store import get_score_store
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+RESUME_INTERVAL = float(os.getenv("BLOOM_RESUME_INTERVAL", "30"))
+
+
+# ---------- Result Handlers ----------
+def _update_message(message_id: str, update_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Update a stored message, returning the updated rows: none if it was never stored"""
+    updated = execute_query(
+        get_supabase().table('messages').update(update_data).eq('message_id', message_id),
+        'messages', 'update'
+    )
+    message_cache.written(message_id, updated.data)
+    response_cache.invalidate("messages")
+    return updated.data
+
+
+def apply_moderation(state: Any) -> None:
+    """Replace the fallback verdict stored when the live run failed"""
+    _update_message(state.message.message_id, {
+        **content_columns(state),
+        "moderation_action": None,
+        "moderation_reason": None,
+        **moderation_columns(state),
+    })
+
+
+def apply_sentiment(state: Any) -> None:
+    """
+    Store sentiment columns and award the points the failed live run never did
+
+    Messages that were never stored are skipped. Points are awarded only after setting
+    points_awarded on a row where it was still null, so a live fallback that already
+    awarded them, or a second resume of the same message, adds nothing.
+    """
+    chat = state.chat_analysis.chat
+    if not _update_message(chat.message_id, sentiment_columns(state.chat_analysis)):
+        logger.info(f"Skipping points for {chat.message_id}: message was never stored")
+        return
+    if not state.reward_system:
+        return
+    claimed = execute_query(
+        get_supabase().table('messages').update(reward_columns(state))
+        .eq('message_id', chat.message_id).is_('points_awarded', 'null'),
+        'messages', 'update'
+    )
+    if claimed.data:
+        get_score_store().add(chat.player_id or 0, state.reward_system.points_awarded, chat.player_name)
+
+
+HANDLERS: Dict[str, Callable[[Any], None]] = {
+    "moderation": apply_moderation,
+    "sentiment": apply_sentiment,
+}
+
+
+# ---------- Worker ----------
+async def _resume_all() -> int:
+    resumed = 0
+    for name, run_id in get_run_store().interrupted():
+        try:
+            resumed += await resume_run(name, run_id, HANDLERS[name])
+        except Exception as e:
+            # Lease released with one more attempt counted; retried on the next tick
+            logger.error(f"Resuming {name} run {run_id} failed: {str(e)}")
+    return resumed
+
+
+def resume_interrupted_runs() -> int:
+    """
+    Resume every run whose lease lapsed; blocking, run from the background task
+
+    Returns:
+        Number of runs resumed
+    """
+    if get_run_store() is None:
+        return 0
+    resumed = asyncio.run(_resume_all())
+    if resumed:
+        logger.info(f"Resumed {resumed} interrupted graph runs")
+    return resumed
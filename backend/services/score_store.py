@@ -0,0 +1,372 @@
+"""
+Durable, cross-worker reward score store
+Hot tier in memory, an append-only log plus periodic snapshots on local disk for fast
+warm starts, and periodic merges into the Supabase player_scores table so every worker
+serves the same totals
+
+Each worker process claims a numbered slot in the store directory with a file lock, so
+a restarted worker picks up its predecessor's log. Merges are applied through the
+merge_player_scores RPC under a random batch ID logged before the first send, so a
+merge that is retried after a crash resends the same ID and is a no-op instead of a
+double count.
+"""
+
+import heapq
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.db import get_supabase
+from utils.metrics import execute_query
+from utils.pagination import apply_player_keyset
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker, no slot locking
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+SCORE_DIR = os.getenv("BLOOM_SCORE_DIR", os.path.join(tempfile.gettempdir(), "bloom-scores"))
+SCORE_MERGE_INTERVAL = float(os.getenv("BLOOM_SCORE_MERGE_INTERVAL", "5"))
+SCORE_SNAPSHOT_INTERVAL = float(os.getenv("BLOOM_SCORE_SNAPSHOT_INTERVAL", "60"))
+MAX_SLOTS = 64
+REFRESH_PAGE_SIZE = 1000
+# Re-read rows updated slightly before the last refresh so commits that raced it aren't missed
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class ScoreStore:
+    """
+    Reward points per player
+
+    Reads are served from memory as merged Supabase totals plus this worker's unmerged
+    deltas. Every write is appended to the log before it is acknowledged.
+    """
+
+    def __init__(self, directory: Optional[str] = SCORE_DIR, slot: Optional[int] = None):
+        self.directory = directory
+        self.slot = slot
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._base: Dict[int, int] = {}         # totals as of the last refresh from Supabase
+        self._pending: List[Tuple[int, int, int]] = []  # (seq, player_id, delta) not yet merged
+        self._pending_totals: Dict[int, int] = {}
+        self._usernames: Dict[int, str] = {}
+        self._seq = 0
+        self._merging: Optional[Tuple[int, str]] = None  # (through-seq, batch ID) sent but not confirmed
+        self._refreshed_through: Optional[str] = None
+        self._last_merge = 0.0
+        self._log = None
+        self._slot_lock = None
+        if directory:
+            self._open()
+
+    # ----- persistence -----
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"worker-{self.slot}.{suffix}")
+
+    def _claim_slot(self) -> None:
+        for slot in range(MAX_SLOTS) if self.slot is None else [self.slot]:
+            handle = open(os.path.join(self.directory, f"worker-{slot}.lock"), "a")
+            if fcntl is None:
+                self.slot, self._slot_lock = slot, handle
+                return
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            self.slot, self._slot_lock = slot, handle
+            return
+        raise RuntimeError(f"No free score store slot in {self.directory}")
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._claim_slot()
+        started = time.perf_counter()
+        self._load_snapshot()
+        replayed = self._replay_log()
+        self._log = open(self._path("log"), "a", encoding="utf-8")
+        logger.info(
+            f"Score store slot {self.slot}: {len(self._base)} players, {len(self._pending)} unmerged deltas "
+            f"({replayed} log records) loaded in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self._path("snapshot"), encoding="utf-8") as handle:
+                snapshot = json.load(handle)
+        except FileNotFoundError:
+            return
+        self._seq = snapshot["seq"]
+        self._base = {int(k): v for k, v in snapshot["base"].items()}
+        self._usernames = {int(k): v for k, v in snapshot["usernames"].items()}
+        self._refreshed_through = snapshot.get("refreshed_through")
+        self._merging = self._batch(snapshot.get("merging"), snapshot.get("merging_batch"))
+        for seq, player_id, delta in snapshot["pending"]:
+            self._add_pending(seq, player_id, delta)
+
+    def _replay_log(self) -> int:
+        records = 0
+        try:
+            handle = open(self._path("log"), encoding="utf-8")
+        except FileNotFoundError:
+            return 0
+        with handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # torn final write from a crash
+                records += 1
+                if record["seq"] <= self._seq:
+                    continue
+                self._seq = record["seq"]
+                if "merging" in record:
+                    self._merging = self._batch(record["merging"], record.get("batch"))
+                elif "merged" in record:
+                    self._drop_pending(record["merged"])
+                    self._merging = None
+                else:
+                    self._add_pending(record["seq"], record["player_id"], record["delta"])
+                    if record.get("username"):
+                        self._usernames[record["player_id"]] = record["username"]
+        return records
+
+    def _batch(self, through_seq: Optional[int], batch_id: Optional[str]) -> Optional[Tuple[int, str]]:
+        if through_seq is None:
+            return None
+        # Files written before batch IDs were logged used the slot and seq as the ID
+        return through_seq, batch_id or f"{self.slot}:{through_seq}"
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self._log:
+            self._log.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._log.flush()
+
+    def snapshot(self) -> None:
+        """Write the full state and start a fresh log, keeping warm starts short"""
+        if not self.directory:
+            return
+        with self._lock:
+            state = {
+                "seq": self._seq,
+                "base": self._base,
+                "pending": self._pending,
+                "merging": self._merging[0] if self._merging else None,
+                "merging_batch": self._merging[1] if self._merging else None,
+                "usernames": self._usernames,
+                "refreshed_through": self._refreshed_through,
+            }
+            temporary = self._path("snapshot.tmp")
+            with open(temporary, "w", encoding="utf-8") as handle:
+                json.dump(state, handle, separators=(",", ":"))
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temporary, self._path("snapshot"))
+            if self._log:
+                self._log.close()
+                self._log = open(self._path("log"), "w", encoding="utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+            if self._slot_lock:
+                self._slot_lock.close()
+                self._slot_lock = None
+
+    def discard(self) -> None:
+        """Delete this slot's files once everything in them has been merged"""
+        self.close()
+        for suffix in ("snapshot", "log"):
+            try:
+                os.remove(self._path(suffix))
+            except FileNotFoundError:
+                pass
+
+    # ----- hot tier -----
+    def _add_pending(self, seq: int, player_id: int, delta: int) -> None:
+        self._pending.append((seq, player_id, delta))
+        self._pending_totals[player_id] = self._pending_totals.get(player_id, 0) + delta
+
+    def _drop_pending(self, through_seq: int) -> None:
+        self._pending = [entry for entry in self._pending if entry[0] > through_seq]
+        self._pending_totals = {}
+        for _, player_id, delta in self._pending:
+            self._pending_totals[player_id] = self._pending_totals.get(player_id, 0) + delta
+
+    def add(self, player_id: int, delta: int, username: Optional[str] = None) -> int:
+        """Record points for a player and return their new total"""
+        with self._lock:
+            self._seq += 1
+            record = {"seq": self._seq, "player_id": player_id, "delta": delta}
+            if username and self._usernames.get(player_id) != username:
+                record["username"] = username
+                self._usernames[player_id] = username
+            self._append(record)
+            self._add_pending(self._seq, player_id, delta)
+            return self.score(player_id)
+
+    def score(self, player_id: int) -> int:
+        with self._lock:
+            return self._base.get(player_id, 0) + self._pending_totals.get(player_id, 0)
+
+    def username(self, player_id: int) -> Optional[str]:
+        return self._usernames.get(player_id)
+
+    def totals(self) -> Dict[int, int]:
+        with self._lock:
+            merged = dict(self._base)
+            for player_id, delta in self._pending_totals.items():
+                merged[player_id] = merged.get(player_id, 0) + delta
+            return merged
+
+    def top(self, limit: int) -> List[Tuple[int, int]]:
+        return heapq.nlargest(limit, self.totals().items(), key=lambda item: item[1])
+
+    # ----- Supabase merge -----
+    def merge_if_due(self, max_age: float = SCORE_MERGE_INTERVAL) -> None:
+        """Merge when the last one is older than max_age seconds; cheap to call per write"""
+        if time.monotonic() - self._last_merge < max_age:
+            return
+        try:
+            self.merge()
+        except Exception as e:
+            # Deltas stay pending in the log and go out with the next merge
+            logger.warning(f"Score merge failed: {str(e)}")
+
+    def merge(self) -> None:
+        """Push unmerged deltas to player_scores and pull totals changed by other workers"""
+        if not self._merge_lock.acquire(blocking=False):
+            return  # another thread is already merging
+        try:
+            self._last_merge = time.monotonic()
+            with self._lock:
+                # Resend an unconfirmed batch unchanged so its batch ID deduplicates it
+                resend = self._merging is not None
+                through_seq, batch_id = self._merging if resend else (self._seq, uuid.uuid4().hex)
+                deltas: Dict[int, int] = {}
+                for seq, player_id, delta in self._pending:
+                    if seq <= through_seq:
+                        deltas[player_id] = deltas.get(player_id, 0) + delta
+                names = [self._usernames.get(player_id) for player_id in deltas]
+                if deltas and not resend:
+                    # Logged before the first send, so a resend after a crash reuses the ID
+                    self._merging = (through_seq, batch_id)
+                    self._seq += 1
+                    self._append({"seq": self._seq, "merging": through_seq, "batch": batch_id})
+
+            if deltas:
+                applied = execute_query(
+                    get_supabase().rpc('merge_player_scores', {
+                        'p_batch_id': batch_id,
+                        'p_player_ids': list(deltas),
+                        'p_deltas': list(deltas.values()),
+                        'p_names': names,
+                    }),
+                    'rpc', 'merge_player_scores'
+                ).data
+                if not applied and not resend:
+                    # Nothing was counted under an ID this worker never sent before, so keep
+                    # the deltas pending and send them under a new ID next time
+                    with self._lock:
+                        self._merging = None
+                        self._seq += 1
+                        self._append({"seq": self._seq, "merging": None})
+                    raise RuntimeError(f"merge_player_scores rejected new batch {batch_id}")
+                with self._lock:
+                    # Applied now, or by the earlier send whose response was lost. Fold the
+                    # merged deltas into the base until the refresh below confirms them
+                    for player_id, delta in deltas.items():
+                        self._base[player_id] = self._base.get(player_id, 0) + delta
+                    self._drop_pending(through_seq)
+                    self._merging = None
+                    self._seq += 1
+                    self._append({"seq": self._seq, "merged": through_seq})
+
+            changed, refreshed_through = self._fetch_changes()
+            with self._lock:
+                self._base.update(changed)
+                self._refreshed_through = refreshed_through
+        finally:
+            self._merge_lock.release()
+
+    def _fetch_changes(self) -> Tuple[Dict[int, int], Optional[str]]:
+        since = None
+        if self._refreshed_through:
+            since = (_parse_timestamp(self._refreshed_through) - REFRESH_OVERLAP).isoformat()
+        changed: Dict[int, int] = {}
+        latest = self._refreshed_through
+        for row in self._iter_scores(since):
+            changed[row["player_id"]] = row["score"]
+            if row.get("player_name"):
+                self._usernames.setdefault(row["player_id"], row["player_name"])
+            if latest is None or _parse_timestamp(row["updated_at"]) > _parse_timestamp(latest):
+                latest = row["updated_at"]
+        return changed, latest
+
+    def _iter_scores(self, since: Optional[str]) -> Iterator[Dict[str, Any]]:
+        after = None
+        while True:
+            query = get_supabase().table('player_scores').select('player_id,player_name,score,updated_at')
+            if since:
+                query = query.gte('updated_at', since)
+            rows = execute_query(
+                apply_player_keyset(query, after).limit(REFRESH_PAGE_SIZE), 'player_scores', 'select'
+            ).data
+            yield from rows
+            if len(rows) < REFRESH_PAGE_SIZE:
+                return
+            after = [rows[-1]["player_id"]]
+
+
+# Opened on first use so importing the routes doesn't touch the disk
+@cache
+def get_score_store() -> ScoreStore:
+    return ScoreStore()
+
+
+def recover_orphaned_slots(directory: str = SCORE_DIR) -> int:
+    """
+    Merge and remove logs left by workers that no longer run, e.g. after scaling down
+
+    Returns:
+        Number of slots recovered
+    """
+    if fcntl is None or not directory or not os.path.isdir(directory):
+        return 0
+    recovered = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".lock"):
+            continue
+        slot = int(name[len("worker-"):-len(".lock")])
+        if not any(os.path.exists(os.path.join(directory, f"worker-{slot}.{suffix}")) for suffix in ("log", "snapshot")):
+            continue
+        try:
+            orphan = ScoreStore(directory, slot=slot)
+        except RuntimeError:
+            continue  # slot is held by a live worker
+        try:
+            orphan.merge()
+            orphan.discard()
+            recovered += 1
+        except Exception as e:
+            orphan.close()
+            logger.error(f"Could not recover score slot {slot}: {str(e)}")
+    return recovered
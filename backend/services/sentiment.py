@@ -1,40 +1,47 @@
 import logging
-from collections import defaultdict
+from typing import Optional
 
 from agents.sentiment import (
     analyze_message_sentiment,
     ChatMessage,
     SentimentAnalysisState,
 )
+from utils.logs import get_debug_logger
+from .analytics import ANALYTICS_FLUSH_INTERVAL, analytics_rollups
+from .score_store import SCORE_MERGE_INTERVAL, ScoreStore, get_score_store
 
 logger = logging.getLogger(__name__)
+debug_logger = get_debug_logger(__name__)
 
 
 class SentimentService:
-    def __init__(self):
-        self.user_scores: dict[int, int] = defaultdict(int)
-        self.usernames: dict[int, str] = {}
+    def __init__(self, store: Optional[ScoreStore] = None):
+        self._store = store
+
+    @property
+    def store(self) -> ScoreStore:
+        return self._store or get_score_store()
 
     async def analyze_message_sentiment(
-        self, message: ChatMessage
+        self, message: ChatMessage, local_only: bool = False, spam_reason: Optional[str] = None
     ) -> SentimentAnalysisState:
         """Analyze sentiment and update user scores"""
         try:
-            sentiment_result = await analyze_message_sentiment(message, None)
+            sentiment_result = await analyze_message_sentiment(
+                message, None, local_only=local_only, spam_reason=spam_reason
+            )
 
             if sentiment_result.reward_system:
                 user_id = message.player_id or 0
-                self.user_scores[user_id] += sentiment_result.reward_system.points_awarded
-                
-                # Store username for leaderboard
-                if message.player_name:
-                    self.usernames[user_id] = message.player_name
+                points = sentiment_result.reward_system.points_awarded
+                total = self.store.add(user_id, points, message.player_name)
+                # Backstop for hosts where the background merge task never runs (serverless)
+                self.store.merge_if_due(2 * SCORE_MERGE_INTERVAL)
 
-                logger.info(
-                    f"Updated score for user {user_id}: {self.user_scores[user_id]} "
-                    f"(+{sentiment_result.reward_system.points_awarded})"
-                )
+                debug_logger.debug("Updated score for user %s: %s (+%s)", user_id, total, points)
 
+            analytics_rollups.record_sentiment(sentiment_result)
+            analytics_rollups.flush_if_due(2 * ANALYTICS_FLUSH_INTERVAL)
             return sentiment_result
 
         except Exception as e:
@@ -45,22 +52,18 @@ class SentimentService:
         """Get user score information"""
         return {
             "user_id": user_id,
-            "username": self.usernames.get(user_id, f"user_{user_id}"),
-            "current_score": self.user_scores[user_id],
+            "username": self.store.username(user_id) or f"user_{user_id}",
+            "current_score": self.store.score(user_id),
         }
 
     def get_leaderboard(self, limit: int = 10) -> list:
         """Get top scoring users"""
-        sorted_scores = sorted(
-            self.user_scores.items(), key=lambda x: x[1], reverse=True
-        )
-
         board = []
-        for user_id, score in sorted_scores[:limit]:
+        for user_id, score in self.store.top(limit):
             board.append(
                 {
                     "user_id": user_id,
-                    "username": self.usernames.get(user_id, f"user_{user_id}"),
+                    "username": self.store.username(user_id) or f"user_{user_id}",
                     "score": score,
                 }
             )
@@ -69,13 +72,14 @@ class SentimentService:
 
     def get_stats(self) -> dict:
         """Get system statistics"""
+        user_scores = self.store.totals()
         return {
-            "total_users": len(self.user_scores),
-            "total_points": sum(self.user_scores.values()),
+            "total_users": len(user_scores),
+            "total_points": sum(user_scores.values()),
             "average_score": (
-                sum(self.user_scores.values()) / len(self.user_scores)
-                if self.user_scores
+                sum(user_scores.values()) / len(user_scores)
+                if user_scores
                 else 0
             ),
-            "highest_score": max(self.user_scores.values()) if self.user_scores else 0,
+            "highest_score": max(user_scores.values()) if user_scores else 0,
         }
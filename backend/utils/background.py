@@ -0,0 +1,65 @@
+"""
+Periodic background jobs run on the app's event loop
+Blocking work runs in the threadpool so the loop stays free for requests
+"""
+
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Call a blocking function every `interval` seconds until stopped"""
+
+    def __init__(self, name: str, interval: float, fn: Callable[[], None], run_on_stop: bool = False):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_on_stop = run_on_stop
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name=self.name)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._run_once()
+
+    async def _run_once(self) -> None:
+        try:
+            await run_in_threadpool(self.fn)
+        except Exception as e:
+            # Keep the schedule going; the next tick retries
+            logger.error(f"Background task {self.name} failed: {str(e)}")
+
+    async def stop(self) -> None:
+        """Cancel the schedule, then run once more if run_on_stop so final state is flushed"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.run_on_stop:
+            await self._run_once()
+
+
+# Tasks started by the app's startup hook and stopped, in reverse order, on shutdown
+background_tasks: List[PeriodicTask] = []
+
+
+async def start_background_tasks() -> None:
+    for task in background_tasks:
+        task.start()
+
+
+async def stop_background_tasks() -> None:
+    for task in reversed(background_tasks):
+        await task.stop()
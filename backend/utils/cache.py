@@ -0,0 +1,219 @@
+"""
+Read-through response cache for dashboard read endpoints
+Short TTLs, tag-based invalidation from the chat write paths, ETag/Last-Modified
+revalidation and coalescing of concurrent misses for the same key
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+
+from utils.serialization import dumps
+
+
+# ---------- Configuration ----------
+MAX_CACHE_ENTRIES = 512
+# Invalidated entries are still served until they are this old, so a steady stream of
+# chat writes can't turn every dashboard poll into a database query
+MIN_REFRESH_INTERVAL = 1.0
+CACHE_CONTROL = "no-cache"  # browsers keep the body but revalidate with If-None-Match every poll
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: float
+    expires_at: float
+    loaded_at: float
+    tags: Tuple[str, ...]
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Payload:
+    """Loader result carrying extra response headers alongside the JSON body"""
+    data: Any
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+def cache_key(request: Request) -> str:
+    """Key a request by path and sorted query parameters"""
+    params = sorted(request.query_params.multi_items())
+    return request.url.path + ("?" + "&".join(f"{k}={v}" for k, v in params) if params else "")
+
+
+def encode_body(data: Any) -> bytes:
+    return dumps(data)
+
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ----- invalidation -----
+    def invalidate(self, *tags: str) -> None:
+        """Expire every entry carrying one of the tags; safe to call from worker threads"""
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key, entry in list(self._entries.items()):
+                if not set(entry.tags) & set(tags):
+                    continue
+                entry.expires_at = min(entry.expires_at, entry.loaded_at + MIN_REFRESH_INTERVAL)
+                if entry.expires_at <= now:
+                    del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # ----- lookups -----
+    def _fresh(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry
+            return None
+
+    def _generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _store(self, key: str, entry: CachedResponse, generation: Tuple[int, ...]) -> CachedResponse:
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous and previous.etag == entry.etag:
+                entry.last_modified = previous.last_modified
+            # A write invalidated these tags while we were loading, so the result may be stale
+            if generation == tuple(self._generations.get(tag, 0) for tag in entry.tags):
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    async def get_or_load(
+        self,
+        key: str,
+        tags: Tuple[str, ...],
+        ttl: float,
+        loader: Callable[[], Any],
+    ) -> Tuple[CachedResponse, bool]:
+        """
+        Return a cached entry, loading it in the threadpool on a miss
+
+        Concurrent misses for the same key share one load.
+
+        Args:
+            key: Cache key, usually from cache_key(request)
+            tags: Invalidation tags for the entry
+            ttl: Seconds the entry stays fresh
+            loader: Blocking callable returning JSON-serialisable data or a Payload
+
+        Returns:
+            The entry and whether it was served from cache
+        """
+        entry = self._fresh(key)
+        if entry:
+            self.hits += 1
+            return entry, True
+
+        pending = self._inflight.get(key)
+        if pending:
+            self.hits += 1
+            return await asyncio.shield(pending), True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            generation = self._generation(tags)
+            data = await run_in_threadpool(loader)
+            payload = data if isinstance(data, Payload) else Payload(data)
+            body = encode_body(payload.data)
+            now = time.monotonic()
+            entry = self._store(key, CachedResponse(
+                body=body,
+                etag=compute_etag(body),
+                last_modified=time.time(),
+                expires_at=now + ttl,
+                loaded_at=now,
+                tags=tags,
+                headers=payload.headers,
+            ), generation)
+            future.set_result(entry)
+            return entry, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark retrieved so an unwaited future doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def respond(
+        self,
+        request: Request,
+        tags: Tuple[str, ...],
+        ttl: float,
+        loader: Callable[[], Any],
+    ) -> Response:
+        """Serve a request from cache, answering 304 when the client's copy is current"""
+        entry, hit = await self.get_or_load(cache_key(request), tags, ttl, loader)
+        response_headers = {
+            "ETag": entry.etag,
+            "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+            "Cache-Control": CACHE_CONTROL,
+            "X-Cache": "HIT" if hit else "MISS",
+            **entry.headers,
+        }
+        if not_modified(request, entry):
+            return Response(status_code=304, headers=response_headers)
+        return Response(content=entry.body, media_type="application/json", headers=response_headers)
+
+
+def not_modified(request: Request, entry: CachedResponse) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or entry.etag in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(entry.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# Shared cache for routes/data.py; chat write paths invalidate it by tag
+response_cache = ResponseCache()
@@ -0,0 +1,140 @@
+"""
+Process pool for CPU-bound, row-wise numpy work
+Batches are placed in shared memory once; each worker process maps them, computes its
+slice of rows and writes the result in place, so no array is pickled through a pipe.
+Small batches run inline, where starting the slices would cost more than it saves.
+"""
+
+import multiprocessing
+import os
+import threading
+from contextlib import suppress
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# ---------- Configuration ----------
+CPU_POOL_PROCESSES = int(os.getenv("BLOOM_CPU_POOL_PROCESSES", "0")) or os.cpu_count() or 1
+MIN_ROWS_PER_PROCESS = int(os.getenv("BLOOM_CPU_POOL_MIN_ROWS", "100000"))
+
+# (shared memory name, shape, dtype) of an array a worker attaches to
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+
+def _attach(spec: ArraySpec) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _run_slice(fn: Callable[..., np.ndarray], inputs: List[ArraySpec], output: ArraySpec, start: int, stop: int) -> None:
+    """Worker side: compute fn over rows [start, stop) of the inputs into the output"""
+    attached = [_attach(spec) for spec in inputs + [output]]
+    blocks = [block for block, _ in attached]
+    try:
+        *columns, result = [array for _, array in attached]
+        result[start:stop] = fn(*(column[start:stop] for column in columns))
+    finally:
+        # Views must go before their blocks close; a traceback from fn may still hold some,
+        # and those mappings are released when the traceback is
+        attached = columns = result = None
+        for block in blocks:
+            with suppress(BufferError):
+                block.close()
+
+
+class CPUPool:
+    """
+    Lazily started worker processes for row-wise functions over numpy arrays
+
+    Processes are forked where the platform allows, so they start quickly and share the
+    parent's imports. Start the pool from a process without live threads (a CLI or batch
+    job); in the API, CPU work scales with the server's worker processes instead.
+    """
+
+    def __init__(self, processes: int = CPU_POOL_PROCESSES, min_rows: int = MIN_ROWS_PER_PROCESS):
+        self.processes = max(1, processes)
+        self.min_rows = min_rows
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+                self._pool = context.Pool(self.processes)
+            return self._pool
+
+    def slices(self, rows: int) -> int:
+        """How many processes a batch of this many rows is split across"""
+        return max(1, min(self.processes, rows // self.min_rows)) if self.min_rows else self.processes
+
+    def map_rows(
+        self,
+        fn: Callable[..., np.ndarray],
+        inputs: Sequence[np.ndarray],
+        dtype: "np.typing.DTypeLike",
+        shape: Optional[Tuple[int, ...]] = None,
+    ) -> np.ndarray:
+        """
+        Apply fn to matching row ranges of the inputs and concatenate the results
+
+        Args:
+            fn: Picklable function returning one output row per input row
+            inputs: Numeric arrays with the same number of rows
+            dtype: Result dtype
+            shape: Result shape, by default (rows,)
+
+        Returns:
+            The same array fn(*inputs) would return, cast to dtype
+        """
+        rows = len(inputs[0])
+        shape = shape or (rows,)
+        slices = self.slices(rows)
+        if slices == 1:
+            return np.asarray(fn(*inputs), dtype=dtype)
+
+        blocks: List[shared_memory.SharedMemory] = []
+        views: List[np.ndarray] = []
+
+        def share(array_shape: Tuple[int, ...], array_dtype, array: Optional[np.ndarray] = None) -> ArraySpec:
+            array_dtype = np.dtype(array_dtype)
+            size = max(1, int(np.prod(array_shape)) * array_dtype.itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            blocks.append(block)
+            view = np.ndarray(array_shape, dtype=array_dtype, buffer=block.buf)
+            if array is not None:
+                view[...] = array
+            views.append(view)
+            return block.name, tuple(array_shape), array_dtype.str
+
+        try:
+            specs = [share(array.shape, array.dtype, array) for array in inputs]
+            output = share(shape, dtype)
+            bounds = np.linspace(0, rows, slices + 1).astype(int)
+            self._get_pool().starmap(
+                _run_slice,
+                [(fn, specs, output, int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])],
+            )
+            return views[-1].copy()
+        finally:
+            del views[:]
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def __enter__(self) -> "CPUPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,52 @@
+"""
+Lazily constructed Supabase client
+The client (and the supabase package itself) is only loaded on the first database query
+"""
+
+import os
+import logging
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Supabase configuration
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+_client: Optional["Client"] = None
+_client_lock = threading.Lock()
+
+
+def get_supabase() -> "Client":
+    """Return the shared Supabase client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def set_supabase(client: Optional["Client"]) -> None:
+    """Replace the shared client, e.g. with an offline stand-in; None restores lazy creation"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def _create_client() -> "Client":
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        logger.error("Missing Supabase configuration. Please set SUPABASE_URL and SUPABASE_KEY environment variables.")
+        raise ValueError("Missing Supabase configuration")
+
+    from supabase import create_client
+
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
@@ -3,26 +3,29 @@ FastAPI dependencies for chat routes
 Provides reusable validation, authentication, and data processing logic
 """
 
+import hmac
 import os
 import random
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Sequence
 from fastapi import HTTPException, Request, Depends
 from datetime import datetime, timezone
 
-from routes.data import supabase
+from agents.moderation.nodes import content_probabilities
+from utils.message_cache import message_cache
 
 
-# API Key configuration
+# API Key configuration; comma-separate keys to give each game server its own rate limit
 ROBLOX_API_KEY = os.getenv("ROBLOX_API_KEY")
+ROBLOX_API_KEYS = tuple(key.strip() for key in (ROBLOX_API_KEY or "").split(",") if key.strip())
 
 
 async def verify_api_key(request: Request) -> None:
     """Verify API key authentication"""
-    if not ROBLOX_API_KEY:
+    if not ROBLOX_API_KEYS:
         return  # Skip auth if no key configured
     
     api_key = request.headers.get('X-API-Key')
-    if not api_key or api_key != ROBLOX_API_KEY:
+    if not api_key or not any(hmac.compare_digest(api_key, key) for key in ROBLOX_API_KEYS):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
@@ -42,15 +45,75 @@ def valid_message_id(message_id: str) -> str:
 
 
 def get_message_by_id(message_id: str = Depends(valid_message_id)) -> Dict[str, Any]:
-    """Get message from database by ID"""
-    response = supabase.table('messages').select('*').eq('message_id', message_id).execute()
+    """Get message by ID, from the message cache when it was recently written"""
+    message = message_cache.get(message_id)
     
-    if not response.data:
+    if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    return response.data[0]
+    return message
 
 
 def create_timestamp() -> str:
     """Create ISO timestamp with UTC timezone"""
-    return datetime.now(timezone.utc).isoformat()
\ No newline at end of file
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Probabilities are stored as real[]; six decimals is all float4 keeps anyway
+PROBABILITY_DECIMALS = 6
+
+
+def compact_probabilities(values: Optional[Sequence[float]]) -> Optional[List[float]]:
+    """Round a probability vector for storage in a real[] column"""
+    if values is None:
+        return None
+    return [round(value, PROBABILITY_DECIMALS) for value in values]
+
+
+def sentiment_columns(chat_analysis: Any) -> Dict[str, Any]:
+    """Message columns holding the raw sentiment output, for re-scoring without the APIs"""
+    intent = chat_analysis.community_intent
+    return {
+        "sentiment_score": chat_analysis.sentiment_score or 0,
+        "sentiment_probs": compact_probabilities(chat_analysis.sentiment_probs),
+        "community_intent": intent.intent.value if intent and intent.intent else None,
+    }
+
+
+def reward_columns(sentiment_state: Any) -> Dict[str, Any]:
+    """Points the message earned, stored so the resume worker never awards them a second time"""
+    if not sentiment_state.reward_system:
+        return {}
+    return {"points_awarded": sentiment_state.reward_system.points_awarded}
+
+
+def content_columns(moderation_state: Any) -> Dict[str, Any]:
+    """Message columns holding the raw content moderation output, empty if it never ran"""
+    if not moderation_state.content_result:
+        return {}
+    return {
+        "content_probs": compact_probabilities(
+            content_probabilities(moderation_state.content_result.categories)
+        )
+    }
+
+
+def moderation_columns(moderation_state: Any) -> Dict[str, Any]:
+    """Message columns for a recommended moderation action, empty if none was recommended"""
+    action = moderation_state.recommended_action
+    if not action:
+        return {}
+
+    reason_parts = []
+    if moderation_state.pii_result and moderation_state.pii_result.pii_presence:
+        pii_type = moderation_state.pii_result.pii_type.value if moderation_state.pii_result.pii_type else "Unknown"
+        reason_parts.append(f"Detected {pii_type}")
+    if moderation_state.content_result and moderation_state.content_result.main_category.value != "OK":
+        reason_parts.append(f"Harmful content: {moderation_state.content_result.main_category.value}")
+    if not reason_parts:
+        reason_parts.append(action.reason)
+
+    return {
+        "moderation_action": action.action.value,
+        "moderation_reason": "; ".join(reason_parts),
+    }
\ No newline at end of file
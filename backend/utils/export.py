@@ -0,0 +1,164 @@
+"""
+Streaming encoders for bulk message exports
+Rows are pulled from Supabase one keyset page at a time and encoded incrementally,
+so memory use is bounded by EXPORT_BATCH_SIZE whatever the export size
+"""
+
+import csv
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+from utils.metrics import execute_query
+from utils.pagination import apply_message_keyset
+from utils.serialization import dumps
+
+
+# ---------- Configuration ----------
+EXPORT_BATCH_SIZE = 1000  # PostgREST's default max-rows; one Parquet row group per page
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# Arrow column types; created_at stays an ISO string so timezones round-trip untouched
+PARQUET_TYPES = {
+    "message_id": "string",
+    "player_id": "int64",
+    "message": "string",
+    "sentiment_score": "int64",
+    "created_at": "string",
+    "moderation_action": "string",
+    "moderation_reason": "string",
+    "sentiment_probs": "float32[]",
+    "content_probs": "float32[]",
+    "community_intent": "string",
+}
+
+
+def iter_message_pages(
+    build_query: Callable[[], Any],
+    batch_size: int = EXPORT_BATCH_SIZE,
+    after: Optional[Sequence[Any]] = None,
+    oldest_first: bool = False,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Walk a messages query newest first with a keyset cursor
+
+    Args:
+        build_query: Returns a fresh filtered query builder for each page
+        batch_size: Rows fetched per round trip
+        after: (created_at, message_id) of the last row already seen, to resume a walk
+        oldest_first: Walk in chronological order instead
+
+    Yields:
+        Lists of at most batch_size rows
+    """
+    while True:
+        query = apply_message_keyset(build_query(), after, oldest_first).limit(batch_size)
+        rows = execute_query(query, "messages", "export").data
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1]["created_at"], rows[-1]["message_id"])
+
+
+# ---------- Encoders ----------
+def encode_ndjson(pages: Iterable[List[Dict[str, Any]]], columns: Sequence[str]) -> Iterator[bytes]:
+    for rows in pages:
+        yield b"".join(dumps({column: row.get(column) for column in columns}) + b"\n" for row in rows)
+
+
+def encode_csv(pages: Iterable[List[Dict[str, Any]]], columns: Sequence[str]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(columns), extrasaction="ignore")
+    writer.writeheader()
+    for rows in pages:
+        # real[] columns as JSON arrays rather than Python reprs
+        writer.writerows(
+            {key: json.dumps(value) if isinstance(value, list) else value for key, value in row.items()}
+            for row in rows
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def require_pyarrow() -> None:
+    """Fail the request up front, before streaming starts, when Parquet support is missing"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(
+            status_code=501,
+            detail="Parquet export requires pyarrow; install it with `pip install pyarrow` or use format=ndjson/csv",
+        )
+
+
+def encode_parquet(pages: Iterable[List[Dict[str, Any]]], columns: Sequence[str]) -> Iterator[bytes]:
+    """Write one row group per page and stream the file bytes as they are produced"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def arrow_type(name: str):
+        return pa.list_(pa.float32()) if name == "float32[]" else pa.type_for_alias(name)
+
+    schema = pa.schema([(column, arrow_type(PARQUET_TYPES.get(column, "string"))) for column in columns])
+    sink = _ChunkSink()
+    writer: Optional[pq.ParquetWriter] = None
+    try:
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        for rows in pages:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
@@ -0,0 +1,562 @@
+"""
+Durable graph-run snapshots
+The moderation and sentiment graphs snapshot their state after every node, so a run
+interrupted by a crash, deploy or timeout resumes from the last completed node instead
+of repeating the paid HuggingFace and Gemini calls before it
+
+Backends (BLOOM_GRAPH_STATE):
+    sqlite: one local SQLite database shared by all workers on the host (default)
+    file:   pydantic_graph's FileStatePersistence, one JSON file per run
+    off:    no persistence
+
+Each run is keyed by graph name and message_id and leased by the process running it.
+Runs whose lease expired are picked up by a retried request for the same message or
+by the resume worker in services/resume.py; a retry that arrives while the lease is
+live gets a 409 instead of repeating the paid calls alongside it.
+"""
+
+import asyncio
+import enum
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import cache
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic_graph import exceptions
+from pydantic_graph.persistence import (
+    BaseStatePersistence,
+    EndSnapshot,
+    NodeSnapshot,
+    build_snapshot_list_type_adapter,
+)
+from pydantic_graph.persistence.file import FileStatePersistence
+
+from utils.metrics import resume_graph, run_graph
+
+try:
+    import fcntl
+except ImportError:  # Windows: single worker, no cross-process locking
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+GRAPH_STATE_BACKEND = os.getenv("BLOOM_GRAPH_STATE", "sqlite")
+GRAPH_STATE_DIR = os.getenv("BLOOM_GRAPH_STATE_DIR", os.path.join(tempfile.gettempdir(), "bloom-graph-runs"))
+# A live run renews its lease with its snapshots; once it lapses another worker may resume it
+RUN_LEASE = 120.0  # seconds
+MAX_RESUME_ATTEMPTS = 3
+# Retry-After for a request whose message is mid-run elsewhere; runs take a few seconds
+RUN_BUSY_RETRY_AFTER = 2  # seconds
+# Snapshot statuses left behind by a run that didn't finish the node
+INTERRUPTED_STATUSES = ("pending", "running", "error")
+
+# Graphs that can be resumed by name, registered next to their definitions
+GRAPHS: Dict[str, Any] = {}
+
+
+class Claim(enum.Enum):
+    NEW = "new"        # no usable snapshots, start from the first node
+    RESUME = "resume"  # snapshots from an interrupted run exist
+    BUSY = "busy"      # another live run holds the lease
+
+
+class RunInProgress(HTTPException):
+    """The message is being run under a live lease held by another request or worker"""
+
+    def __init__(self, name: str, run_id: str):
+        super().__init__(
+            status_code=409,
+            detail=f"{name} run for {run_id} is already in progress",
+            headers={"Retry-After": str(RUN_BUSY_RETRY_AFTER)},
+        )
+
+
+def register_graph(name: str, graph: Any) -> None:
+    GRAPHS[name] = graph
+
+
+@cache
+def _snapshot_adapter(state_type: type, run_end_type: type):
+    # Building the adapter costs milliseconds, so share one per graph type
+    return build_snapshot_list_type_adapter(state_type, run_end_type)
+
+
+def _file_name(run_id: str) -> str:
+    return hashlib.blake2b(run_id.encode(), digest_size=16).hexdigest()
+
+
+# ---------- SQLite Backend ----------
+class SqliteStatePersistence(BaseStatePersistence):
+    """Snapshots of one run stored as rows in the shared SQLite database"""
+
+    def __init__(self, store: "SqliteRunStore", graph: str, run_id: str):
+        self._store = store
+        self._key = (graph, run_id)
+        self._adapter = None
+        # Node whose success is written in the same transaction as the snapshot after it
+        self._succeeded: Optional[str] = None
+        # claim() just set the lease; snapshots renew it once half of it has passed
+        self._renew_at = time.monotonic() + RUN_LEASE / 2
+
+    def should_set_types(self) -> bool:
+        return self._adapter is None
+
+    def set_types(self, state_type: type, run_end_type: type) -> None:
+        self._adapter = _snapshot_adapter(state_type, run_end_type)
+
+    def _dump(self, snapshot: Any) -> bytes:
+        return self._adapter.dump_json([snapshot])
+
+    def _load(self, row: Tuple[str, bytes]) -> Any:
+        # The status column is authoritative; resets and claims don't rewrite the body
+        status, body = row
+        snapshot = self._adapter.validate_json(body)[0]
+        if isinstance(snapshot, NodeSnapshot):
+            snapshot.status = status
+        return snapshot
+
+    def _append(self, snapshot: Any) -> None:
+        succeeded, self._succeeded = self._succeeded, None
+        renew = time.monotonic() >= self._renew_at
+        if renew:
+            self._renew_at = time.monotonic() + RUN_LEASE / 2
+        self._store.append(
+            *self._key, snapshot.id, getattr(snapshot, "status", "success"), self._dump(snapshot), succeeded, renew
+        )
+
+    def _set_status(self, snapshot_id: str, status: str) -> None:
+        self._store.set_status(*self._key, snapshot_id, status)
+
+    async def snapshot_node(self, state: Any, next_node: Any) -> None:
+        self._append(NodeSnapshot(state=state, node=next_node))
+
+    async def snapshot_node_if_new(self, snapshot_id: str, state: Any, next_node: Any) -> None:
+        if not self._store.has_snapshot(*self._key, snapshot_id):
+            self._append(NodeSnapshot(state=state, node=next_node))
+
+    async def snapshot_end(self, state: Any, end: Any) -> None:
+        self._append(EndSnapshot(state=state, result=end))
+
+    @asynccontextmanager
+    async def record_run(self, snapshot_id: str) -> AsyncIterator[None]:
+        # Only the status column changes while a node runs, so the stored body is neither
+        # re-read nor re-serialized; node timings are in the Prometheus histograms instead.
+        # A node that dies mid-run is left created or pending, which resume treats like
+        # running, so one write per step is enough: success goes in with the next snapshot.
+        status = self._store.status(*self._key, snapshot_id)
+        if status is None:
+            raise LookupError(f"No snapshot found with id={snapshot_id!r}")
+        exceptions.GraphNodeStatusError.check(status)
+        try:
+            yield
+        except Exception:
+            self._set_status(snapshot_id, "error")
+            raise
+        self._succeeded = snapshot_id
+
+    async def load_next(self) -> Optional[NodeSnapshot]:
+        row = self._store.take_created(*self._key)
+        return self._load(row) if row else None
+
+    async def load_all(self) -> List[Any]:
+        return [self._load(row) for row in self._store.snapshots(*self._key)]
+
+    async def reset_interrupted(self) -> None:
+        """Make the node a dead or failed run was on runnable again"""
+        self._store.reset_interrupted(*self._key)
+
+
+class SqliteRunStore:
+    """Run leases and snapshots in one WAL-mode database; safe across threads and processes"""
+
+    SCHEMA = """
+        create table if not exists graph_runs (
+            graph text not null,
+            run_id text not null,
+            fingerprint text,
+            lease_until real not null,
+            attempts integer not null default 0,
+            primary key (graph, run_id)
+        );
+        create table if not exists graph_snapshots (
+            graph text not null,
+            run_id text not null,
+            seq integer not null,
+            snapshot_id text not null,
+            status text not null,
+            body blob not null,
+            primary key (graph, run_id, seq)
+        );
+    """
+
+    def __init__(self, directory: str = GRAPH_STATE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "graph_runs.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute("pragma synchronous=normal")
+        self._db.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("begin immediate")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("rollback")
+                raise
+            self._db.execute("commit")
+
+    def persistence(self, graph: str, run_id: str) -> SqliteStatePersistence:
+        return SqliteStatePersistence(self, graph, run_id)
+
+    # ----- leases -----
+    def claim(self, graph: str, run_id: str, fingerprint: Optional[str]) -> Claim:
+        """
+        Take the lease on a run
+
+        Args:
+            graph: Graph name
+            run_id: Usually the message_id
+            fingerprint: Digest of the run's input; snapshots of a different input are discarded.
+                None accepts whatever input the snapshots were taken for.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "select fingerprint, lease_until from graph_runs where graph = ? and run_id = ?", (graph, run_id)
+            ).fetchone()
+            if row and row[1] > now:
+                return Claim.BUSY
+            if row and fingerprint is not None and row[0] != fingerprint:
+                db.execute("delete from graph_snapshots where graph = ? and run_id = ?", (graph, run_id))
+                row = None
+            db.execute(
+                "insert into graph_runs (graph, run_id, fingerprint, lease_until) values (?, ?, ?, ?) "
+                "on conflict (graph, run_id) do update set lease_until = excluded.lease_until, "
+                "fingerprint = coalesce(?, graph_runs.fingerprint)",
+                (graph, run_id, fingerprint, now + RUN_LEASE, fingerprint),
+            )
+            if row is None:
+                db.execute("update graph_runs set attempts = 0 where graph = ? and run_id = ?", (graph, run_id))
+                return Claim.NEW
+            has_snapshots = db.execute(
+                "select 1 from graph_snapshots where graph = ? and run_id = ? limit 1", (graph, run_id)
+            ).fetchone()
+            return Claim.RESUME if has_snapshots else Claim.NEW
+
+    def release(self, graph: str, run_id: str) -> None:
+        """Give up the lease after a failure, keeping the snapshots for a later resume"""
+        with self._transaction() as db:
+            db.execute(
+                "update graph_runs set lease_until = 0, attempts = attempts + 1 where graph = ? and run_id = ?",
+                (graph, run_id),
+            )
+
+    def finish(self, graph: str, run_id: str) -> None:
+        with self._transaction() as db:
+            db.execute("delete from graph_snapshots where graph = ? and run_id = ?", (graph, run_id))
+            db.execute("delete from graph_runs where graph = ? and run_id = ?", (graph, run_id))
+
+    def interrupted(self) -> List[Tuple[str, str]]:
+        """Runs whose lease lapsed, dropping those that failed MAX_RESUME_ATTEMPTS times"""
+        with self._transaction() as db:
+            abandoned = db.execute(
+                "select graph, run_id from graph_runs where attempts >= ?", (MAX_RESUME_ATTEMPTS,)
+            ).fetchall()
+            for graph, run_id in abandoned:
+                logger.warning(f"Giving up on {graph} run {run_id} after {MAX_RESUME_ATTEMPTS} attempts")
+                db.execute("delete from graph_snapshots where graph = ? and run_id = ?", (graph, run_id))
+                db.execute("delete from graph_runs where graph = ? and run_id = ?", (graph, run_id))
+            return db.execute(
+                "select graph, run_id from graph_runs where lease_until < ? order by lease_until", (time.time(),)
+            ).fetchall()
+
+    # ----- snapshots -----
+    def append(
+        self,
+        graph: str,
+        run_id: str,
+        snapshot_id: str,
+        status: str,
+        body: bytes,
+        succeeded: Optional[str] = None,
+        renew: bool = True,
+    ) -> None:
+        """Add a snapshot in one transaction, marking the node that produced it as succeeded"""
+        with self._transaction() as db:
+            if succeeded is not None:
+                db.execute(
+                    "update graph_snapshots set status = 'success' where graph = ? and run_id = ? and snapshot_id = ?",
+                    (graph, run_id, succeeded),
+                )
+            db.execute(
+                "insert into graph_snapshots (graph, run_id, seq, snapshot_id, status, body) "
+                "select ?, ?, coalesce(max(seq), 0) + 1, ?, ?, ? from graph_snapshots where graph = ? and run_id = ?",
+                (graph, run_id, snapshot_id, status, body, graph, run_id),
+            )
+            if renew:
+                db.execute(
+                    "update graph_runs set lease_until = ? where graph = ? and run_id = ?",
+                    (time.time() + RUN_LEASE, graph, run_id),
+                )
+
+    def set_status(self, graph: str, run_id: str, snapshot_id: str, status: str) -> None:
+        # A single statement commits on its own in autocommit mode
+        with self._lock:
+            self._db.execute(
+                "update graph_snapshots set status = ? where graph = ? and run_id = ? and snapshot_id = ?",
+                (status, graph, run_id, snapshot_id),
+            )
+
+    def status(self, graph: str, run_id: str, snapshot_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "select status from graph_snapshots where graph = ? and run_id = ? and snapshot_id = ?",
+                (graph, run_id, snapshot_id),
+            ).fetchone()
+            return row[0] if row else None
+
+    def has_snapshot(self, graph: str, run_id: str, snapshot_id: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "select 1 from graph_snapshots where graph = ? and run_id = ? and snapshot_id = ?",
+                (graph, run_id, snapshot_id),
+            ).fetchone() is not None
+
+    def snapshots(self, graph: str, run_id: str) -> List[Tuple[str, bytes]]:
+        with self._lock:
+            return self._db.execute(
+                "select status, body from graph_snapshots where graph = ? and run_id = ? order by seq", (graph, run_id)
+            ).fetchall()
+
+    def take_created(self, graph: str, run_id: str) -> Optional[Tuple[str, bytes]]:
+        with self._transaction() as db:
+            row = db.execute(
+                "select seq, body from graph_snapshots where graph = ? and run_id = ? and status = 'created' "
+                "order by seq limit 1", (graph, run_id)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "update graph_snapshots set status = 'pending' where graph = ? and run_id = ? and seq = ?",
+                (graph, run_id, row[0]),
+            )
+            return "pending", row[1]
+
+    def reset_interrupted(self, graph: str, run_id: str) -> None:
+        with self._transaction() as db:
+            db.execute(
+                f"update graph_snapshots set status = 'created' where graph = ? and run_id = ? "
+                f"and status in ({','.join('?' * len(INTERRUPTED_STATUSES))})",
+                (graph, run_id, *INTERRUPTED_STATUSES),
+            )
+
+
+# ---------- File Backend ----------
+class ResumableFileStatePersistence(FileStatePersistence):
+    """FileStatePersistence that can put an interrupted node back in the queue"""
+
+    async def reset_interrupted(self) -> None:
+        async with self._lock():
+            snapshots = await self.load_all()
+            for snapshot in snapshots:
+                if isinstance(snapshot, NodeSnapshot) and snapshot.status in INTERRUPTED_STATUSES:
+                    snapshot.status = "created"
+            await self._save(snapshots)
+
+    def set_types(self, state_type: type, run_end_type: type) -> None:
+        self._snapshots_type_adapter = _snapshot_adapter(state_type, run_end_type)
+
+
+class FileRunStore:
+    """One JSON snapshot file and one lease file per run, under a directory per graph"""
+
+    def __init__(self, directory: str = GRAPH_STATE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        # Serialises lease changes between threads, and between workers where flock exists
+        with self._lock, open(os.path.join(self.directory, "runs.lock"), "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def _paths(self, graph: str, run_id: str) -> Tuple[Path, Path]:
+        base = Path(self.directory) / graph
+        base.mkdir(exist_ok=True)
+        name = _file_name(run_id)
+        return base / f"{name}.json", base / f"{name}.run"
+
+    def _read_run(self, path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def persistence(self, graph: str, run_id: str) -> ResumableFileStatePersistence:
+        return ResumableFileStatePersistence(self._paths(graph, run_id)[0])
+
+    def claim(self, graph: str, run_id: str, fingerprint: Optional[str]) -> Claim:
+        snapshots, run_path = self._paths(graph, run_id)
+        now = time.time()
+        with self._locked():
+            run = self._read_run(run_path)
+            if run and run["lease_until"] > now:
+                return Claim.BUSY
+            if run and fingerprint is not None and run["fingerprint"] != fingerprint:
+                snapshots.unlink(missing_ok=True)
+                run = None
+            run = {
+                "run_id": run_id,
+                "fingerprint": fingerprint if fingerprint is not None else (run or {}).get("fingerprint"),
+                # The file backend doesn't renew leases per node, so give whole runs the lease
+                "lease_until": now + RUN_LEASE,
+                "attempts": (run or {}).get("attempts", 0),
+            }
+            run_path.write_text(json.dumps(run))
+            return Claim.RESUME if snapshots.exists() else Claim.NEW
+
+    def release(self, graph: str, run_id: str) -> None:
+        run_path = self._paths(graph, run_id)[1]
+        with self._locked():
+            run = self._read_run(run_path)
+            if run:
+                run.update(lease_until=0, attempts=run["attempts"] + 1)
+                run_path.write_text(json.dumps(run))
+
+    def finish(self, graph: str, run_id: str) -> None:
+        for path in self._paths(graph, run_id):
+            path.unlink(missing_ok=True)
+
+    def interrupted(self) -> List[Tuple[str, str]]:
+        now = time.time()
+        runs = []
+        with self._locked():
+            for graph in GRAPHS:
+                for run_path in sorted((Path(self.directory) / graph).glob("*.run")):
+                    run = self._read_run(run_path)
+                    if run is None or run["lease_until"] >= now:
+                        continue
+                    if run["attempts"] >= MAX_RESUME_ATTEMPTS:
+                        logger.warning(f"Giving up on {graph} run {run['run_id']} after {MAX_RESUME_ATTEMPTS} attempts")
+                        run_path.with_suffix(".json").unlink(missing_ok=True)
+                        run_path.unlink(missing_ok=True)
+                        continue
+                    runs.append((graph, run["run_id"]))
+        return runs
+
+
+# ---------- Running ----------
+@cache
+def get_run_store():
+    """Run store for GRAPH_STATE_BACKEND, or None when persistence is off or unavailable"""
+    try:
+        if GRAPH_STATE_BACKEND == "sqlite":
+            return SqliteRunStore()
+        if GRAPH_STATE_BACKEND == "file":
+            return FileRunStore()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Graph state persistence disabled: {str(e)}")
+    return None
+
+
+async def _resume(store: Any, graph: Any, name: str, run_id: str, trace_id: Optional[str]) -> Any:
+    """Continue a run from its snapshots and return the final state"""
+    persistence = store.persistence(name, run_id)
+    persistence.set_graph_types(graph)
+    snapshots = await persistence.load_all()
+    if snapshots and isinstance(snapshots[-1], EndSnapshot):
+        return snapshots[-1].state  # finished, but the process died before cleaning up
+    await persistence.reset_interrupted()
+    _, state = await resume_graph(graph, persistence, name, trace_id)
+    logger.info(f"Resumed {name} run {run_id} from snapshot")
+    return state
+
+
+async def run_persisted(
+    graph: Any,
+    start_node: Any,
+    state: Any,
+    name: str,
+    run_id: Optional[str],
+    fingerprint: str,
+    trace_id: Optional[str] = None,
+) -> Any:
+    """
+    Run a graph with snapshots after every node, resuming earlier snapshots of the same run
+
+    Args:
+        graph: Graph to run, registered under name
+        start_node: Node to start from when there is nothing to resume
+        state: Fresh graph state
+        name: Graph name used for metrics and as the run store namespace
+        run_id: Stable ID of the input, usually the message_id
+        fingerprint: Digest of the input; a different input under the same run_id starts over
+        trace_id: Optional trace ID attached to latency exemplars
+
+    Returns:
+        The final graph state, which is a different object when the run was resumed
+
+    Raises:
+        RunInProgress: 409 when another live run holds the lease on run_id
+    """
+    store = get_run_store()
+    if store is None or run_id is None:
+        await run_graph(graph, start_node, state, name, trace_id)
+        return state
+    claim = store.claim(name, run_id, fingerprint)
+    if claim is Claim.BUSY:
+        # Running it again here would repeat every paid call the live run is making
+        raise RunInProgress(name, run_id)
+
+    try:
+        if claim is Claim.RESUME:
+            state = await _resume(store, graph, name, run_id, trace_id)
+        else:
+            await run_graph(graph, start_node, state, name, trace_id, persistence=store.persistence(name, run_id))
+    except BaseException:
+        store.release(name, run_id)
+        raise
+    store.finish(name, run_id)
+    return state
+
+
+async def resume_run(name: str, run_id: str, on_complete: Any) -> bool:
+    """
+    Finish an interrupted run and hand its final state to on_complete
+
+    Returns:
+        Whether the run was resumed; False when another worker holds it
+    """
+    store = get_run_store()
+    claim = store.claim(name, run_id, None)
+    if claim is Claim.BUSY:
+        return False
+    if claim is Claim.NEW:
+        store.finish(name, run_id)  # nothing was snapshotted before the run died
+        return False
+    try:
+        state = await _resume(store, GRAPHS[name], name, run_id, None)
+        await asyncio.to_thread(on_complete, state)
+    except BaseException:
+        store.release(name, run_id)
+        raise
+    store.finish(name, run_id)
+    return True
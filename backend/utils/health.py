@@ -0,0 +1,235 @@
+"""
+Liveness and readiness checks for load balancers
+Dependencies are probed on a background schedule and the results cached, so readiness
+only reads memory and can be polled every second. Circuit states come from the
+dependency call counters recorded by track_dependency, without touching the call path.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from utils.metrics import DEPENDENCY_ERRORS, DEPENDENCY_LATENCY, execute_query, track_dependency
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Configuration ----------
+HEALTH_PROBE_INTERVAL = float(os.getenv("BLOOM_HEALTH_PROBE_INTERVAL", "10"))
+PROBE_TIMEOUT = 2.0  # seconds per probe
+# A probe result older than this many intervals is reported as stale
+STALE_AFTER_INTERVALS = 3
+# Circuit opens when at least CIRCUIT_ERROR_RATIO of the calls made to a dependency in
+# the last CIRCUIT_WINDOW seconds failed, counting only windows of CIRCUIT_MIN_CALLS or more
+CIRCUIT_WINDOW = 60.0
+CIRCUIT_MIN_CALLS = 5
+CIRCUIT_ERROR_RATIO = 0.5
+# Dependencies that take the instance out of rotation when down; HuggingFace and Gemini
+# have local fallbacks, so losing them only degrades the analysis
+READY_REQUIRED = tuple(
+    name.strip() for name in os.getenv("BLOOM_READY_REQUIRED", "supabase").split(",") if name.strip()
+)
+# Saturation limits; exceeding any of them drains the instance for at least DRAIN_HOLD seconds
+READY_MAX_THREADPOOL = float(os.getenv("BLOOM_READY_MAX_THREADPOOL", "0.9"))  # share of threads busy
+READY_MAX_WAITING = int(os.getenv("BLOOM_READY_MAX_WAITING", "40"))           # calls queued for a thread
+READY_MAX_QUEUE = float(os.getenv("BLOOM_READY_MAX_QUEUE", "0.9"))            # share of a bounded queue used
+DRAIN_HOLD = 5.0
+
+HF_PROBE_URL = "https://huggingface.co/api/whoami-v2"
+GEMINI_PROBE_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash"
+
+
+@dataclass
+class ProbeResult:
+    ok: Optional[bool]  # None when the dependency isn't configured
+    latency_ms: float
+    checked_at: float
+    error: Optional[str] = None
+
+
+def _probe_supabase() -> Optional[bool]:
+    from utils.db import get_supabase
+
+    execute_query(get_supabase().table('players').select('player_id').limit(1), 'players', 'probe')
+    return True
+
+
+def _probe_http(dependency: str, url: str, headers: Dict[str, str]) -> None:
+    import requests
+
+    with track_dependency(dependency, "probe"):
+        response = requests.get(url, headers=headers, timeout=PROBE_TIMEOUT)
+        response.raise_for_status()
+
+
+def _probe_huggingface() -> Optional[bool]:
+    token = os.getenv("HF_TOKEN")
+    if not token:
+        return None
+    # Checks the token and reachability without running (or paying for) inference
+    _probe_http("huggingface", HF_PROBE_URL, {"Authorization": f"Bearer {token}"})
+    return True
+
+
+def _probe_gemini() -> Optional[bool]:
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    # Model metadata lookups are free and fail the same way on a bad key or an outage
+    _probe_http("gemini", GEMINI_PROBE_URL, {"x-goog-api-key": api_key})
+    return True
+
+
+PROBES: Dict[str, Callable[[], Optional[bool]]] = {
+    "supabase": _probe_supabase,
+    "huggingface": _probe_huggingface,
+    "gemini": _probe_gemini,
+}
+
+
+def _call_totals() -> Dict[str, Tuple[float, float, float]]:
+    """Cumulative (calls, seconds, errors) per dependency from the Prometheus collectors"""
+    totals: Dict[str, List[float]] = {}
+    for metric in DEPENDENCY_LATENCY.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") or sample.name.endswith("_sum"):
+                entry = totals.setdefault(sample.labels["dependency"], [0.0, 0.0, 0.0])
+                entry[0 if sample.name.endswith("_count") else 1] += sample.value
+    for metric in DEPENDENCY_ERRORS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                totals.setdefault(sample.labels["dependency"], [0.0, 0.0, 0.0])[2] += sample.value
+    return {name: tuple(entry) for name, entry in totals.items()}
+
+
+class HealthMonitor:
+    """Cached dependency probes and call statistics, plus the readiness decision"""
+
+    def __init__(self, probes: Optional[Dict[str, Callable[[], Optional[bool]]]] = None):
+        self.probes = probes if probes is not None else PROBES
+        self.started_at = time.time()
+        self._results: Dict[str, ProbeResult] = {}
+        # (monotonic time, call totals) at each refresh, covering the circuit window
+        self._totals: Deque[Tuple[float, Dict[str, Tuple[float, float, float]]]] = deque()
+        self._drain_until = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Probe every dependency and sample call counters; run by the background task"""
+        results = {}
+        for name, probe in self.probes.items():
+            started = time.perf_counter()
+            try:
+                ok, error = probe(), None
+            except Exception as e:
+                ok, error = False, str(e)[:200]
+            results[name] = ProbeResult(ok, (time.perf_counter() - started) * 1000, time.time(), error)
+            if ok is False:
+                logger.warning(f"Health probe for {name} failed: {error}")
+
+        now = time.monotonic()
+        totals = _call_totals()
+        with self._lock:
+            self._results = results
+            self._totals.append((now, totals))
+            # Keep one sample older than the window so deltas span all of it
+            while len(self._totals) > 2 and self._totals[1][0] <= now - CIRCUIT_WINDOW:
+                self._totals.popleft()
+
+    def _recent_calls(self) -> Dict[str, Tuple[float, float, float]]:
+        """(calls, seconds, errors) per dependency between the oldest and newest samples"""
+        if len(self._totals) < 2:
+            return {}
+        (_, oldest), (_, newest) = self._totals[0], self._totals[-1]
+        return {
+            name: tuple(value - before for value, before in zip(totals, oldest.get(name, (0.0, 0.0, 0.0))))
+            for name, totals in newest.items()
+        }
+
+    def dependencies(self) -> Dict[str, Dict[str, Any]]:
+        """Latest probe result, recent call statistics and circuit state per dependency"""
+        now = time.time()
+        stale_after = STALE_AFTER_INTERVALS * HEALTH_PROBE_INTERVAL
+        with self._lock:
+            results = dict(self._results)
+            recent = self._recent_calls()
+
+        report = {}
+        for name in self.probes:
+            calls, seconds, errors = recent.get(name, (0.0, 0.0, 0.0))
+            circuit_open = calls >= CIRCUIT_MIN_CALLS and errors / calls >= CIRCUIT_ERROR_RATIO
+            result = results.get(name)
+            if result is None:
+                status = "unknown"  # not probed yet
+            elif result.ok is None:
+                status = "unconfigured"
+            elif now - result.checked_at > stale_after:
+                status = "stale"
+            else:
+                status = "up" if result.ok and not circuit_open else "down"
+            report[name] = {
+                "status": status,
+                "required": name in READY_REQUIRED,
+                "circuit": "open" if circuit_open else "closed",
+                "probe_latency_ms": round(result.latency_ms, 1) if result else None,
+                "probe_age_seconds": round(now - result.checked_at, 1) if result else None,
+                "error": result.error if result else None,
+                "recent_calls": int(calls),
+                "recent_errors": int(errors),
+                "recent_latency_ms": round(seconds / calls * 1000, 1) if calls else None,
+            }
+        return report
+
+    def readiness(self, saturation: Dict[str, Dict[str, Any]]) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Decide whether the instance should receive traffic
+
+        Args:
+            saturation: Executor and queue usage, each entry with a "limit_exceeded" flag
+
+        Returns:
+            Whether the instance is ready, and the report to serve
+        """
+        dependencies = self.dependencies()
+        reasons = [
+            f"{name} is down"
+            for name, dependency in dependencies.items()
+            if dependency["required"] and dependency["status"] == "down"
+        ]
+        saturated = [f"{name} saturated" for name, usage in saturation.items() if usage.get("limit_exceeded")]
+
+        now = time.monotonic()
+        if saturated:
+            self._drain_until = now + DRAIN_HOLD
+        elif now < self._drain_until:
+            saturated = ["draining after saturation"]
+        reasons += saturated
+
+        ready = not reasons
+        degraded = any(dependency["status"] == "down" for dependency in dependencies.values())
+        return ready, {
+            "status": "ready" if ready and not degraded else "degraded" if ready else "unavailable",
+            "reasons": reasons,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "dependencies": dependencies,
+            "saturation": saturation,
+        }
+
+
+def usage(in_use: int, capacity: int, limit: float) -> Dict[str, Any]:
+    """Usage entry for a bounded executor or queue"""
+    utilization = in_use / capacity if capacity else 0.0
+    return {
+        "in_use": in_use,
+        "capacity": capacity,
+        "utilization": round(utilization, 3),
+        "limit_exceeded": utilization >= limit,
+    }
+
+
+# Shared by the health routes and the background probe task
+health_monitor = HealthMonitor()
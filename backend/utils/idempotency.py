@@ -0,0 +1,143 @@
+"""
+Idempotency store for write endpoints keyed by a client-supplied ID
+Concurrent duplicates wait on the first run; completed results are replayed from a
+bounded TTL store so retries don't re-run the pipelines or re-award points
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from utils.metrics import IDEMPOTENCY_REQUESTS
+
+
+# ---------- Configuration ----------
+IDEMPOTENCY_TTL = 15 * 60  # seconds; comfortably longer than any game server retry window
+IDEMPOTENCY_MAX_ENTRIES = 10_000
+IDEMPOTENT_REPLAY_HEADER = "Idempotent-Replayed"
+
+
+@dataclass
+class _Completed:
+    fingerprint: str
+    result: Any
+    expires_at: float
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Digest of the request fields that must match for a replay to be valid"""
+    return hashlib.blake2b("\x1f".join(str(part) for part in parts).encode(), digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Thread-safe, since sync routes run in the threadpool with one event loop per request
+
+    Failed runs aren't stored, so a retry after an error runs again.
+    """
+
+    def __init__(self, name: str, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._completed: "OrderedDict[str, _Completed]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, Future]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._completed)
+
+    def _check(self, key: str, fingerprint: str, stored: str) -> None:
+        if fingerprint != stored:
+            IDEMPOTENCY_REQUESTS.labels(store=self.name, outcome="conflict").inc()
+            raise HTTPException(status_code=409, detail=f"{key} was already used for a different request")
+
+    def _replay(self, key: str, fingerprint: str) -> Optional[_Completed]:
+        """Unexpired completed entry for key, checked against fingerprint; call with the lock held"""
+        entry = self._completed.get(key)
+        if entry and entry.expires_at <= time.monotonic():
+            del self._completed[key]
+            entry = None
+        if entry:
+            self._check(key, fingerprint, entry.fingerprint)
+            self._completed.move_to_end(key)
+            IDEMPOTENCY_REQUESTS.labels(store=self.name, outcome="replayed").inc()
+        return entry
+
+    def lookup(self, key: str, fingerprint: str) -> Optional[Any]:
+        """
+        Result of a completed or in-flight run of key, without starting one
+
+        Lets a caller answer retries before spending rate limit tokens or other checks
+        on them. An in-flight run is waited for.
+
+        Returns:
+            The result, or None when key hasn't run yet or its in-flight run failed
+        """
+        with self._lock:
+            entry = self._replay(key, fingerprint)
+            if entry:
+                return entry.result
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                return None
+            self._check(key, fingerprint, inflight[0])
+
+        IDEMPOTENCY_REQUESTS.labels(store=self.name, outcome="coalesced").inc()
+        try:
+            return inflight[1].result()
+        except Exception:
+            return None  # the caller runs it again, as a retry after an error would
+
+    def run(self, key: str, fingerprint: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run fn once per key
+
+        Args:
+            key: Client-supplied idempotency key, e.g. a message_id
+            fingerprint: request_fingerprint of the payload; a mismatch answers 409
+            fn: Blocking callable producing the result
+
+        Returns:
+            The result and whether it was replayed rather than computed by this call
+        """
+        with self._lock:
+            entry = self._replay(key, fingerprint)
+            if entry:
+                return entry.result, True
+
+            inflight = self._inflight.get(key)
+            if inflight:
+                self._check(key, fingerprint, inflight[0])
+                future = inflight[1]
+            else:
+                future = Future()
+                self._inflight[key] = (fingerprint, future)
+
+        if inflight:
+            IDEMPOTENCY_REQUESTS.labels(store=self.name, outcome="coalesced").inc()
+            return future.result(), True
+
+        IDEMPOTENCY_REQUESTS.labels(store=self.name, outcome="miss").inc()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._completed[key] = _Completed(fingerprint, result, time.monotonic() + self.ttl)
+            self._completed.move_to_end(key)
+            while len(self._completed) > self.max_entries:
+                self._completed.popitem(last=False)
+        future.set_result(result)
+        return result, False
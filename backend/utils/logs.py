@@ -0,0 +1,189 @@
+"""
+Non-blocking structured logging
+Request threads only put records on a bounded queue; a listener thread formats them as
+JSON lines and does the I/O. Chatty loggers are sampled to a per-logger rate, and
+per-message details go to a debug channel that is off by default.
+"""
+
+import copy
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+from utils.metrics import LOG_RECORDS_DROPPED, current_trace_id
+from utils.rate_limit import RateLimiter
+from utils.serialization import dumps
+
+
+# ---------- Configuration ----------
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("BLOOM_LOG_FORMAT", "json")  # json or text
+LOG_QUEUE_SIZE = int(os.getenv("BLOOM_LOG_QUEUE_SIZE", "10000"))
+# Records per second and burst per logger below WARNING; warnings and errors always pass
+LOG_RATE = float(os.getenv("BLOOM_LOG_RATE", "20"))
+LOG_BURST = int(os.getenv("BLOOM_LOG_BURST", "100"))
+# Per-logger overrides, e.g. "httpx=1,routes.data=5"; a rate of 0 disables sampling
+LOG_RATES: Dict[str, float] = {
+    name.strip(): float(rate)
+    for name, _, rate in (
+        item.partition("=") for item in os.getenv("BLOOM_LOG_RATES", "httpx=2").split(",") if item.strip()
+    )
+}
+# Per-message details (moderation dicts, graph results, upstream payloads)
+DEBUG_CHANNEL = "bloom.debug"
+DEBUG_ENABLED = os.getenv("BLOOM_LOG_DEBUG", "").lower() in ("1", "true", "yes")
+# Loggers uvicorn writes to with its own synchronous handlers
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+def get_debug_logger(name: str) -> logging.Logger:
+    """Logger on the debug channel for a module; check isEnabledFor before building costly messages"""
+    return logging.getLogger(f"{DEBUG_CHANNEL}.{name}")
+
+
+class RateSampler(logging.Filter):
+    """Drops records beyond each logger's rate, noting how many were dropped on the next one"""
+
+    def __init__(self, rate: float = LOG_RATE, burst: int = LOG_BURST, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates if rates is not None else LOG_RATES
+        self._limiters: Dict[str, Tuple[RateLimiter, Any]] = {}
+        self._dropped: Dict[str, int] = {}
+
+    def _limiter(self, name: str) -> Tuple[RateLimiter, Any]:
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            rate = next((r for prefix, r in self.rates.items() if name == prefix or name.startswith(prefix + ".")), self.rate)
+            limiter = self._limiters.setdefault(
+                name, (RateLimiter(rate, self.burst), LOG_RECORDS_DROPPED.labels(logger=name, reason="sampled"))
+            )
+        return limiter
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        limiter, dropped_counter = self._limiter(record.name)
+        if limiter.acquire(record.name):
+            self._dropped[record.name] = self._dropped.get(record.name, 0) + 1
+            dropped_counter.inc()
+            return False
+        dropped = self._dropped.pop(record.name, 0)
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueues from the calling thread, dropping records rather than blocking when the queue is full"""
+
+    _exceptions = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now, as they may change before the listener formats the record,
+        # and keep the traceback apart from the message for the JSON output
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exceptions.formatException(record.exc_info)
+            record.exc_info = None
+        # The trace ID lives in a context variable the listener thread can't see
+        record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(logger=record.name, reason="queue_full").inc()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("trace_id", "sampled_out"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return dumps(entry).decode()
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+def configure_logging() -> None:
+    """
+    Route the root and uvicorn loggers through the logging queue
+
+    Safe to call again, e.g. at startup after uvicorn has installed its own handlers.
+    """
+    global _listener, _queue_handler
+    if _queue_handler is None:
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(
+            JsonFormatter() if LOG_FORMAT == "json"
+            else logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        )
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(RateSampler())
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    debug = logging.getLogger(DEBUG_CHANNEL)
+    debug.setLevel(logging.DEBUG if DEBUG_ENABLED else logging.CRITICAL + 1)
+
+
+def queue_usage() -> Tuple[int, int]:
+    """Records waiting for the listener thread, and the queue's capacity"""
+    if _queue_handler is None:
+        return 0, LOG_QUEUE_SIZE
+    return _queue_handler.queue.qsize(), LOG_QUEUE_SIZE
+
+
+def _restart_after_fork() -> None:
+    """
+    A worker forked from a preloading server (gunicorn --preload) inherits the queue but
+    not the listener thread, so it starts its own pipeline
+    """
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        _listener = _queue_handler = None
+        configure_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging() -> None:
+    """Flush queued records; logging falls back to stderr afterwards"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().handlers = [logging.StreamHandler(sys.stderr)]
+        _listener = _queue_handler = None
@@ -0,0 +1,128 @@
+"""
+Read-through cache of message rows keyed by message_id
+The ingestion path stores the row it just wrote, so flagging a recent message is a
+memory lookup; misses are loaded with one query per batch
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.db import get_supabase
+from utils.metrics import MESSAGE_CACHE_LOOKUPS, execute_query
+
+
+# ---------- Configuration ----------
+MESSAGE_CACHE_MAX_ENTRIES = 20_000
+# Other workers can update a row this process cached, so entries don't live forever
+MESSAGE_CACHE_TTL = 5 * 60  # seconds
+MESSAGE_LOAD_BATCH_SIZE = 200  # message_ids per in_() query, keeps the URL short
+
+
+class MessageCache:
+    """Thread-safe LRU of full message rows, since sync routes run in the threadpool"""
+
+    def __init__(self, max_entries: int = MESSAGE_CACHE_MAX_ENTRIES, ttl: float = MESSAGE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._rows: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ----- writes -----
+    def put(self, *rows: Dict[str, Any]) -> None:
+        """Store rows exactly as the database returned them"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for row in rows:
+                self._rows[row["message_id"]] = (dict(row), expires_at)
+                self._rows.move_to_end(row["message_id"])
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, *message_ids: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for message_id in message_ids:
+                self._rows.pop(message_id, None)
+
+    def written(self, message_id: str, rows: Optional[List[Dict[str, Any]]]) -> None:
+        """
+        Record the outcome of an insert or update on message_id
+
+        Args:
+            message_id: The message written
+            rows: Rows returned by the write; when empty the cached copy is dropped instead
+        """
+        if rows:
+            self.put(*rows)
+        else:
+            self.invalidate(message_id)
+
+    def _fill(self, rows: List[Dict[str, Any]], generation: int) -> None:
+        """Cache loaded rows unless a write raced the load and may have made them stale"""
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return
+            for row in rows:
+                # Rows put by a concurrent write are newer than what we read
+                entry = self._rows.get(row["message_id"])
+                if entry is None or entry[1] <= now:
+                    self._rows[row["message_id"]] = (dict(row), now + self.ttl)
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+
+    # ----- lookups -----
+    def _cached(self, message_ids: Iterable[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str], int]:
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for message_id in message_ids:
+                entry = self._rows.get(message_id)
+                if entry and entry[1] > now:
+                    self._rows.move_to_end(message_id)
+                    found[message_id] = dict(entry[0])
+                else:
+                    missing.append(message_id)
+            return found, missing, self._generation
+
+    def get_many(self, message_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Look up rows, loading misses from Supabase in batched in_() queries
+
+        Returns:
+            Rows by message_id; IDs that don't exist are absent
+        """
+        found, missing, generation = self._cached(dict.fromkeys(message_ids))
+        MESSAGE_CACHE_LOOKUPS.labels(outcome="hit").inc(len(found))
+        if not missing:
+            return found
+
+        MESSAGE_CACHE_LOOKUPS.labels(outcome="miss").inc(len(missing))
+        loaded = []
+        for start in range(0, len(missing), MESSAGE_LOAD_BATCH_SIZE):
+            batch = missing[start:start + MESSAGE_LOAD_BATCH_SIZE]
+            loaded.extend(execute_query(
+                get_supabase().table('messages').select('*').in_('message_id', batch),
+                'messages', 'select'
+            ).data)
+        self._fill(loaded, generation)
+        found.update((row["message_id"], row) for row in loaded)
+        return found
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_many([message_id]).get(message_id)
+
+
+# Shared by the chat routes; ingestion fills it and every write keeps it current
+message_cache = MessageCache()
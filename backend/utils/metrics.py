@@ -0,0 +1,292 @@
+"""
+Prometheus instrumentation for graph nodes, remote calls and Supabase queries
+Exposes latency histograms, outcome counters and in-flight gauges plus per-request trace IDs
+"""
+
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic_graph import End
+
+
+# ---------- Metric Definitions ----------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+NODE_LATENCY = Histogram(
+    "bloom_graph_node_seconds",
+    "Time spent running a single graph node",
+    ["graph", "node"],
+    buckets=LATENCY_BUCKETS,
+)
+NODE_ERRORS = Counter(
+    "bloom_graph_node_errors_total",
+    "Graph nodes that raised instead of returning a next node",
+    ["graph", "node"],
+)
+GRAPH_LATENCY = Histogram(
+    "bloom_graph_run_seconds",
+    "Time spent running a whole graph",
+    ["graph"],
+    buckets=LATENCY_BUCKETS,
+)
+GRAPH_IN_FLIGHT = Gauge(
+    "bloom_graph_runs_in_flight",
+    "Graph runs currently executing",
+    ["graph"],
+    multiprocess_mode="livesum",  # summed over live workers when served by gunicorn
+)
+SHORT_CIRCUITS = Counter(
+    "bloom_graph_short_circuits_total",
+    "Graph runs that ended before reaching the final node",
+    ["graph", "node"],
+)
+FALLBACKS = Counter(
+    "bloom_fallbacks_total",
+    "Default or local responses used in place of a failed remote result",
+    ["stage"],
+)
+IDEMPOTENCY_REQUESTS = Counter(
+    "bloom_idempotency_requests_total",
+    "Idempotent requests by outcome: miss, replayed, coalesced or conflict",
+    ["store", "outcome"],
+)
+RATE_LIMITED = Counter(
+    "bloom_rate_limited_total",
+    "Ingestion requests over a rate limit, by scope (server or player) and outcome (rejected or degraded)",
+    ["scope", "outcome"],
+)
+SPAM_DETECTED = Counter(
+    "bloom_spam_detected_total",
+    "Messages tagged SPAM locally before any remote call, by reason: flood or duplicate",
+    ["reason"],
+)
+SPLIT_PII_DETECTED = Counter(
+    "bloom_split_pii_detected_total",
+    "PII split across several of a player's messages, caught by the conversation window",
+    ["pii_type"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "bloom_log_records_dropped_total",
+    "Log records not written, by logger and reason: sampled or queue_full",
+    ["logger", "reason"],
+)
+MESSAGE_CACHE_LOOKUPS = Counter(
+    "bloom_message_cache_lookups_total",
+    "Message rows looked up by ID, by outcome: hit or miss",
+    ["outcome"],
+)
+USAGE_REQUESTS = Counter(
+    "bloom_usage_requests_total",
+    "Remote calls made by graph nodes, by node and outcome: ok or error",
+    ["node", "outcome"],
+)
+USAGE_TOKENS = Counter(
+    "bloom_usage_tokens_total",
+    "Gemini tokens used by graph nodes, by node and direction: input or output",
+    ["node", "direction"],
+)
+USAGE_COST = Counter(
+    "bloom_usage_cost_usd_total",
+    "Estimated spend on remote calls by graph node, in USD",
+    ["node"],
+)
+BUDGET_SKIPS = Counter(
+    "bloom_budget_skips_total",
+    "Optional stages answered locally because the spend rate was over budget",
+    ["stage"],
+)
+
+DEPENDENCY_LATENCY = Histogram(
+    "bloom_dependency_call_seconds",
+    "Latency of calls to HuggingFace, Gemini, Supabase and Roblox",
+    ["dependency", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_ERRORS = Counter(
+    "bloom_dependency_errors_total",
+    "Calls to external dependencies that raised",
+    ["dependency", "operation"],
+)
+DEPENDENCY_IN_FLIGHT = Gauge(
+    "bloom_dependency_calls_in_flight",
+    "Calls to external dependencies currently waiting on a response",
+    ["dependency"],
+    multiprocess_mode="livesum",
+)
+
+
+# ---------- Trace IDs ----------
+TRACE_HEADER = "X-Trace-ID"
+# Inbound IDs must look like ours; anything else could exceed the 128-character exemplar limit
+TRACE_ID_PATTERN = re.compile(r"[0-9a-f]{16,32}")
+
+_trace_id: ContextVar[Optional[str]] = ContextVar("bloom_trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    """Generate a fresh trace ID"""
+    return uuid.uuid4().hex
+
+
+def inbound_trace_id(value: Optional[str]) -> str:
+    """A client-supplied trace ID if it is well formed, otherwise a fresh one"""
+    if value and TRACE_ID_PATTERN.fullmatch(value):
+        return value
+    return new_trace_id()
+
+
+def set_trace_id(trace_id: Optional[str]):
+    """Bind a trace ID to the current context, returns a token for reset_trace_id"""
+    return _trace_id.set(trace_id)
+
+
+def reset_trace_id(token) -> None:
+    """Restore the trace ID bound before set_trace_id"""
+    _trace_id.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace ID of the request being handled, if any"""
+    return _trace_id.get()
+
+
+# Set by capture_fallbacks(); worker threads started with asyncio.to_thread inherit it
+_fallback_scope: ContextVar[Optional[List[str]]] = ContextVar("bloom_fallback_scope", default=None)
+
+
+def _exemplar(trace_id: Optional[str]) -> Optional[dict]:
+    return {"trace_id": trace_id} if trace_id and TRACE_ID_PATTERN.fullmatch(trace_id) else None
+
+
+def _observe(histogram: Any, seconds: float, exemplar: Optional[dict]) -> None:
+    """Observe with an exemplar, never letting a rejected exemplar fail the request"""
+    try:
+        histogram.observe(seconds, exemplar=exemplar)
+    except ValueError:
+        histogram.observe(seconds)
+
+
+# ---------- Recording Helpers ----------
+def record_fallback(stage: str) -> None:
+    """Count a fallback taken by a pipeline stage"""
+    FALLBACKS.labels(stage=stage).inc()
+    stages = _fallback_scope.get()
+    if stages is not None:
+        stages.append(stage)
+
+
+@contextmanager
+def capture_fallbacks():
+    """Collect the fallback stages recorded in this context, so callers can reject degraded results"""
+    stages: List[str] = []
+    token = _fallback_scope.set(stages)
+    try:
+        yield stages
+    finally:
+        _fallback_scope.reset(token)
+
+
+@contextmanager
+def track_dependency(dependency: str, operation: str):
+    """Time a call to an external dependency, counting errors and in-flight calls"""
+    in_flight = DEPENDENCY_IN_FLIGHT.labels(dependency=dependency)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.labels(dependency=dependency, operation=operation).inc()
+        raise
+    finally:
+        in_flight.dec()
+        _observe(
+            DEPENDENCY_LATENCY.labels(dependency=dependency, operation=operation),
+            time.perf_counter() - start, _exemplar(current_trace_id())
+        )
+
+
+def execute_query(query: Any, target: str, operation: str) -> Any:
+    """Execute a Supabase query builder while recording its latency"""
+    with track_dependency("supabase", f"{target}.{operation}"):
+        return query.execute()
+
+
+async def run_graph(
+    graph: Any,
+    start_node: Any,
+    state: Any,
+    name: str,
+    trace_id: Optional[str] = None,
+    persistence: Any = None,
+) -> Any:
+    """
+    Run a pydantic_graph graph node by node, recording per-node latency
+
+    Args:
+        graph: Graph to run
+        start_node: Node to start from
+        state: Graph state shared by all nodes
+        name: Graph label used in metrics
+        trace_id: Optional trace ID attached to latency exemplars
+        persistence: Optional state persistence snapshotting the run after every node
+
+    Returns:
+        The graph run result
+    """
+    with _graph_metrics(name, trace_id):
+        async with graph.iter(start_node, state=state, persistence=persistence) as run:
+            return await _drive(run, graph, name, trace_id)
+
+
+async def resume_graph(graph: Any, persistence: Any, name: str, trace_id: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    Continue a graph run from the next unfinished snapshot in persistence
+
+    Returns:
+        The graph run result and the restored, now final, state
+    """
+    with _graph_metrics(name, trace_id):
+        async with graph.iter_from_persistence(persistence) as run:
+            return await _drive(run, graph, name, trace_id), run.state
+
+
+@contextmanager
+def _graph_metrics(name: str, trace_id: Optional[str]):
+    in_flight = GRAPH_IN_FLIGHT.labels(graph=name)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        in_flight.dec()
+        _observe(GRAPH_LATENCY.labels(graph=name), time.perf_counter() - started, _exemplar(trace_id))
+
+
+async def _drive(run: Any, graph: Any, name: str, trace_id: Optional[str]) -> Any:
+    final_node = graph_final_node(graph)
+    exemplar = _exemplar(trace_id)
+    node = run.next_node
+    while not isinstance(node, End):
+        node_name = type(node).__name__
+        node_started = time.perf_counter()
+        try:
+            next_node = await run.next(node)
+        except Exception:
+            NODE_ERRORS.labels(graph=name, node=node_name).inc()
+            raise
+        finally:
+            _observe(NODE_LATENCY.labels(graph=name, node=node_name), time.perf_counter() - node_started, exemplar)
+        if isinstance(next_node, End) and node_name != final_node:
+            SHORT_CIRCUITS.labels(graph=name, node=node_name).inc()
+        node = next_node
+    return run.result
+
+
+def graph_final_node(graph: Any) -> str:
+    """Name of the last node declared in a graph"""
+    return list(graph.node_defs)[-1]
@@ -0,0 +1,143 @@
+"""
+Keyset pagination and column projection helpers for list endpoints
+Cursors are opaque to clients: URL-safe base64 of the last row's sort key
+"""
+
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# ---------- Messages ----------
+MESSAGE_ROW_COLUMNS = (
+    "message_id",
+    "player_id",
+    "message",
+    "sentiment_score",
+    "created_at",
+    "moderation_action",
+    "moderation_reason",
+)
+# Raw model outputs kept for re-scoring; only returned when asked for
+MESSAGE_SCORE_COLUMNS = ("sentiment_probs", "content_probs", "community_intent")
+MESSAGE_COLUMNS = MESSAGE_ROW_COLUMNS + MESSAGE_SCORE_COLUMNS
+MESSAGE_KEY_COLUMNS = ("created_at", "message_id")
+MESSAGE_FIELD_SETS = {
+    "feed": ("message_id", "player_id", "message", "sentiment_score", "created_at"),
+    "moderation": ("message_id", "player_id", "message", "created_at", "moderation_action", "moderation_reason"),
+    "scores": ("message_id", "player_id", "sentiment_score") + MESSAGE_SCORE_COLUMNS,
+    "full": MESSAGE_ROW_COLUMNS,
+    "all": MESSAGE_COLUMNS,
+}
+MESSAGES_MAX_PAGE_SIZE = 500
+
+# ---------- Players ----------
+PLAYER_COLUMNS = ("player_id", "player_name", "last_seen")
+PLAYER_KEY_COLUMNS = ("player_id",)
+PLAYER_FIELD_SETS = {
+    "list": ("player_id", "player_name"),
+    "full": PLAYER_COLUMNS,
+}
+PLAYERS_MAX_PAGE_SIZE = 1000
+
+
+def select_columns(
+    fields: Optional[str],
+    field_sets: Dict[str, Sequence[str]],
+    allowed: Sequence[str],
+    key_columns: Sequence[str],
+) -> str:
+    """
+    Resolve a `fields` query value into a select() column list
+
+    Accepts a named field set or a comma separated list of allowed columns. Key
+    columns are always included so the next cursor can be built.
+    """
+    if not fields:
+        columns = list(field_sets["full"])
+    elif fields in field_sets:
+        columns = list(field_sets[fields])
+    else:
+        columns = [column.strip() for column in fields.split(",") if column.strip()]
+        unknown = [column for column in columns if column not in allowed]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown fields: {', '.join(unknown)}. Use one of {sorted(field_sets)} or columns {list(allowed)}",
+            )
+    for column in key_columns:
+        if column not in columns:
+            columns.append(column)
+    return ",".join(columns)
+
+
+def clamp_limit(limit: int, maximum: int) -> int:
+    """Enforce the server-side page size cap"""
+    if limit < 1:
+        raise HTTPException(status_code=422, detail="limit must be positive")
+    return min(limit, maximum)
+
+
+# ---------- Cursors ----------
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """Decode a cursor into its key values, None when no cursor was given"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def quote_filter_value(value: Any) -> str:
+    """Quote a value for a PostgREST logic filter so commas, dots and parentheses are literal"""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def apply_message_keyset(query: Any, after: Optional[Sequence[Any]], oldest_first: bool = False) -> Any:
+    """Order by (created_at, message_id), newest first by default, and continue after the decoded cursor row"""
+    query = query.order("created_at", desc=not oldest_first).order("message_id", desc=not oldest_first)
+    if after:
+        created_at, message_id = after
+        ts, mid = quote_filter_value(created_at), quote_filter_value(message_id)
+        op = "gt" if oldest_first else "lt"
+        query = query.or_(f"created_at.{op}.{ts},and(created_at.eq.{ts},message_id.{op}.{mid})")
+    return query
+
+
+def apply_player_keyset(query: Any, after: Optional[Sequence[Any]]) -> Any:
+    """Order by player_id and continue after the decoded cursor row"""
+    query = query.order("player_id")
+    if after:
+        (player_id,) = after
+        query = query.gt("player_id", player_id)
+    return query
+
+
+def split_page(
+    rows: List[Dict[str, Any]], limit: int, key_columns: Sequence[str]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Trim a limit + 1 result to one page
+
+    Returns:
+        The page rows and the cursor for the next page, or None on the last page
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor([page[-1][column] for column in key_columns])
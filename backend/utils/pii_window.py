@@ -0,0 +1,160 @@
+"""
+Cross-message PII detection over a per-player conversation window
+Keeps the normalized tail of each player's recent messages, so a phone number, email
+or street address split across several chat lines is caught locally, without sending
+the history to the PII model
+
+Only the tail a split can still continue from is kept (WINDOW_CHARS characters from the
+last WINDOW_MESSAGES messages within WINDOW_SECONDS), so each check scans about one
+message's worth of text and a player's tail never outgrows WINDOW_CHARS. Tails live in
+a PlayerStates map (utils/player_state.py) capped at PII_WINDOW_MAX_PLAYERS.
+"""
+
+import re
+import time
+from array import array
+from typing import Optional, Tuple
+
+from utils.metrics import SPLIT_PII_DETECTED
+from utils.player_state import PlayerState, PlayerStates
+
+
+# ---------- Configuration ----------
+PII_WINDOW_MAX_PLAYERS = 100_000
+WINDOW_MESSAGES = 6     # recent messages a split can span
+WINDOW_SECONDS = 120.0  # older messages drop out of the window
+WINDOW_CHARS = 96       # normalized characters kept per player
+SEPARATOR = "\n"        # between messages in the window
+
+_NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+_NUMBER_WORD = re.compile(r"\b(" + "|".join(_NUMBER_WORDS) + r")\b")
+_SPACES = re.compile(r"[^\S\n]+")
+_SINGLE_DIGITS = re.compile(r"\b(\d) (?=\d\b)")  # "5 5 5" -> "555", leaving "10 20" alone
+
+# Digit groups of 3+ (so chat like "10 20 30" isn't a phone number) totalling 10-15 digits
+_PHONE = re.compile(r"(?<!\d)\+?(?:\d{3,}[\s\-.()/]*){2,}(?!\d)")
+_EMAIL = re.compile(
+    r"[a-z0-9._%+-]+\s*(?:@|\bat\b)\s*[a-z0-9-]+\s*(?:\.|\bdot\b)\s*(?:com|net|org|edu|gov|io|co|uk|me)\b"
+)
+# A house number, one to three name words and a suffix. Suffixes that are everyday words
+# or abbreviations (way, place, st, dr, ct, pl) and names made of function words are left
+# out, so "I got 5 kills" then "no way" isn't an address
+_STREET_NAME_WORD = r"(?!(?:a|an|and|at|for|in|is|it|my|no|of|on|or|so|the|that|this|to|we|you|your)\b)[a-z]+"
+_STREET = re.compile(
+    r"\b\d{1,5}\s+(?:" + _STREET_NAME_WORD + r"\s+){1,3}"
+    r"(?:street|avenue|ave|road|rd|lane|ln|drive|boulevard|blvd|court)\b"
+)
+# Named after the PIIType each pattern reports
+PATTERNS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("TELEPHONENUM", _PHONE),
+    ("EMAIL", _EMAIL),
+    ("STREET", _STREET),
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercase, spell out number words as digits and collapse spaces"""
+    text = _NUMBER_WORD.sub(lambda match: _NUMBER_WORDS[match.group(1)], text.lower())
+    return _SINGLE_DIGITS.sub(r"\1", _SPACES.sub(" ", text).strip())
+
+
+def _phone_digits(match: str) -> bool:
+    return 10 <= sum(char.isdigit() for char in match) <= 15
+
+
+def scan(window: str, boundary: int) -> Optional[str]:
+    """
+    First PII pattern in window that starts before boundary and ends after it, i.e. one
+    completed by the newest message and begun in an earlier one
+    """
+    for pii_type, pattern in PATTERNS:
+        for match in pattern.finditer(window, max(0, boundary - WINDOW_CHARS)):
+            if match.start() >= boundary:
+                break
+            if match.end() <= boundary:
+                continue
+            if pii_type == "TELEPHONENUM" and not _phone_digits(match.group()):
+                continue
+            return pii_type
+    return None
+
+
+class _PlayerTail(PlayerState):
+    """
+    Normalized tail of one player's recent messages, and a ring of (arrival ms, length)
+    for each message still in it, oldest first
+    """
+    __slots__ = ("text", "parts")
+
+    def __init__(self):
+        super().__init__()
+        self.text = ""
+        self.parts = array("q")
+
+    def _trim(self, excess: int) -> None:
+        """Drop excess characters from the front, removing messages that fall out entirely"""
+        while excess > 0:
+            if self.parts[1] <= excess:
+                excess -= self.parts[1]
+                self.text = self.text[self.parts[1]:]
+                del self.parts[:2]
+            else:
+                self.parts[1] -= excess
+                self.text = self.text[excess:]
+                excess = 0
+        if self.text.startswith(SEPARATOR):
+            self.parts[1] -= len(SEPARATOR)
+            self.text = self.text[len(SEPARATOR):]
+
+    def check(self, normalized: str, now_ms: int) -> Optional[str]:
+        expired = 0
+        while expired < len(self.parts) and now_ms - self.parts[expired] > WINDOW_SECONDS * 1000:
+            expired += 2
+        if expired:
+            self._trim(sum(self.parts[1:expired:2]))
+
+        boundary = len(self.text)
+        piece = (SEPARATOR if self.text else "") + normalized[-WINDOW_CHARS:]
+        self.text += piece
+        verdict = scan(self.text, boundary + len(SEPARATOR)) if boundary else None
+
+        self.parts.extend((now_ms, len(piece)))
+        excess = len(self.text) - WINDOW_CHARS
+        if len(self.parts) > 2 * WINDOW_MESSAGES:
+            excess = max(excess, self.parts[1])
+        self._trim(excess)
+        if verdict:
+            SPLIT_PII_DETECTED.labels(pii_type=verdict).inc()
+        return verdict
+
+
+class PIIWindow:
+    """Split-PII verdicts from the tail of each player's conversation"""
+
+    def __init__(self, max_players: int = PII_WINDOW_MAX_PLAYERS):
+        self._tails: PlayerStates[_PlayerTail] = PlayerStates(_PlayerTail, max_players)
+
+    def __len__(self) -> int:
+        return len(self._tails)
+
+    def check(self, player_id: Optional[int], message_id: Optional[str], text: str) -> Optional[str]:
+        """
+        Add a message to its player's window and say whether it completes PII begun in
+        an earlier message
+
+        Normalizing happens before taking the lock. /moderate after /analyze, or a resumed
+        moderation run, re-checks a message_id already in the tail; it isn't appended twice.
+
+        Returns:
+            The PIIType value of PII split across messages, otherwise None
+        """
+        if player_id is None:
+            return None
+        return self._tails.check(player_id, message_id, normalize(text), int(time.monotonic() * 1000))
+
+
+# Shared by the moderation graph
+pii_window = PIIWindow()
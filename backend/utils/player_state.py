@@ -0,0 +1,69 @@
+"""
+Bounded per-player state for the local ingestion checks
+The spam detector (utils/spam.py) and the split-PII window (utils/pii_window.py) each keep
+a little state per player. This module holds it in LRU order behind one lock and answers
+a repeated message_id from the stored verdict, so each check only implements its logic
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+
+class PlayerState:
+    """
+    One player's state in a PlayerStates map; subclasses add their own __slots__ and check()
+
+    check() records a message and returns its verdict, or None when nothing was found.
+    """
+    __slots__ = ("last_message", "last_verdict")
+
+    def __init__(self):
+        self.last_message: Optional[int] = None  # hash of the last message_id
+        self.last_verdict: Optional[str] = None
+
+    def check(self, *args: Any) -> Optional[str]:
+        raise NotImplementedError
+
+
+S = TypeVar("S", bound=PlayerState)
+
+
+class PlayerStates(Generic[S]):
+    """
+    PlayerState per player, evicting the least recently active beyond max_players
+
+    Thread-safe: the ingestion routes are sync and call in from the threadpool.
+    """
+
+    def __init__(self, factory: Callable[[], S], max_players: int):
+        self.max_players = max_players
+        self._factory = factory
+        self._players: "OrderedDict[int, S]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def check(self, player_id: int, message_id: Optional[str], *args: Any) -> Optional[str]:
+        """
+        Pass a message to its player's state.check(*args)
+
+        A message_id equal to the player's previous one returns the previous verdict and
+        leaves the state alone, since one message is checked by several endpoints and
+        again by resumed runs.
+        """
+        message = hash(message_id) if message_id is not None else None
+        with self._lock:
+            state = self._players.get(player_id)
+            if state is None:
+                state = self._players[player_id] = self._factory()
+                if len(self._players) > self.max_players:
+                    self._players.popitem(last=False)
+            else:
+                self._players.move_to_end(player_id)
+                if message is not None and message == state.last_message:
+                    return state.last_verdict
+            verdict = state.check(*args)
+            state.last_message, state.last_verdict = message, verdict
+        return verdict
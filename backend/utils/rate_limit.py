@@ -0,0 +1,144 @@
+"""
+Token-bucket rate limiting for the ingestion endpoints
+Buckets per game server (API key plus its X-Game-Server-Id, or client address when auth
+is off) and per player, so one misbehaving server or spamming player can't use up the
+HuggingFace and Gemini quota or the threadpool
+
+Buckets live in each worker process, so with N workers a key can get up to N times the
+configured rate, depending on how requests are spread.
+
+Buckets use GCRA: each key stores a single float, the time its bucket will be full
+again, and keys whose bucket has refilled are dropped. Memory therefore tracks only
+recently active players, at roughly 100 bytes each.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+from fastapi import HTTPException, Request
+
+from utils.metrics import RATE_LIMITED
+
+
+# ---------- Configuration ----------
+# Requests per second and burst size; a rate of 0 disables that limit
+SERVER_RATE = float(os.getenv("BLOOM_RATE_LIMIT_SERVER_RATE", "50"))
+SERVER_BURST = int(os.getenv("BLOOM_RATE_LIMIT_SERVER_BURST", "200"))
+PLAYER_RATE = float(os.getenv("BLOOM_RATE_LIMIT_PLAYER_RATE", "0.5"))
+PLAYER_BURST = int(os.getenv("BLOOM_RATE_LIMIT_PLAYER_BURST", "5"))
+# Over-limit traffic is either rejected with 429 or analysed locally without paid calls
+SERVER_LIMIT_MODE = os.getenv("BLOOM_RATE_LIMIT_SERVER_MODE", "degrade")
+PLAYER_LIMIT_MODE = os.getenv("BLOOM_RATE_LIMIT_PLAYER_MODE", "degrade")
+MIN_PRUNE_SIZE = 10_000
+ANALYSIS_MODE_HEADER = "X-Analysis-Mode"  # "local-only" on degraded responses
+# Sent by game servers sharing an API key (e.g. game.JobId) so each gets its own bucket
+SERVER_ID_HEADER = "X-Game-Server-Id"
+MAX_SERVER_ID_LENGTH = 64
+
+
+class RateLimiter:
+    """Thread-safe token buckets keyed by any hashable"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._interval = 1 / rate if rate > 0 else 0.0
+        self._tolerance = self._interval * (self.burst - 1)
+        self._full_at: Dict[Hashable, float] = {}
+        self._next_prune = MIN_PRUNE_SIZE
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+    def acquire(self, key: Hashable, now: Optional[float] = None) -> float:
+        """
+        Take one token from key's bucket
+
+        Returns:
+            0 when allowed, otherwise the seconds until a token is available
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now)
+            wait = full_at - self._tolerance - now
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at + self._interval
+            if len(self._full_at) >= self._next_prune:
+                self._prune(now)
+            return 0.0
+
+    def _prune(self, now: float) -> None:
+        # A refilled bucket is indistinguishable from a missing one
+        self._full_at = {key: full_at for key, full_at in self._full_at.items() if full_at > now}
+        self._next_prune = max(2 * len(self._full_at), MIN_PRUNE_SIZE)
+
+
+server_limiter = RateLimiter(SERVER_RATE, SERVER_BURST)
+player_limiter = RateLimiter(PLAYER_RATE, PLAYER_BURST)
+
+
+def client_key(request: Request) -> str:
+    """Identify the game server by its API key, falling back to its address"""
+    # Imported here: utils.dependencies loads the agents, which log through utils.logs,
+    # which uses this module's RateLimiter
+    from utils.dependencies import ROBLOX_API_KEYS
+
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in ROBLOX_API_KEYS:
+        return api_key
+    # Unverified keys are ignored, or rotating them would dodge the limit. Behind a proxy
+    # the address is the proxy's unless it is listed in FORWARDED_ALLOW_IPS.
+    return request.client.host if request.client else "unknown"
+
+
+def server_key(request: Request) -> str:
+    """Bucket of the game server: its client_key, split by X-Game-Server-Id under a valid key"""
+    key = client_key(request)
+    server_id = request.headers.get(SERVER_ID_HEADER)
+    if server_id and key == request.headers.get('X-API-Key'):
+        # Only holders of a valid key can choose their bucket this way
+        return f"{key}:{server_id[:MAX_SERVER_ID_LENGTH]}"
+    return key
+
+
+def _over_limit(scope: str, mode: str, wait: float) -> bool:
+    if mode == "degrade":
+        RATE_LIMITED.labels(scope=scope, outcome="degraded").inc()
+        return True
+    RATE_LIMITED.labels(scope=scope, outcome="rejected").inc()
+    raise HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded for {scope}",
+        headers={"Retry-After": str(math.ceil(wait))},
+    )
+
+
+def admit(request: Request, player_id: Optional[int]) -> bool:
+    """
+    Apply the server and player limits to an ingestion request
+
+    Args:
+        request: Incoming request, identifying the game server
+        player_id: Sending player, if known
+
+    Returns:
+        True when the message should be analysed locally only (degraded)
+
+    Raises:
+        HTTPException: 429 with Retry-After when a limit in reject mode is exceeded
+    """
+    wait = server_limiter.acquire(server_key(request))
+    if wait:
+        return _over_limit("server", SERVER_LIMIT_MODE, wait)
+    if player_id is not None:
+        wait = player_limiter.acquire(player_id)
+        if wait:
+            return _over_limit("player", PLAYER_LIMIT_MODE, wait)
+    return False
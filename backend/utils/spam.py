@@ -0,0 +1,126 @@
+"""
+Local near-duplicate and flood spam detection at ingestion
+Keeps a small ring buffer of SimHash fingerprints and arrival times per player, so a
+spam line is tagged SPAM in constant time before any HuggingFace or Gemini call
+
+A player's ring is one array of RING_SIZE fingerprints and RING_SIZE arrival times,
+so flood and duplicate checks are a fixed scan of 8 slots with no allocation. Rings live
+in a PlayerStates map (utils/player_state.py) capped at SPAM_MAX_PLAYERS.
+"""
+
+import re
+import time
+from array import array
+from typing import Optional
+
+from utils.metrics import SPAM_DETECTED
+from utils.player_state import PlayerState, PlayerStates
+
+
+# ---------- Configuration ----------
+SPAM_MAX_PLAYERS = 100_000
+RING_SIZE = 8                 # recent messages remembered per player
+SHINGLE_SIZE = 4              # characters per shingle
+# Flood: FLOOD_MAX_MESSAGES within FLOOD_WINDOW seconds, whatever they say
+FLOOD_MAX_MESSAGES = 6
+FLOOD_WINDOW = 10.0
+# Near-duplicate: DUPLICATE_MAX_REPEATS earlier messages within DUPLICATE_WINDOW seconds
+# whose fingerprints differ in at most DUPLICATE_MAX_DISTANCE of 64 bits
+DUPLICATE_MAX_REPEATS = 2
+DUPLICATE_WINDOW = 60.0
+DUPLICATE_MAX_DISTANCE = 8  # unrelated texts differ in ~32 bits
+# Short reactions ("gg", "lol") repeat naturally, so they only count towards floods
+MIN_DUPLICATE_LENGTH = 8
+
+_NORMALIZE = re.compile(r"(\W)\1+|\s+")
+MASK_64 = (1 << 64) - 1
+NEVER = -(1 << 62)  # arrival time of empty ring slots
+
+
+def _signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def normalize(text: str) -> str:
+    """Lowercase and collapse whitespace and runs of punctuation, so padding doesn't evade matching"""
+    return _NORMALIZE.sub(lambda match: match.group(1) or " ", text.lower()).strip()
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over character shingles of normalized text"""
+    import numpy as np  # deferred so importing the app doesn't load numpy
+
+    shingles = [text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)] or [text]
+    # str hashes are salted per process, which is fine for fingerprints that never leave it
+    hashes = np.fromiter(map(hash, shingles), dtype=np.int64, count=len(shingles))
+    bits = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, 64)
+    majority = bits.sum(axis=0, dtype=np.int32) * 2 > len(shingles)
+    return int(np.packbits(majority, bitorder="little").view(np.uint64)[0])
+
+
+class _PlayerWindow(PlayerState):
+    """
+    Ring buffers for one player's recent messages in a single array:
+    RING_SIZE fingerprints (as signed 64-bit) followed by RING_SIZE arrival times in ms
+    """
+    __slots__ = ("ring", "pos")
+
+    def __init__(self):
+        super().__init__()
+        self.ring = array("q", [0] * RING_SIZE + [NEVER] * RING_SIZE)
+        self.pos = 0
+
+    def check(self, fingerprint: Optional[int], now_ms: int) -> Optional[str]:
+        ring = self.ring
+        verdict = None
+        # Flood when the FLOOD_MAX_MESSAGES-th latest message arrived within the window
+        if now_ms - ring[RING_SIZE + (self.pos - FLOOD_MAX_MESSAGES) % RING_SIZE] < FLOOD_WINDOW * 1000:
+            verdict = "flood"
+        elif fingerprint is not None:
+            repeats = 0
+            for i in range(RING_SIZE):
+                if (
+                    now_ms - ring[RING_SIZE + i] < DUPLICATE_WINDOW * 1000
+                    and ((ring[i] ^ fingerprint) & MASK_64).bit_count() <= DUPLICATE_MAX_DISTANCE
+                ):
+                    repeats += 1
+            if repeats >= DUPLICATE_MAX_REPEATS:
+                verdict = "duplicate"
+
+        # Short messages get fingerprint 0, which only counts towards floods
+        ring[self.pos] = _signed(fingerprint) if fingerprint is not None else 0
+        ring[RING_SIZE + self.pos] = now_ms
+        self.pos = (self.pos + 1) % RING_SIZE
+        if verdict:
+            SPAM_DETECTED.labels(reason=verdict).inc()
+        return verdict
+
+
+class SpamDetector:
+    """Flood and near-duplicate verdicts from each player's ring of recent fingerprints"""
+
+    def __init__(self, max_players: int = SPAM_MAX_PLAYERS):
+        self._windows: PlayerStates[_PlayerWindow] = PlayerStates(_PlayerWindow, max_players)
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def check(self, player_id: Optional[int], message_id: Optional[str], text: str) -> Optional[str]:
+        """
+        Record a message and say whether it is spam
+
+        The fingerprint is computed before taking the lock. A message sent to /moderate
+        and then /sentiment under one message_id takes a single ring slot.
+
+        Returns:
+            "flood" or "duplicate" for spam, otherwise None
+        """
+        if player_id is None:
+            return None
+        normalized = normalize(text)
+        fingerprint = simhash(normalized) if len(normalized) >= MIN_DUPLICATE_LENGTH else None
+        return self._windows.check(player_id, message_id, fingerprint, int(time.monotonic() * 1000))
+
+
+# Shared by the ingestion routes
+spam_detector = SpamDetector()
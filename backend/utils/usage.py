@@ -0,0 +1,243 @@
+"""
+Usage and cost accounting for HuggingFace and Gemini calls
+Every remote call made by a graph node is recorded against the node, the ingestion
+endpoint and the game server's API key: requests, tokens for Gemini, bytes for
+HuggingFace and an estimated cost. The budget governor watches the spend rate and
+switches optional Gemini stages to their local fallbacks when it runs too high.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from utils.metrics import BUDGET_SKIPS, USAGE_COST, USAGE_REQUESTS, USAGE_TOKENS
+
+
+# ---------- Configuration ----------
+# List prices used for the estimate; gemini-2.0-flash per million tokens
+GEMINI_USD_PER_MTOK_INPUT = float(os.getenv("BLOOM_GEMINI_USD_PER_MTOK_INPUT", "0.10"))
+GEMINI_USD_PER_MTOK_OUTPUT = float(os.getenv("BLOOM_GEMINI_USD_PER_MTOK_OUTPUT", "0.40"))
+HF_USD_PER_CALL = float(os.getenv("BLOOM_HF_USD_PER_CALL", "0"))  # serverless hf-inference; set for dedicated endpoints
+# Spend budget in USD per hour; 0 disables the governor
+BUDGET_USD_PER_HOUR = float(os.getenv("BLOOM_BUDGET_USD_PER_HOUR", "0"))
+BUDGET_WINDOW = float(os.getenv("BLOOM_BUDGET_WINDOW", "300"))  # seconds of spend the rate is measured over
+# Optional stages, cheapest to lose first, and the share of the budget at which each
+# switches to its local fallback
+BUDGET_STAGES: Dict[str, float] = {
+    "community_intent": float(os.getenv("BLOOM_BUDGET_SKIP_INTENT_AT", "0.8")),
+    "pii_intent": float(os.getenv("BLOOM_BUDGET_SKIP_PII_INTENT_AT", "1.0")),
+}
+
+GROUP_BY = ("node", "endpoint", "api_key")
+BACKGROUND = "background"  # endpoint and key of calls made outside a request (resume, backfill)
+
+
+@dataclass
+class Usage:
+    requests: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    cost_usd: float = 0.0
+
+    def add(self, other: "Usage") -> None:
+        for name in USAGE_FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+USAGE_FIELDS = tuple(field.name for field in fields(Usage))
+
+
+# ---------- Attribution ----------
+_scope: ContextVar[Tuple[str, str]] = ContextVar("bloom_usage_scope", default=(BACKGROUND, BACKGROUND))
+
+
+def api_key_label(api_key: Optional[str]) -> str:
+    """Short, non-reversible label for a verified API key"""
+    if not api_key:
+        return "anonymous"
+    return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+def bind_usage(endpoint: str, api_key: Optional[str]) -> None:
+    """
+    Attribute the remote calls made for the rest of this request to an endpoint and to a
+    verified API key (None when auth is off or the key is unknown)
+
+    Route handlers run in a copy of the request's context, so the binding ends with them;
+    worker threads started from the handler inherit it.
+    """
+    _scope.set((endpoint, api_key_label(api_key)))
+
+
+def record_message() -> None:
+    """
+    Count a message whose pipelines run under the current binding, for per-message cost
+
+    Called where the pipelines start rather than in bind_usage, so rejected requests and
+    idempotent replays don't dilute the average.
+    """
+    usage_ledger.count_message(_scope.get())
+
+
+# ---------- Ledger ----------
+class UsageLedger:
+    """Usage totals per (node, endpoint, api_key) since the process started, plus recent spend"""
+
+    def __init__(self, window: float = BUDGET_WINDOW):
+        self.window = window
+        self.started_at = time.time()
+        self._usage: Dict[Tuple[str, str, str], Usage] = {}
+        self._messages: Dict[Tuple[str, str], int] = {}
+        # (second, USD) buckets covering the window, and their sum
+        self._spend: Deque[List[float]] = deque()
+        self._recent_cost = 0.0
+        self._lock = threading.Lock()
+
+    def count_message(self, scope: Tuple[str, str]) -> None:
+        with self._lock:
+            self._messages[scope] = self._messages.get(scope, 0) + 1
+
+    def record(self, node: str, usage: Usage) -> None:
+        endpoint, api_key = _scope.get()
+        now = time.monotonic()
+        with self._lock:
+            self._usage.setdefault((node, endpoint, api_key), Usage()).add(usage)
+            if usage.cost_usd:
+                second = int(now)
+                if self._spend and self._spend[-1][0] == second:
+                    self._spend[-1][1] += usage.cost_usd
+                else:
+                    self._spend.append([second, usage.cost_usd])
+                self._recent_cost += usage.cost_usd
+            self._expire(now)
+
+        USAGE_REQUESTS.labels(node=node, outcome="error" if usage.errors else "ok").inc(usage.requests)
+        if usage.input_tokens or usage.output_tokens:
+            USAGE_TOKENS.labels(node=node, direction="input").inc(usage.input_tokens)
+            USAGE_TOKENS.labels(node=node, direction="output").inc(usage.output_tokens)
+        if usage.cost_usd:
+            USAGE_COST.labels(node=node).inc(usage.cost_usd)
+
+    def _expire(self, now: float) -> None:
+        while self._spend and self._spend[0][0] <= now - self.window:
+            self._recent_cost -= self._spend.popleft()[1]
+        if not self._spend:
+            self._recent_cost = 0.0  # drop accumulated float error
+
+    def spend_rate(self) -> float:
+        """Estimated USD per hour over the last window"""
+        with self._lock:
+            self._expire(time.monotonic())
+            recent = self._recent_cost
+        return recent / self.window * 3600
+
+    def report(self, group_by: str = "node") -> Dict[str, Any]:
+        """Totals grouped by node, endpoint or api_key, with per-message cost where known"""
+        index = GROUP_BY.index(group_by)
+        with self._lock:
+            usage = [(key, Usage(**asdict(value))) for key, value in self._usage.items()]
+            messages = dict(self._messages)
+
+        groups: Dict[str, Usage] = {}
+        total = Usage()
+        for key, value in usage:
+            groups.setdefault(key[index], Usage()).add(value)
+            total.add(value)
+
+        counts: Dict[str, int] = {}
+        if group_by != "node":
+            for scope, count in messages.items():
+                name = scope[index - 1]
+                counts[name] = counts.get(name, 0) + count
+
+        rows = []
+        for name, value in sorted(groups.items(), key=lambda item: item[1].cost_usd, reverse=True):
+            row = {group_by: name, **asdict(value)}
+            if group_by != "node":
+                row["messages"] = counts.get(name, 0)
+                row["cost_usd_per_message"] = value.cost_usd / counts[name] if counts.get(name) else None
+            rows.append(row)
+
+        message_total = sum(messages.values())
+        return {
+            "since": self.started_at,
+            "group_by": group_by,
+            "messages": message_total,
+            "total": asdict(total),
+            "cost_usd_per_message": total.cost_usd / message_total if message_total else None,
+            "rows": rows,
+        }
+
+
+# ---------- Recording Helpers ----------
+def record_gemini_usage(node: str, result: Any = None) -> None:
+    """Record a Gemini agent run; pass no result for a call that failed"""
+    if result is None:
+        usage_ledger.record(node, Usage(requests=1, errors=1))
+        return
+    run_usage = result.usage()
+    input_tokens, output_tokens = run_usage.input_tokens or 0, run_usage.output_tokens or 0
+    usage_ledger.record(node, Usage(
+        requests=run_usage.requests or 1,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cost_usd=(input_tokens * GEMINI_USD_PER_MTOK_INPUT + output_tokens * GEMINI_USD_PER_MTOK_OUTPUT) / 1e6,
+    ))
+
+
+def record_hf_usage(node: str, response: Any = None) -> None:
+    """Record a HuggingFace inference request; pass no response for a call that failed"""
+    if response is None:
+        usage_ledger.record(node, Usage(requests=1, errors=1, cost_usd=HF_USD_PER_CALL))
+        return
+    body = response.request.body if response.request is not None else None
+    usage_ledger.record(node, Usage(
+        requests=1,
+        request_bytes=len(body) if body else 0,
+        response_bytes=len(response.content),
+        cost_usd=HF_USD_PER_CALL,
+    ))
+
+
+# ---------- Budget Governor ----------
+class BudgetGovernor:
+    """Turns optional Gemini stages off as the spend rate approaches the budget"""
+
+    def __init__(self, ledger: "UsageLedger", budget: float = BUDGET_USD_PER_HOUR, stages: Optional[Dict[str, float]] = None):
+        self.ledger = ledger
+        self.budget = budget
+        self.stages = stages if stages is not None else BUDGET_STAGES
+
+    def allows(self, stage: str) -> bool:
+        """Whether an optional stage may make its remote call; counts the skip when not"""
+        threshold = self.stages.get(stage)
+        if not self.budget or threshold is None:
+            return True
+        if self.ledger.spend_rate() < threshold * self.budget:
+            return True
+        BUDGET_SKIPS.labels(stage=stage).inc()
+        return False
+
+    def status(self) -> Dict[str, Any]:
+        rate = self.ledger.spend_rate()
+        return {
+            "budget_usd_per_hour": self.budget or None,
+            "spend_usd_per_hour": round(rate, 6),
+            "skipped_stages": [
+                stage for stage, threshold in self.stages.items()
+                if self.budget and rate >= threshold * self.budget
+            ],
+        }
+
+
+# Shared by the graph nodes, the ingestion routes and /api/usage
+usage_ledger = UsageLedger()
+budget_governor = BudgetGovernor(usage_ledger)
@@ -0,0 +1,56 @@
+"""
+Optional warm-up of lazily constructed clients and agents
+Enabled with BLOOM_WARMUP=1 for long-lived servers; serverless deployments leave it off
+"""
+
+import importlib
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("BLOOM_WARMUP", "0").lower() in ("1", "true", "yes")
+# Packages the lazily built clients, agents and spam filter import
+PRELOAD_MODULES = (
+    "numpy",
+    "requests",
+    "supabase",
+    "pydantic_ai",
+    "pydantic_ai.models.google",
+    "pydantic_ai.providers.google",
+)
+
+
+def warm_up() -> float:
+    """Build the Supabase client and the Gemini agents ahead of the first request"""
+    from agents.moderation.nodes import get_mod_agent, get_pii_agent
+    from agents.sentiment.nodes import get_community_intent_agent
+    from utils.db import get_supabase
+
+    started = time.perf_counter()
+    for factory in (get_supabase, get_pii_agent, get_mod_agent, get_community_intent_agent):
+        try:
+            factory()
+        except Exception as e:
+            logger.error(f"Warm-up of {factory.__name__} failed: {e}")
+    elapsed = time.perf_counter() - started
+    logger.info(f"Warm-up finished in {elapsed * 1000:.0f} ms")
+    return elapsed
+
+
+def preload_modules() -> float:
+    """
+    Import the packages behind the lazy clients and agents without building them
+
+    A pre-forking server calls this in its master, so workers share the imported code
+    instead of each importing it on first use. Clients hold sockets and event-loop state,
+    so they are still built in each worker.
+    """
+    started = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.error(f"Preloading {name} failed: {e}")
+    return time.perf_counter() - started
@@ -100,13 +100,21 @@ class SentimentAnalysisClient {
     }
 
     /**
-     * Fetch all players
+     * Fetch all players, following the X-Next-Cursor header across pages
      * @returns Array of players
      */
     async getPlayers(): Promise<Player[]> {
         try {
-            const response = await this.client.get<Player[]>('/players');
-            return response.data;
+            const players: Player[] = [];
+            let cursor: string | undefined;
+            do {
+                const response = await this.client.get<Player[]>('/players', {
+                    params: cursor ? { cursor } : undefined
+                });
+                players.push(...response.data);
+                cursor = response.headers['x-next-cursor'] || undefined;
+            } while (cursor);
+            return players;
         } catch (error) {
             console.error('Fetch Players Error:', error);
             throw error;